@@ -0,0 +1,388 @@
+import datetime
+import hashlib
+import io
+import json
+import struct
+import zlib
+import numpy as np
+from monty.json import MontyEncoder
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Compact binary encoding of the large dicts (DOS, band structures) that are
+kept in GridFS.
+
+A blob is laid out as
+
+    MAGIC VERSION | array chunks ... | JSON index | index length | MAGIC
+
+Every numeric (nested) list of the original dict is stored as a numpy array,
+split into chunks of whole rows that are zlib-compressed separately. The
+JSON index holds the rest of the dict, with each array replaced by
+{"@blob": name}, and the dtype, shape and chunk offsets of every array. The
+name of an array is its path in the dict, e.g. "densities/1" (DOS, spin up)
+or "bands/-1" (band structure, spin down).
+
+Since the index is at the end, a blob can be written in one pass (see
+BlobWriter), and a reader only needs the index plus the chunks of the rows
+it asks for. Blobs written before this format (plain MontyEncoder JSON) are
+still read by open_blob(), through the same interface.
+
+Blobs are content-addressed: the sha256 of the bytes is kept in the GridFS
+file metadata ("content_hash"), and putting a blob that is already there
+returns the id of the existing file instead of writing a new one. Such a
+reuse stamps the file with "last_used", so that gc_blobs.py does not remove
+a blob that was orphaned before but is about to be referenced again.
+'''
+
+MAGIC = b'MPBLOB'
+VERSION = 1
+FORMAT_NAME = 'mpblob'
+
+_HEADER = MAGIC + struct.pack('<H', VERSION)
+_TRAILER_LEN = 8 + len(MAGIC)
+
+# numeric lists shorter than this stay in the JSON index
+MIN_ARRAY_SIZE = 32
+# uncompressed size of a chunk; a reader decompresses whole chunks
+CHUNK_BYTES = 1 << 18
+
+
+class BlobWriter(object):
+    """
+    Writes a blob into a file-like object (e.g. a GridFS GridIn), one array
+    at a time. Call close() with the (array-less) remainder of the dict to
+    write the index.
+    """
+
+    def __init__(self, f, compresslevel=6):
+        self.f = f
+        self.compresslevel = compresslevel
+        self.arrays = {}
+        self.offset = 0
+        self.sha256 = hashlib.sha256()
+        self._write(_HEADER)
+
+    def _write(self, data):
+        self.f.write(data)
+        self.sha256.update(data)
+        self.offset += len(data)
+
+    @property
+    def content_hash(self):
+        return self.sha256.hexdigest()
+
+    def add_array(self, name, a):
+        """
+        :param name: the name (path) of the array
+        :param a: a numpy array (or anything np.asarray takes)
+        :return: the reference to put in its place in the dict
+        """
+        if name in self.arrays:
+            raise ValueError("Duplicate array {} in blob".format(name))
+        a = np.asarray(a)
+        if a.dtype.kind not in 'iuf':
+            raise ValueError("Cannot store {} array {}".format(a.dtype, name))
+        a = np.ascontiguousarray(a, dtype=a.dtype.newbyteorder('<'))
+        if a.ndim == 0:
+            a = a.reshape(1)
+        row_bytes = max(1, a[:1].nbytes)
+        rows_per_chunk = max(1, CHUNK_BYTES // row_bytes)
+        chunks = []
+        for start in range(0, max(1, len(a)), rows_per_chunk):
+            data = zlib.compress(a[start:start + rows_per_chunk].tobytes(),
+                                 self.compresslevel)
+            chunks.append([self.offset, len(data)])
+            self._write(data)
+        self.arrays[name] = {'dtype': a.dtype.str, 'shape': list(a.shape),
+                             'rows_per_chunk': rows_per_chunk,
+                             'chunks': chunks}
+        return {'@blob': name}
+
+    def add(self, obj, prefix=''):
+        """
+        Store every numeric list of obj (a dict as from as_dict()) as an
+        array.
+
+        :return: obj with the arrays replaced by references
+        """
+        if isinstance(obj, dict):
+            # sorted, so that equal dicts give identical bytes (and hashes)
+            return {k: self.add(obj[k], _join(prefix, k))
+                    for k in sorted(obj, key=str)}
+        if isinstance(obj, (list, tuple)):
+            a = _numeric_array(obj)
+            if a is not None:
+                return self.add_array(prefix, a)
+            return [self.add(v, _join(prefix, i)) for i, v in enumerate(obj)]
+        if isinstance(obj, np.ndarray):
+            return self.add(obj.tolist(), prefix)
+        return obj
+
+    def close(self, doc, kind=None):
+        """
+        Write the index. doc is the dict with its arrays already replaced by
+        references (see add()); it must be JSON serializable.
+        """
+        index = {'version': VERSION, 'kind': kind, 'arrays': self.arrays,
+                 'doc': doc}
+        data = json.dumps(index, cls=MontyEncoder,
+                          sort_keys=True).encode('utf-8')
+        self._write(data)
+        self._write(struct.pack('<Q', len(data)) + MAGIC)
+
+
+class BlobReader(object):
+    """
+    Lazy reader of a blob in a seekable file-like object (e.g. a GridFS
+    GridOut). Only the index is read up front.
+    """
+
+    def __init__(self, f):
+        self.f = f
+        f.seek(-_TRAILER_LEN, 2)
+        trailer = f.read(_TRAILER_LEN)
+        if trailer[8:] != MAGIC:
+            raise ValueError("Truncated or corrupt blob")
+        index_len = struct.unpack('<Q', trailer[:8])[0]
+        f.seek(-_TRAILER_LEN - index_len, 2)
+        index = json.loads(f.read(index_len).decode('utf-8'))
+        if index['version'] > VERSION:
+            raise ValueError("Blob version {} is newer than this reader ({})"
+                             .format(index['version'], VERSION))
+        self.kind = index['kind']
+        self.doc = index['doc']
+        self.arrays = index['arrays']
+
+    def names(self):
+        return sorted(self.arrays)
+
+    def get_array(self, name, rows=None):
+        """
+        :param name: the path of the array, e.g. "bands/1"
+        :param rows: a slice (or (start, stop) tuple) of the first axis; only
+            the chunks holding these rows are read and decompressed
+        :return: numpy array
+        """
+        info = self.arrays[name]
+        shape = info['shape']
+        n_rows = shape[0]
+        rows = _as_slice(rows)
+        start, stop, step = rows.indices(n_rows)
+        if step < 0:
+            return self.get_array(name)[rows]
+        dtype = np.dtype(info['dtype'])
+        if stop <= start:
+            return np.zeros([0] + shape[1:], dtype=dtype)
+        rpc = info['rows_per_chunk']
+        first = start // rpc
+        last = (stop - 1) // rpc
+        parts = []
+        for offset, length in info['chunks'][first:last + 1]:
+            self.f.seek(offset)
+            parts.append(np.frombuffer(zlib.decompress(self.f.read(length)),
+                                       dtype=dtype))
+        a = np.concatenate(parts).reshape([-1] + shape[1:])
+        return a[start - first * rpc:stop - first * rpc:step]
+
+    def as_dict(self):
+        """
+        The fully decoded dict, as it was before encoding.
+        """
+        return _resolve(self.doc, lambda name: self.get_array(name).tolist())
+
+
+class JSONBlobReader(object):
+    """
+    The BlobReader interface over a plain JSON (pre-binary) blob.
+    """
+
+    def __init__(self, d):
+        self.kind = None
+        self.doc = d
+
+    def names(self):
+        names = []
+        _collect_names(self.doc, '', names)
+        return sorted(names)
+
+    def get_array(self, name, rows=None):
+        obj = self.doc
+        for k in name.split('/') if name else []:
+            obj = obj[int(k)] if isinstance(obj, list) else obj[k]
+        return np.array(obj)[_as_slice(rows)]
+
+    def as_dict(self):
+        return self.doc
+
+
+def open_blob(f):
+    """
+    A reader for a blob (binary or legacy JSON) in a seekable file-like
+    object.
+    """
+    head = f.read(len(_HEADER))
+    if head.startswith(MAGIC):
+        return BlobReader(f)
+    return JSONBlobReader(json.loads((head + f.read()).decode('utf-8')))
+
+
+def encode_blob(d, kind=None):
+    """
+    :param d: dict (e.g. CompleteDos.as_dict())
+    :return: the blob, as bytes
+    """
+    f = io.BytesIO()
+    w = BlobWriter(f)
+    w.close(w.add(d), kind=kind)
+    return f.getvalue()
+
+
+def decode_blob(data):
+    """
+    :param data: a blob (binary or legacy JSON), as bytes
+    :return: the decoded dict
+    """
+    return open_blob(io.BytesIO(data)).as_dict()
+
+
+def put_blob(fs, d, kind=None, **kwargs):
+    """
+    Put d into GridFS as a blob, unless an identical blob is already there.
+
+    :param fs: gridfs.GridFS
+    :param d: dict (e.g. BandStructure.as_dict())
+    :param kind: what d is ('dos', 'band_structure', ...), stored in the
+        index and the GridFS file metadata
+    :param kwargs: passed to fs.put()
+    :return: the GridFS id (of the existing blob, for a duplicate)
+    """
+    return put_content(fs, encode_blob(d, kind=kind), kind, **kwargs)
+
+
+def put_content(fs, data, kind=None, **kwargs):
+    """
+    Put data (bytes) into GridFS keyed by its sha256, reusing an existing
+    file with the same content.
+
+    :return: the GridFS id
+    """
+    if not isinstance(data, bytes):
+        data = data.encode('utf-8')
+    content_hash = hashlib.sha256(data).hexdigest()
+    existing = find_content(fs, content_hash)
+    if existing is not None:
+        return existing
+    return fs.put(data, metadata=blob_metadata(kind, content_hash), **kwargs)
+
+
+def close_blob_file(fs, f, writer, kind=None):
+    """
+    Finish a blob that was written into the GridIn f with writer (after
+    writer.close()). If fs already holds the same content, f is discarded.
+
+    :return: the GridFS id
+    """
+    existing = find_content(fs, writer.content_hash)
+    if existing is not None:
+        f.abort()
+        return existing
+    f.metadata = blob_metadata(kind, writer.content_hash)
+    f.close()
+    return f._id
+
+
+def find_content(fs, content_hash):
+    """
+    Look up the file in fs with this content hash to reuse it, marking it as
+    just used (metadata.last_used).
+
+    :return: the id of the file, or None
+    """
+    f = _files_collection(fs).find_one_and_update(
+        {'metadata.content_hash': content_hash},
+        {'$set': {'metadata.last_used': datetime.datetime.utcnow()}},
+        projection={'_id': 1})
+    return f['_id'] if f is not None else None
+
+
+def _files_collection(fs):
+    # gridfs.GridFS has no public handle on its files collection (it is
+    # _GridFS__files before pymongo 4, _files since)
+    files = getattr(fs, '_files', None)
+    return files if files is not None else fs._GridFS__files
+
+
+def ensure_blob_indexes(db, collection):
+    """
+    Index the content hashes of the GridFS collection (e.g. "dos_fs").
+    """
+    db['{}.files'.format(collection)].create_index('metadata.content_hash')
+
+
+def load_blob(fs, file_id):
+    """
+    :return: a (lazy) reader of the blob with file_id in fs
+    """
+    return open_blob(fs.get(file_id))
+
+
+def blob_metadata(kind, content_hash=None):
+    return {'format': FORMAT_NAME, 'version': VERSION, 'kind': kind,
+            'content_hash': content_hash}
+
+
+def _join(prefix, key):
+    return '{}/{}'.format(prefix, key) if prefix else str(key)
+
+
+def _as_slice(rows):
+    if rows is None:
+        return slice(None)
+    if isinstance(rows, tuple):
+        return slice(*rows)
+    return rows
+
+
+def _numeric_array(l):
+    # a list of numbers (or of lists of numbers, ...) of the same shape, or None
+    leaf = l
+    while isinstance(leaf, (list, tuple)) and leaf:
+        leaf = leaf[0]
+    if isinstance(leaf, bool) or not isinstance(leaf, (int, float, np.number)):
+        return None
+    try:
+        a = np.array(l)
+    except ValueError:
+        return None
+    if a.dtype.kind not in 'iuf' or a.size < MIN_ARRAY_SIZE:
+        return None
+    return a
+
+
+def _resolve(obj, get):
+    if isinstance(obj, dict):
+        if len(obj) == 1 and '@blob' in obj:
+            return get(obj['@blob'])
+        return {k: _resolve(v, get) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_resolve(v, get) for v in obj]
+    return obj
+
+
+def _collect_names(obj, prefix, names):
+    if isinstance(obj, dict):
+        for k, v in obj.items():
+            _collect_names(v, _join(prefix, k), names)
+    elif isinstance(obj, list):
+        if _numeric_array(obj) is not None:
+            names.append(prefix)
+        else:
+            for i, v in enumerate(obj):
+                _collect_names(v, _join(prefix, i), names)
@@ -0,0 +1,104 @@
+import time
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+
+class BulkUpsertWriter(object):
+    """
+    Write-behind buffer of upserts into one collection. Upserts are sent as a
+    single unordered bulk_write once batch_size of them are buffered or the
+    oldest one has waited flush_interval seconds (checked whenever a new
+    upsert comes in), and on flush(). Updates of existing documents only
+    (update()) are buffered the same way.
+
+    Each upsert carries a tag (e.g. the launch dir of a task doc) so that the
+    documents that failed to be written can be reported.
+    """
+
+    def __init__(self, collection, batch_size=500, flush_interval=30):
+        """
+        :param collection: pymongo Collection to write into
+        :param batch_size: max number of buffered upserts
+        :param flush_interval: max number of seconds an upsert is buffered
+            (as long as more upserts come in; call flush() at the end)
+        """
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.requests = []
+        self.tags = []
+        self.errors = []
+        self.n_written = 0
+        self._first_buffered = None
+
+    def upsert(self, filter, update, tag=None):
+        """
+        Buffer collection.update_one(filter, update, upsert=True).
+
+        :return: the errors of the flush this triggered, if any (see flush())
+        """
+        return self._add(UpdateOne(filter, update, upsert=True), tag)
+
+    def update(self, filter, update, tag=None):
+        """
+        Buffer collection.update_one(filter, update), i.e. without inserting
+        a document if none matches filter.
+
+        :return: the errors of the flush this triggered, if any (see flush())
+        """
+        return self._add(UpdateOne(filter, update), tag)
+
+    def _add(self, request, tag):
+        if not self.requests:
+            self._first_buffered = time.time()
+        self.requests.append(request)
+        self.tags.append(tag)
+        if len(self.requests) >= self.batch_size or \
+                time.time() - self._first_buffered >= self.flush_interval:
+            return self.flush()
+        return []
+
+    def flush(self):
+        """
+        Write out everything that is buffered.
+
+        :return: list of {'tag': ..., 'error': ...} for the upserts that
+            failed in this flush; they are also added to self.errors
+        """
+        if not self.requests:
+            return []
+        requests, tags = self.requests, self.tags
+        self.requests, self.tags = [], []
+        errors = []
+        try:
+            self.collection.bulk_write(requests, ordered=False)
+            self.n_written += len(requests)
+        except BulkWriteError as e:
+            details = e.details
+            for err in details.get('writeErrors', []):
+                errors.append({'tag': tags[err['index']],
+                               'error': err.get('errmsg')})
+            for err in details.get('writeConcernErrors', []):
+                errors.append({'tag': None, 'error': err.get('errmsg')})
+            self.n_written += len(requests) - len(details.get('writeErrors', []))
+        except Exception as e:
+            # nothing of this batch can be assumed to be written
+            errors.extend({'tag': tag, 'error': repr(e)} for tag in tags)
+        self.errors.extend(errors)
+        return errors
+
+    def __len__(self):
+        return len(self.requests)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.flush()
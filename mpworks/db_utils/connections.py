@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+
+from pymongo import MongoClient
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+A process-wide registry of MongoDB connections.
+
+Every component that talks to a database (drones, SNL/submission adapters,
+firetasks, maintenance scripts) should get its client/database from here
+rather than creating its own MongoClient. A client is created once per
+(host, port, credentials) and reused for the lifetime of the process, so
+repeated DB insertions do not pay the TCP + auth handshake every time.
+
+MongoClient is not fork-safe. The registry remembers the pid that created it
+and silently starts over in a forked child (e.g. multiprocessing.Pool
+workers), so every worker ends up with exactly one connection of its own.
+'''
+
+_lock = threading.RLock()
+_pid = None
+_clients = {}
+_databases = {}
+_launchpads = {}
+_creds = {}
+# what get_client() makes its clients with; see set_client_factory()
+_client_factory = MongoClient
+
+
+def _check_pid():
+    # never reuse sockets inherited from a parent process; the parent still
+    # owns them, so just drop our references without closing
+    global _pid
+    if _pid != os.getpid():
+        _clients.clear()
+        _databases.clear()
+        _launchpads.clear()
+        _pid = os.getpid()
+
+
+def _freeze(kwargs):
+    return tuple(sorted(kwargs.items()))
+
+
+def get_client(host='localhost', port=27017, user=None, password=None,
+               **client_kwargs):
+    """
+    Get the shared MongoClient for a host/port. Credentials are part of the
+    key so that differently-authenticated users never share sockets.
+
+    :param client_kwargs: extra (hashable) keyword args for MongoClient,
+        e.g. j=False
+    """
+    key = (host, port, user, password, _freeze(client_kwargs))
+    with _lock:
+        _check_pid()
+        if key not in _clients:
+            # connect=False defers the connection to first use, which keeps
+            # the client safe to create before a fork
+            _clients[key] = _client_factory(host, port, connect=False,
+                                            **client_kwargs)
+        return _clients[key]
+
+
+def get_database(host='localhost', port=27017, database=None, user=None,
+                 password=None, **client_kwargs):
+    """
+    Get a (shared, already-authenticated) Database object.
+    """
+    key = (host, port, database, user, password, _freeze(client_kwargs))
+    with _lock:
+        _check_pid()
+        if key not in _databases:
+            client = get_client(host, port, user, password, **client_kwargs)
+            db = client[database]
+            if user:
+                db.authenticate(user, password)
+            _databases[key] = db
+        return _databases[key]
+
+
+def set_client_factory(factory=None):
+    """
+    Have get_client() create its clients with factory(host, port, **kwargs)
+    instead of MongoClient, e.g. to run against an in-memory stand-in such
+    as mongomock (see maintenance_scripts/drone_benchmark.py). Drops the
+    cached connections.
+
+    :param factory: callable with the signature of MongoClient, or None to
+        go back to MongoClient
+    """
+    global _client_factory
+    with _lock:
+        _client_factory = factory if factory else MongoClient
+        _clients.clear()
+        _databases.clear()
+        _launchpads.clear()
+
+
+def get_db_creds(filename='tasks_db.json', db_loc=None):
+    """
+    Load (and cache) a credentials file from the DB_LOC directory.
+
+    :param filename: basename of the credentials file; .json and .yaml are
+        supported
+    :param db_loc: directory of the file, defaults to $DB_LOC
+    """
+    db_loc = db_loc if db_loc else os.environ['DB_LOC']
+    path = os.path.join(db_loc, filename)
+    with _lock:
+        if path not in _creds:
+            with open(path) as f:
+                if path.endswith('.yaml'):
+                    import yaml
+                    _creds[path] = yaml.load(f)
+                else:
+                    _creds[path] = json.load(f)
+        return _creds[path]
+
+
+def get_tasks_db(filename='tasks_db.json', db_loc=None):
+    """
+    The tasks database as described by tasks_db.json, authenticated with the
+    admin user.
+    """
+    creds = get_db_creds(filename, db_loc)
+    return get_database(creds['host'], creds['port'], creds['database'],
+                        creds['admin_user'], creds['admin_password'])
+
+
+def get_launchpad():
+    """
+    A shared LaunchPad.auto_load() for this process.
+    """
+    from fireworks.core.launchpad import LaunchPad
+    with _lock:
+        _check_pid()
+        if 'auto_load' not in _launchpads:
+            _launchpads['auto_load'] = LaunchPad.auto_load()
+        return _launchpads['auto_load']
+
+
+def reset():
+    """
+    Drop all cached connections and credentials (mostly for testing).
+    """
+    global _pid
+    with _lock:
+        _clients.clear()
+        _databases.clear()
+        _launchpads.clear()
+        _creds.clear()
+        _pid = None
@@ -0,0 +1,111 @@
+import os
+import threading
+from pymongo import ReturnDocument
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+IDs (task, SNL, snlgroup and submission ids) come from counter documents
+that are $inc'ed. Instead of one round trip to the counter per ID, an
+IdAllocator reserves a block of block_size IDs at a time and hands them out
+locally.
+
+* IDs from one allocator are strictly increasing, and no ID is handed out
+  twice across processes.
+* IDs are not globally ordered across processes, and a process that exits
+  (or crashes) loses the rest of its block, so the gaps in the sequence are
+  at most block_size - 1 per process.
+* block_size=1 is the strict mode: exactly one $inc per ID, no gaps, and the
+  same behavior as before allocators existed.
+
+Allocators are shared per process through get_allocator(), so that
+short-lived adapters do not each waste a block.
+'''
+
+_lock = threading.RLock()
+_pid = None
+_allocators = {}
+
+
+class IdAllocator(object):
+    def __init__(self, collection, field, query=None, block_size=1):
+        """
+        :param collection: the collection holding the counter document
+        :param field: the counter field; it holds the next free ID
+        :param query: selects the counter document (default: the only one)
+        :param block_size: number of IDs reserved per round trip
+        """
+        if block_size < 1:
+            raise ValueError("block_size must be at least 1")
+        self.collection = collection
+        self.field = field
+        self.query = query if query else {}
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._next = self._end = 0
+
+    def _reserve(self):
+        doc = self.collection.find_one_and_update(
+            self.query, {'$inc': {self.field: self.block_size}},
+            projection={self.field: 1},
+            return_document=ReturnDocument.BEFORE)
+        if doc is None:
+            raise ValueError("No counter document {} in {}".format(
+                self.query, self.collection.full_name))
+        self._next = doc[self.field]
+        self._end = self._next + self.block_size
+
+    def next_id(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # a forked child must not hand out the parent's block
+                self._pid = os.getpid()
+                self.discard()
+            if self._next >= self._end:
+                self._reserve()
+            i = self._next
+            self._next += 1
+            return i
+
+    def discard(self):
+        """
+        Forget the rest of the reserved block, e.g. after the counter has
+        been reset.
+        """
+        self._next = self._end = 0
+
+
+def get_allocator(collection, field, query=None, block_size=1):
+    """
+    The process-wide allocator for a counter field.
+    """
+    global _pid
+    key = (id(collection.database.client), collection.full_name, field,
+           tuple(sorted((query or {}).items())), block_size)
+    with _lock:
+        if _pid != os.getpid():
+            _pid = os.getpid()
+            _allocators.clear()
+        if key not in _allocators:
+            _allocators[key] = IdAllocator(collection, field, query,
+                                           block_size)
+        return _allocators[key]
+
+
+def discard_blocks(collection):
+    """
+    Forget the reserved blocks of all allocators of a collection, e.g. when
+    its counters are reset.
+    """
+    with _lock:
+        for (client_id, name, field, query, block_size), a in \
+                _allocators.items():
+            if client_id == id(collection.database.client) and \
+                    name == collection.full_name:
+                a.discard()
@@ -0,0 +1,47 @@
+import io
+import json
+from unittest import TestCase
+
+import numpy as np
+
+from mpworks.db_utils import blobs
+
+
+class TestBlobs(TestCase):
+    def setUp(self):
+        self.bs = {"@class": "BandStructure", "efermi": 1.5,
+                   "kpoints": [[0, 0, 0], [0.5, 0, 0]],
+                   "bands": {"1": np.random.rand(50, 20).tolist(),
+                             "-1": np.random.rand(50, 20).tolist()},
+                   "labels_dict": {"\\Gamma": [0, 0, 0]}}
+
+    def test_round_trip(self):
+        data = blobs.encode_blob(self.bs, kind='band_structure')
+        self.assertTrue(data.startswith(blobs.MAGIC))
+        self.assertEqual(blobs.decode_blob(data), self.bs)
+        reader = blobs.open_blob(io.BytesIO(data))
+        self.assertEqual(reader.kind, 'band_structure')
+        self.assertEqual(reader.names(), ['bands/-1', 'bands/1'])
+
+    def test_row_range(self):
+        chunk_bytes = blobs.CHUNK_BYTES
+        blobs.CHUNK_BYTES = 3 * 20 * 8  # three bands per chunk
+        try:
+            reader = blobs.open_blob(io.BytesIO(blobs.encode_blob(self.bs)))
+        finally:
+            blobs.CHUNK_BYTES = chunk_bytes
+        bands = np.array(self.bs["bands"]["-1"])
+        for rows in [(4, 11), (0, 3), (48, 60), (7, 7)]:
+            self.assertTrue(np.array_equal(
+                reader.get_array("bands/-1", rows=rows), bands[slice(*rows)]))
+
+    def test_legacy_json(self):
+        reader = blobs.open_blob(io.BytesIO(json.dumps(self.bs).encode()))
+        self.assertEqual(reader.as_dict(), self.bs)
+        self.assertTrue(np.array_equal(
+            reader.get_array("bands/1", rows=(2, 5)),
+            np.array(self.bs["bands"]["1"])[2:5]))
+
+    def test_encoding_is_deterministic(self):
+        reordered = dict(reversed(list(self.bs.items())))
+        self.assertEqual(blobs.encode_blob(self.bs), blobs.encode_blob(reordered))
@@ -0,0 +1,58 @@
+from unittest import TestCase
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from mpworks.db_utils.bulk_writer import BulkUpsertWriter
+
+
+class FakeCollection(object):
+    def __init__(self, fail_indices=()):
+        self.batches = []
+        self.requests = []
+        self.fail_indices = fail_indices
+
+    def bulk_write(self, requests, ordered=True):
+        self.batches.append((len(requests), ordered))
+        self.requests.extend(requests)
+        if self.fail_indices:
+            raise BulkWriteError({'writeErrors': [
+                {'index': i, 'errmsg': 'bad doc {}'.format(i)}
+                for i in self.fail_indices]})
+
+
+class TestBulkUpsertWriter(TestCase):
+    def test_batches(self):
+        coll = FakeCollection()
+        with BulkUpsertWriter(coll, batch_size=3) as w:
+            for i in range(7):
+                w.upsert({'dir_name': i}, {'$set': {'x': i}}, tag=i)
+        self.assertEqual(coll.batches, [(3, False), (3, False), (1, False)])
+        self.assertEqual(w.n_written, 7)
+
+    def test_update(self):
+        coll = FakeCollection()
+        with BulkUpsertWriter(coll, batch_size=10) as w:
+            w.update({'dir_name': 0}, {'$set': {'x': 0}})
+            w.upsert({'dir_name': 1}, {'$set': {'x': 1}})
+        self.assertEqual(coll.requests,
+                         [UpdateOne({'dir_name': 0}, {'$set': {'x': 0}}),
+                          UpdateOne({'dir_name': 1}, {'$set': {'x': 1}},
+                                    upsert=True)])
+
+    def test_flush_interval(self):
+        coll = FakeCollection()
+        w = BulkUpsertWriter(coll, batch_size=100, flush_interval=0)
+        w.upsert({'dir_name': 0}, {'$set': {}})
+        self.assertEqual(coll.batches, [(1, False)])
+        self.assertEqual(len(w), 0)
+
+    def test_errors_are_tagged(self):
+        coll = FakeCollection(fail_indices=[1])
+        w = BulkUpsertWriter(coll, batch_size=10)
+        for tag in ['a', 'b', 'c']:
+            w.upsert({'dir_name': tag}, {'$set': {}}, tag=tag)
+        errors = w.flush()
+        self.assertEqual(errors, [{'tag': 'b', 'error': 'bad doc 1'}])
+        self.assertEqual(w.errors, errors)
+        self.assertEqual(w.n_written, 2)
@@ -0,0 +1,49 @@
+from unittest import TestCase
+
+from mpworks.db_utils import connections
+
+
+class TestConnectionRegistry(TestCase):
+    def setUp(self):
+        connections.reset()
+
+    def tearDown(self):
+        connections.reset()
+
+    def test_client_is_shared(self):
+        c1 = connections.get_client('localhost', 27017)
+        c2 = connections.get_client('localhost', 27017)
+        self.assertIs(c1, c2)
+        self.assertIsNot(c1, connections.get_client('localhost', 27018))
+        self.assertIsNot(c1, connections.get_client('localhost', 27017, w=1))
+
+    def test_database_is_shared(self):
+        db1 = connections.get_database('localhost', 27017, 'tasks')
+        db2 = connections.get_database('localhost', 27017, 'tasks')
+        self.assertIs(db1, db2)
+        self.assertIs(db1.client, connections.get_client('localhost', 27017))
+
+    def test_fork_resets_registry(self):
+        c1 = connections.get_client('localhost', 27017)
+        connections._pid = -1  # pretend we are in a forked child
+        c2 = connections.get_client('localhost', 27017)
+        self.assertIsNot(c1, c2)
+
+    def test_client_factory(self):
+        made = []
+
+        def factory(host, port, **kwargs):
+            made.append((host, port, kwargs))
+            return object()
+
+        connections.set_client_factory(factory)
+        try:
+            c = connections.get_client('localhost', 27017, w=1)
+            self.assertIs(c, connections.get_client('localhost', 27017,
+                                                    w=1))
+            self.assertEqual(made, [('localhost', 27017,
+                                     {'connect': False, 'w': 1})])
+        finally:
+            connections.set_client_factory(None)
+        self.assertIsNot(c, connections.get_client('localhost', 27017,
+                                                   w=1))
@@ -0,0 +1,44 @@
+from unittest import TestCase
+
+from mpworks.db_utils import id_allocator
+
+
+class FakeCounters(object):
+    full_name = 'test.counter'
+
+    def __init__(self, start=1):
+        self.doc = {'c': start}
+        self.n_calls = 0
+
+    def find_one_and_update(self, query, update, projection=None,
+                            return_document=None):
+        self.n_calls += 1
+        before = dict(self.doc)
+        self.doc['c'] += update['$inc']['c']
+        return before
+
+
+class TestIdAllocator(TestCase):
+    def test_strict_mode(self):
+        coll = FakeCounters()
+        a = id_allocator.IdAllocator(coll, 'c')
+        self.assertEqual([a.next_id() for i in range(3)], [1, 2, 3])
+        self.assertEqual(coll.n_calls, 3)
+        self.assertEqual(coll.doc['c'], 4)
+
+    def test_blocks(self):
+        coll = FakeCounters()
+        a = id_allocator.IdAllocator(coll, 'c', block_size=10)
+        b = id_allocator.IdAllocator(coll, 'c', block_size=10)
+        ids_a = [a.next_id() for i in range(12)]
+        ids_b = [b.next_id() for i in range(3)]
+        self.assertEqual(ids_a, list(range(1, 13)))
+        self.assertEqual(ids_b, [21, 22, 23])
+        self.assertEqual(coll.n_calls, 3)
+
+    def test_fork_discards_block(self):
+        coll = FakeCounters()
+        a = id_allocator.IdAllocator(coll, 'c', block_size=10)
+        a.next_id()
+        a._pid = -1  # pretend we are in a forked child
+        self.assertEqual(a.next_id(), 11)
@@ -0,0 +1,116 @@
+import threading
+import traceback
+from collections import OrderedDict
+from pymatgen import Composition
+from pymatgen.entries.compatibility import MaterialsProjectCompatibility
+from pymatgen.entries.computed_entries import ComputedEntry
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Process-wide evaluation of the "is_compatible" key of task docs.
+
+Making a MaterialsProjectCompatibility reads its YAML config and builds all
+the correction objects, which costs more than checking an entry. Here it is
+made once per process (per compatibility mode) and shared. Since the
+ComputedEntry that is checked has zero energy and only carries the
+composition and the calculation parameters, the answer only depends on those,
+so it is memoized on them as well: the same chemical system computed with
+the same settings is checked once.
+
+get_is_compatible(d) does a single task doc (MPVaspDrone, BoltztrapRunTask);
+get_is_compatible_batch(docs) does many at once, e.g. to recompute the key
+over the tasks collection without reparsing.
+'''
+
+# task doc fields the answer depends on (projection for batch queries)
+COMPATIBILITY_FIELDS = ['task_id', 'unit_cell_formula', 'run_type',
+                        'is_hubbard', 'hubbards', 'pseudo_potential']
+
+_CACHE_SIZE = 4096
+
+_lock = threading.Lock()
+_compatibilities = {}
+_cache = OrderedDict()
+
+
+def get_compatibility(mode="Advanced"):
+    """
+    The shared MaterialsProjectCompatibility of this process.
+    """
+    with _lock:
+        if mode not in _compatibilities:
+            _compatibilities[mode] = MaterialsProjectCompatibility(mode)
+        return _compatibilities[mode]
+
+
+def get_entry(d):
+    """
+    The ComputedEntry (zero energy) that stands for a task doc d.
+    """
+    func = d["pseudo_potential"]["functional"]
+    labels = d["pseudo_potential"]["labels"]
+    symbols = ["{} {}".format(func, label) for label in labels]
+    parameters = {"run_type": d["run_type"],
+                  "is_hubbard": d["is_hubbard"],
+                  "hubbards": d["hubbards"],
+                  "potcar_symbols": symbols}
+    return ComputedEntry(Composition(d["unit_cell_formula"]),
+                         0.0, 0.0, parameters=parameters,
+                         entry_id=d["task_id"])
+
+
+def _get_key(d, mode):
+    formula = tuple(sorted((str(el), float(amt)) for el, amt
+                           in d["unit_cell_formula"].items()))
+    hubbards = tuple(sorted((str(el), float(u)) for el, u
+                            in (d["hubbards"] or {}).items()))
+    return (mode, formula, d["run_type"], bool(d["is_hubbard"]), hubbards,
+            d["pseudo_potential"]["functional"],
+            tuple(d["pseudo_potential"]["labels"]))
+
+
+def get_is_compatible(d, mode="Advanced"):
+    """
+    :param d: a task doc (or any dict with the COMPATIBILITY_FIELDS)
+    :return: whether the entry of d passes MaterialsProjectCompatibility, or
+        None if that could not be determined
+    """
+    try:
+        key = _get_key(d, mode)
+        with _lock:
+            if key in _cache:
+                value = _cache.pop(key)
+                _cache[key] = value
+                return value
+        value = bool(get_compatibility(mode).process_entry(get_entry(d)))
+    except:
+        traceback.print_exc()
+        print 'ERROR in getting compatibility, task_id: {}'.format(
+            d.get("task_id"))
+        return None
+    with _lock:
+        _cache[key] = value
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+def get_is_compatible_batch(docs, mode="Advanced"):
+    """
+    :param docs: iterable of task docs (e.g. a cursor projected on
+        COMPATIBILITY_FIELDS)
+    :return: {task_id: True/False/None}
+    """
+    return dict((d["task_id"], get_is_compatible(d, mode)) for d in docs)
+
+
+def clear_cache():
+    with _lock:
+        _compatibilities.clear()
+        _cache.clear()
@@ -0,0 +1,205 @@
+import fnmatch
+import os
+from mpworks.drones import launch_archive
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        # backport for Python 2 (pip install scandir)
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+A snapshot of the entries of a launch directory, taken with a single
+directory read.
+
+The drone, the signal detectors, is_valid_vasp_dir(), last_relax() and
+VaspCopyTask all ask the same questions about a launch dir (does OUTCAR or
+OUTCAR.gz exist, how big is it, which *.error files are there, is there a
+relax2 subdir). On Lustre/GPFS each of those is a metadata round trip.
+DirManifest answers them from one scandir() of the dir instead: names and
+types come with the listing, and sizes and mtimes are only stat'ed for the
+entries that are asked about (once each). Subdirs (relax1, relax2) get
+their own manifest, read on first use. Archived launch dirs (see
+mpworks.drones.launch_archive) are listed from the archive index.
+
+A manifest does not see changes made to the dir after it was read, so it
+should live only as long as one pass of checks over the dir.
+'''
+
+COMPRESSION_EXTENSIONS = ['', '.gz', '.GZ', '.bz2', '.BZ2', '.z', '.Z']
+
+
+class DirManifest(object):
+
+    def __init__(self, dir_name):
+        """
+        :param dir_name: a plain or archived dir (need not exist; a missing
+            dir has no entries)
+        """
+        self.dir_name = dir_name
+        self._abs_dir_name = os.path.abspath(dir_name)
+        # name -> is_dir (None until asked for, without scandir)
+        self._is_dir = {}
+        # name -> (size, mtime), or the scandir entry until it is stat'ed
+        self._stats = {}
+        self._subdirs = {}
+        self._scan()
+        # uncompressed name -> names of its compressed variants, in zpath()
+        # order
+        self.variants = {}
+        for ext in COMPRESSION_EXTENSIONS[1:]:
+            for name in self._is_dir:
+                if name.endswith(ext):
+                    self.variants.setdefault(name[:-len(ext)], []).append(
+                        name)
+
+    def _scan(self):
+        dir_name = self.dir_name or '.'
+        if os.path.isdir(dir_name):
+            if scandir:
+                for entry in scandir(dir_name):
+                    self._is_dir[entry.name] = entry.is_dir()
+                    self._stats[entry.name] = entry
+            else:
+                # without scandir, listdir() gives no types; a stat per entry
+                # would cost as much as not having a manifest, so types are
+                # only looked up for the names that are asked about
+                self._is_dir = dict.fromkeys(os.listdir(dir_name))
+            return
+        found = launch_archive.find_archive(self._abs_dir_name)
+        if not found or not found[0].isdir(found[1]):
+            return
+        a, name = found
+        prefix = name.rstrip('/') + '/' if name and name != '.' else ''
+        for m, stat in a.members.items():
+            if not m.startswith(prefix):
+                continue
+            rest = m[len(prefix):].split('/')
+            if len(rest) > 1:
+                self._is_dir[rest[0]] = True
+            else:
+                self._is_dir[rest[0]] = False
+                self._stats[rest[0]] = stat
+
+    @property
+    def names(self):
+        return sorted(self._is_dir)
+
+    def path(self, name):
+        return os.path.join(self.dir_name, name)
+
+    def exists(self, name):
+        return name in self._is_dir
+
+    def isdir(self, name):
+        if name not in self._is_dir:
+            return False
+        if self._is_dir[name] is None:
+            self._is_dir[name] = os.path.isdir(self.path(name))
+        return self._is_dir[name]
+
+    def isfile(self, name):
+        return name in self._is_dir and not self.isdir(name)
+
+    def _stat(self, name):
+        if name not in self._is_dir:
+            raise OSError(2, 'No such file or directory', self.path(name))
+        stat = self._stats.get(name)
+        if stat is None:
+            st = os.stat(self.path(name))
+            stat = (st.st_size, st.st_mtime)
+        elif not isinstance(stat, tuple):
+            st = stat.stat()
+            stat = (st.st_size, st.st_mtime)
+        self._stats[name] = stat
+        return stat
+
+    def getsize(self, name):
+        return self._stat(name)[0]
+
+    def getmtime(self, name):
+        return self._stat(name)[1]
+
+    def glob(self, pattern):
+        """
+        Full paths of the entries matching pattern (a file name pattern,
+        without dirs), like glob.glob(os.path.join(dir_name, pattern)).
+        """
+        return [self.path(n) for n in fnmatch.filter(self.names, pattern)]
+
+    def zname(self, name):
+        """
+        name, or a compressed version of it if only that exists (zpath()
+        on entry names); None if neither exists.
+        """
+        if name in self._is_dir:
+            return name
+        variants = self.variants.get(name)
+        return variants[0] if variants else None
+
+    def zpath(self, name):
+        """
+        launch_archive.zpath(self.path(name))
+        """
+        return self.path(self.zname(name) or name)
+
+    def subdir(self, name):
+        """
+        The manifest of the subdir name, or None if there is no such subdir.
+        """
+        if not self.isdir(name):
+            return None
+        if name not in self._subdirs:
+            self._subdirs[name] = DirManifest(self.path(name))
+        return self._subdirs[name]
+
+    def last_relax(self, name):
+        """
+        wf_utils.last_relax(self.path(name)): the file name in the last
+        relaxation of this dir.
+        """
+        relax2 = self.subdir('relax2')
+        if relax2 and relax2.zname(name):
+            return relax2.zpath(name)
+        if self.zname(name):
+            return self.zpath(name)
+        relaxations = self.glob('%s.relax*' % name)
+        if relaxations:
+            return sorted(relaxations)[-1]
+        relax1 = self.subdir('relax1')
+        if relax1 and relax1.zname(name):
+            return relax1.zpath(name)
+        return self.path(name)
+
+    def manifest_of(self, dir_name):
+        """
+        The manifest of dir_name if it is this dir or one of its subdirs,
+        else a new one.
+        """
+        abs_dir_name = os.path.abspath(dir_name)
+        if abs_dir_name == self._abs_dir_name:
+            return self
+        parent, name = os.path.split(abs_dir_name)
+        if parent == self._abs_dir_name and self.isdir(name):
+            return self.subdir(name)
+        return DirManifest(dir_name)
+
+
+def get_manifest(dir_name, manifest=None):
+    """
+    manifest if it covers dir_name (see DirManifest.manifest_of()), else a
+    new manifest of dir_name.
+    """
+    if manifest is None:
+        return DirManifest(dir_name)
+    return manifest.manifest_of(dir_name)
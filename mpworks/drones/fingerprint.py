@@ -0,0 +1,110 @@
+import fnmatch
+import hashlib
+import os
+from mpworks.drones import launch_archive
+from mpworks.drones.dir_manifest import DirManifest
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Fingerprints of the output files of a launch directory, so that a reparse can
+tell which directories have not changed since they were last assimilated.
+
+A fingerprint is stored in the task doc as
+
+    {"drone_version": ..., "files": [{"name": ..., "size": ..., "mtime": ...,
+                                      "sha256": ...}, ...]}
+
+(a list, since file names contain dots). It covers the files that the drone
+and the signal detectors read (DRONE_FILES, possibly gzipped or with a
+.relax1/.relax2 suffix) in the launch dir and in its relax1/relax2 subdirs.
+Other outputs (WAVECAR, CHGCAR, ...) do not change the task doc, and are
+neither listed nor hashed. Archived launch dirs (see
+mpworks.drones.launch_archive) have the same fingerprint as the dir they were
+packed from, apart from the mtimes.
+'''
+
+SUBDIRS = ['relax1', 'relax2']
+# the files a task doc is made from, by base name
+DRONE_FILES = ['FW.json', 'INCAR', 'KPOINTS', 'POSCAR', 'POTCAR', 'CONTCAR',
+               'OUTCAR', 'OSZICAR', 'vasprun.xml', 'vasp.out',
+               'custodian.json', 'transformations.json']
+# the scheduler's outputs, looked at by SchedulerErrorSignal
+DRONE_PATTERNS = ['*.error']
+_BUFSIZE = 1 << 20
+
+
+def _sha256(filename):
+    h = hashlib.sha256()
+    with launch_archive.open_raw(filename) as f:
+        for block in iter(lambda: f.read(_BUFSIZE), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def is_drone_file(name):
+    """
+    Whether the file name (without dirs) is one of DRONE_FILES, e.g.
+    OUTCAR, OUTCAR.gz or OUTCAR.relax1.gz, or matches DRONE_PATTERNS.
+    """
+    for f in DRONE_FILES:
+        if name == f or name.startswith(f + '.'):
+            return True
+    return any(fnmatch.fnmatch(name, p) for p in DRONE_PATTERNS)
+
+
+def _list_files(path):
+    # {name relative to path: (size, mtime)} of the files that make up a
+    # launch dir
+    files = {}
+    manifest = DirManifest(path)
+    for sub in [''] + SUBDIRS:
+        m = manifest.subdir(sub) if sub else manifest
+        if m is None:
+            continue
+        for name in m.names:
+            if is_drone_file(name) and m.isfile(name):
+                files[os.path.join(sub, name)] = (m.getsize(name),
+                                                  m.getmtime(name))
+    return files
+
+
+def get_fingerprint(path, drone_version, known=None):
+    """
+    :param path: the launch dir
+    :param drone_version: version of the drone that parses the dir
+    :param known: a previous fingerprint of path; the hashes of files whose
+        size and mtime did not change are taken from it instead of being
+        recomputed
+    :return: the fingerprint (dict)
+    """
+    known = {f['name']: f for f in (known or {}).get('files', [])}
+    files = []
+    for name, (size, mtime) in sorted(_list_files(path).items()):
+        f = {'name': name, 'size': size, 'mtime': mtime}
+        k = known.get(name)
+        if k and k['size'] == f['size'] and k['mtime'] == f['mtime']:
+            f['sha256'] = k['sha256']
+        else:
+            f['sha256'] = _sha256(os.path.join(path, name))
+        files.append(f)
+    return {'drone_version': drone_version, 'files': files}
+
+
+def is_unchanged(path, fingerprint, drone_version):
+    """
+    Whether path still has the given (stored) fingerprint and would be
+    parsed by the same drone version. Files whose size and mtime match are
+    not read; the others are compared by content hash, so that e.g. a copy
+    of an unchanged dir (new mtimes) still counts as unchanged.
+    """
+    if not fingerprint or fingerprint.get('drone_version') != drone_version:
+        return False
+    current = get_fingerprint(path, drone_version, known=fingerprint)
+    return [(f['name'], f['size'], f['sha256']) for f in current['files']] == \
+        [(f['name'], f['size'], f['sha256']) for f in fingerprint['files']]
@@ -0,0 +1,384 @@
+from contextlib import contextmanager
+import bz2
+import fnmatch
+import glob as _glob
+import gzip
+import io
+import os
+import shutil
+import struct
+import tarfile
+import tempfile
+import threading
+import time
+import zipfile
+from monty.io import zopen as _zopen
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Read access to launch directories that were packed into a single archive
+(see maintenance_scripts/archive_launch_dirs.py).
+
+A launch dir <block>/<launcher> can be replaced by <block>/<launcher>.zip (or
+an uncompressed .tar) holding its files, with names relative to the launch
+dir. Paths into it keep working as "virtual" paths: exists(), getsize(),
+listdir(), glob(), zpath(), zopen() and copy() below behave like their os / monty
+counterparts on plain paths, and on virtual paths read the archive in place
+(members are located through the archive index and read with random access;
+nothing is extracted). Members that were already gzipped are stored as is
+and decompressed on read.
+
+For plain paths the only overhead is on files that do not exist, where the
+parent dirs are checked for an archive up to the first one that exists.
+Compressed tars (.tar.gz) are not supported, since they cannot be read
+without decompressing everything in front of a member.
+'''
+
+ARCHIVE_EXTENSIONS = ['.zip', '.tar']
+_COMPRESSED = {'.gz': 'gz', '.GZ': 'gz', '.z': 'gz', '.Z': 'gz',
+               '.bz2': 'bz2', '.BZ2': 'bz2'}
+# open archives (and their member index) kept per process
+_CACHE_SIZE = 16
+# where extracted() puts its temporary copies: in memory if possible, to
+# stay off the (parallel) filesystem
+TMP_DIR = '/dev/shm' if os.access('/dev/shm', os.W_OK) else None
+
+_lock = threading.Lock()
+_archives = {}
+
+
+class LaunchArchive(object):
+    """
+    An archive of one launch dir (or a whole block), with an index of its
+    members: {name: (size, mtime)}. Directories are implied by the names.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.members = {}
+        self._info = {}
+        if zipfile.is_zipfile(filename):
+            self.kind = 'zip'
+            with zipfile.ZipFile(filename) as z:
+                for info in z.infolist():
+                    if info.filename.endswith('/'):
+                        continue
+                    name = info.filename.rstrip('/')
+                    self.members[name] = (info.file_size,
+                                          time.mktime(info.date_time +
+                                                      (0, 0, -1)))
+                    self._info[name] = info
+        else:
+            self.kind = 'tar'
+            with tarfile.open(filename, 'r:') as t:
+                for info in t.getmembers():
+                    if info.isfile():
+                        name = os.path.normpath(info.name)
+                        self.members[name] = (info.size, info.mtime)
+                        self._info[name] = info
+        self.dirs = set()
+        for name in self.members:
+            d = os.path.dirname(name)
+            while d and d not in self.dirs:
+                self.dirs.add(d)
+                d = os.path.dirname(d)
+
+    def listdir(self, name=''):
+        prefix = name.rstrip('/') + '/' if name and name != '.' else ''
+        entries = set()
+        for m in self.members:
+            if m.startswith(prefix):
+                entries.add(m[len(prefix):].split('/')[0])
+        return sorted(entries)
+
+    def isdir(self, name):
+        return name in ('', '.') or name in self.dirs
+
+    def open(self, name):
+        """
+        Raw (binary, possibly still gzipped) contents of a member, as a file
+        object. Stored zip members and tar members are seekable windows
+        into the archive.
+        """
+        info = self._info[name]
+        f = open(self.filename, 'rb')
+        if self.kind == 'tar':
+            return _Window(f, info.offset_data, info.size)
+        if info.compress_type == zipfile.ZIP_STORED:
+            f.seek(info.header_offset)
+            header = f.read(30)
+            fields = struct.unpack('<4s2B4HL2L2H', header)
+            offset = info.header_offset + 30 + fields[10] + fields[11]
+            return _Window(f, offset, info.file_size)
+        f.close()
+        with zipfile.ZipFile(self.filename) as z:
+            data = z.open(info)
+        if os.path.splitext(name)[1] in _COMPRESSED:
+            # deflated twice (not written by the archiver); the gzip reader
+            # needs to seek
+            with data:
+                data = io.BytesIO(data.read())
+        return data
+
+    def extract(self, prefix, dest, select=None):
+        """
+        Write the members under prefix to dest (keeping their mtimes), for
+        parsers that can only read real files.
+
+        :param select: function of a file name (without dirs) that tells
+            whether to write that member (default: write all of them)
+        """
+        prefix = prefix.rstrip('/') + '/' if prefix and prefix != '.' else ''
+        for name in self.members:
+            if not name.startswith(prefix):
+                continue
+            if select and not select(os.path.basename(name)):
+                continue
+            target = os.path.join(dest, name[len(prefix):])
+            if not os.path.isdir(os.path.dirname(target)):
+                os.makedirs(os.path.dirname(target))
+            self.copy(name, target)
+
+    def copy(self, name, target):
+        """
+        Write the member name (as stored) to the file target, with its
+        mtime.
+        """
+        mtime = self.members[name][1]
+        with self.open(name) as src, open(target, 'wb') as f:
+            shutil.copyfileobj(src, f, 1 << 20)
+        os.utime(target, (mtime, mtime))
+
+
+class _Window(io.RawIOBase):
+    # read-only view of size bytes of f starting at offset
+
+    def __init__(self, f, offset, size):
+        self._f = f
+        self._offset = offset
+        self._size = size
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, pos, whence=0):
+        if whence == 1:
+            pos += self._pos
+        elif whence == 2:
+            pos += self._size
+        self._pos = max(0, min(pos, self._size))
+        return self._pos
+
+    def readinto(self, b):
+        n = min(len(b), self._size - self._pos)
+        if n <= 0:
+            return 0
+        self._f.seek(self._offset + self._pos)
+        data = self._f.read(n)
+        b[:len(data)] = data
+        self._pos += len(data)
+        return len(data)
+
+    def close(self):
+        self._f.close()
+        super(_Window, self).close()
+
+
+def get_archive(filename):
+    """
+    The LaunchArchive of filename, shared per process (and re-read if the
+    archive changed).
+    """
+    mtime = os.path.getmtime(filename)
+    with _lock:
+        a = _archives.pop(filename, None)
+        if a is None or a[0] != mtime:
+            a = (mtime, LaunchArchive(filename))
+        _archives[filename] = a
+        while len(_archives) > _CACHE_SIZE:
+            # dicts do not keep the order; drop an arbitrary other archive
+            _archives.pop(next(k for k in _archives if k != filename))
+        return a[1]
+
+
+def find_archive(path):
+    """
+    :return: (LaunchArchive, name of path in it) if path is (in) an archived
+        launch dir, or None if path is a plain path (existing or not)
+    """
+    p = os.path.abspath(path)
+    while True:
+        if os.path.exists(p):
+            return None
+        for ext in ARCHIVE_EXTENSIONS:
+            if os.path.isfile(p + ext):
+                name = os.path.relpath(os.path.abspath(path), p)
+                return get_archive(p + ext), name
+        parent = os.path.dirname(p)
+        if parent == p:
+            return None
+        p = parent
+
+
+def is_archived(path):
+    return find_archive(path) is not None
+
+
+def exists(path):
+    if os.path.exists(path):
+        return True
+    found = find_archive(path)
+    if not found:
+        return False
+    a, name = found
+    return name in a.members or a.isdir(name)
+
+
+def isdir(path):
+    if os.path.isdir(path):
+        return True
+    found = find_archive(path)
+    return bool(found) and found[0].isdir(found[1])
+
+
+def isfile(path):
+    if os.path.isfile(path):
+        return True
+    found = find_archive(path)
+    return bool(found) and found[1] in found[0].members
+
+
+def getsize(path):
+    return _stat(path)[0]
+
+
+def getmtime(path):
+    return _stat(path)[1]
+
+
+def _stat(path):
+    found = None if os.path.exists(path) else find_archive(path)
+    if not found:
+        st = os.stat(path)
+        return st.st_size, st.st_mtime
+    a, name = found
+    if name not in a.members:
+        raise OSError(2, 'No such file or directory', path)
+    return a.members[name]
+
+
+def listdir(path):
+    if os.path.isdir(path):
+        return os.listdir(path)
+    found = find_archive(path)
+    if not found or not found[0].isdir(found[1]):
+        raise OSError(2, 'No such file or directory', path)
+    return found[0].listdir(found[1])
+
+
+def glob(pattern):
+    """
+    glob.glob(), with wildcards only allowed in the last part of the path.
+    """
+    d, base = os.path.split(pattern)
+    if os.path.isdir(d or '.'):
+        return _glob.glob(pattern)
+    if not isdir(d):
+        return []
+    return [os.path.join(d, n) for n in fnmatch.filter(listdir(d), base)]
+
+
+def zpath(path):
+    """
+    monty.os.path.zpath(): path, or a compressed version of it if only that
+    exists.
+    """
+    for ext in ['', '.gz', '.GZ', '.bz2', '.BZ2', '.z', '.Z']:
+        if exists(path + ext):
+            return path + ext
+    return path
+
+
+def open_raw(path):
+    """
+    The contents of path as they are on disk (or in the archive), i.e.
+    without decompressing .gz files, in binary mode.
+    """
+    found = None if os.path.exists(path) else find_archive(path)
+    if not found:
+        return open(path, 'rb')
+    a, name = found
+    if name not in a.members:
+        raise IOError(2, 'No such file or directory', path)
+    f = a.open(name)
+    return io.BufferedReader(f, 1 << 16) if isinstance(f, _Window) else f
+
+
+def zopen(path, mode='r'):
+    """
+    monty.io.zopen() for reading plain and virtual paths. Members of
+    archives are always opened in binary mode (as in Python 2).
+    """
+    if os.path.exists(path) or not is_archived(path):
+        return _zopen(path, mode)
+    f = open_raw(path)
+    compression = _COMPRESSED.get(os.path.splitext(path)[1])
+    if compression == 'gz':
+        f = gzip.GzipFile(fileobj=f, mode='rb')
+    elif compression == 'bz2':
+        with f:
+            f = io.BytesIO(bz2.decompress(f.read()))
+    return f
+
+
+def copy(src, dst):
+    """
+    shutil.copy2() from a plain or virtual path (the file as stored, i.e.
+    still gzipped if it is a .gz) to a plain one.
+    """
+    found = None if os.path.exists(src) else find_archive(src)
+    if not found:
+        return shutil.copy2(src, dst)
+    a, name = found
+    if name not in a.members:
+        raise IOError(2, 'No such file or directory', src)
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    a.copy(name, dst)
+
+
+@contextmanager
+def extracted(path, select=None):
+    """
+    Context manager that yields a plain dir with the files of path: path
+    itself if it is a plain dir, else a temporary copy of (only) that launch
+    dir out of its archive, removed on exit. For parsers that cannot read
+    file objects.
+
+    :param select: function of a file name (without dirs) that tells
+        whether the parsers need that file; the others (e.g. WAVECAR) are
+        not extracted (default: extract all of them)
+    """
+    found = find_archive(path)
+    if not found:
+        yield path
+        return
+    tmp = tempfile.mkdtemp(prefix='launch_', dir=TMP_DIR)
+    try:
+        found[0].extract(found[1], tmp, select)
+        yield tmp
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
@@ -1,4 +1,5 @@
 import json
+import multiprocessing
 import os
 import datetime
 import logging
@@ -6,22 +7,37 @@ import pprint
 import re
 import traceback
 from monty.io import zopen
-from monty.os.path import zpath
-from pymongo import MongoClient
 import gridfs
 from matgendb.creator import VaspToDbTaskDrone
-from mpworks.drones.signals import VASPInputsExistSignal, \
-    VASPOutputsExistSignal, VASPOutSignal, HitAMemberSignal, SegFaultSignal, \
-    VASPStartedCompletedSignal, WallTimeSignal, DiskSpaceExceededSignal, \
-    SignalDetectorList, Relax2ExistsSignal
+from mpworks.db_utils.blobs import put_blob, put_content, \
+    ensure_blob_indexes
+from mpworks.db_utils.bulk_writer import BulkUpsertWriter
+from mpworks.db_utils.connections import get_database, get_launchpad
+from mpworks.db_utils.id_allocator import get_allocator
+from mpworks.drones.compatibility import COMPATIBILITY_FIELDS, \
+    get_is_compatible
+from mpworks.drones.dir_manifest import DirManifest, get_manifest
+from mpworks.drones.fingerprint import get_fingerprint, is_unchanged, \
+    is_drone_file
+from mpworks.drones.launch_archive import extracted, zpath
+from mpworks.drones.parse_cache import ParseCache
+from mpworks.drones.vasprun_stream import get_band_structure as \
+    stream_band_structure, stream_dos_to_gridfs
+from mpworks.drones.tail_reader import get_outcar_run_stats
+from mpworks.drones.text_scan import TextScanner
+from mpworks.drones.timing import PhaseTimer, TimingLog, null_phase
+from mpworks.drones.trajectory import put_trajectory, TRAJECTORY_FS
+from mpworks.drones.signals import CRITICAL_SIGNALS, VASPInputsExistSignal, \
+    VASPOutputsExistSignal, VASPOutSignal, SchedulerErrorSignal, \
+    VASPStartedCompletedSignal, SignalDetectorList, Relax2ExistsSignal
+from mpworks.firetasks.task_refs import get_ref_field
 from mpworks.snl_utils.snl_mongo import SNLMongoAdapter
-from mpworks.workflows.wf_utils import get_block_part
-from pymatgen import Composition, MontyEncoder
+from mpworks.snl_utils.snl_queue import SNLQueue
+from mpworks.workflows.wf_utils import get_block_part, find_launch
+from pymatgen import MontyEncoder
 from pymatgen.core.structure import Structure
-from pymatgen.entries.compatibility import MaterialsProjectCompatibility
-from pymatgen.entries.computed_entries import ComputedEntry
 from pymatgen.matproj.snl import StructureNL
-from pymatgen.io.vasp.outputs import Vasprun, Outcar
+from pymatgen.io.cif import CifWriter
 from pymatgen.analysis.structure_analyzer import oxide_type
 
 
@@ -34,19 +50,248 @@ __date__ = 'Mar 26, 2013'
 
 logger = logging.getLogger(__name__)
 
+# stored with the fingerprint of every task doc; bump it whenever a change to
+# the drone changes the docs it produces, so that a reparse picks up all dirs
+DRONE_VERSION = 1
 
-def is_valid_vasp_dir(mydir):
+
+def is_valid_vasp_dir(mydir, manifest=None):
     # note that the OUTCAR and POSCAR are known to be empty in some
-    # situations
+    # situations. mydir may be in an archived launch dir (see
+    # mpworks.drones.launch_archive). manifest: a DirManifest of mydir or of
+    # its parent dir
+    manifest = get_manifest(mydir, manifest)
     files = ["OUTCAR", "POSCAR", "INCAR", "KPOINTS"]
     for f in files:
-        m_file = os.path.join(mydir, f)
-        if not os.path.exists(zpath(m_file)) or not(os.stat(m_file).st_size > 0 or os.stat(m_file + '.gz').st_size > 0):
+        m_file = manifest.zname(f)
+        try:
+            if not m_file or not manifest.getsize(m_file) > 0:
+                return False
+        except OSError:
             return False
     return True
 
 
+def _relocate(obj, src, dest):
+    # replace the temporary dir src by the launch dir dest in all the paths
+    # of a task doc (but not in private keys like "_dos_file", which are
+    # read later on)
+    if isinstance(obj, dict):
+        return {k: v if k.startswith('_') else _relocate(v, src, dest)
+                for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_relocate(v, src, dest) for v in obj]
+    if isinstance(obj, basestring) and src in obj:
+        return obj.replace(src, dest)
+    return obj
+
+
+# (host, port, database) of the task dbs whose counter and GridFS indexes were
+# already set up by this process; a resident process (e.g. the DB insertion
+# service) makes a drone per task and should only pay for this once
+_initialized_dbs = set()
+
+
+# the fields a partial reparse (partial_fields) can recompute, each with the
+# task doc fields it is computed from
+PARTIAL_FIELDS = {
+    'run_stats': ['task_type'],
+    'analysis.bandgap': ['task_type', 'state', 'calculations.output.outcar.efermi'],
+    'analysis.errors_MP': ['task_type', 'state', 'output.final_energy'],
+    'is_compatible': COMPATIBILITY_FIELDS,
+    'task_id_deprecated': ['task_id']}
+
+
+# the drone used by the worker processes of MPVaspDrone.iter_assimilate();
+# set once per worker by the pool initializer so it is only pickled once
+_batch_drone = None
+
+
+def _init_batch_worker(drone):
+    global _batch_drone
+    _batch_drone = drone
+
+
+def _assimilate_one(path, drone=None, launches_coll=None):
+    # returns (path, task_id, error) and never raises, so that a single bad
+    # directory cannot take down the whole batch
+    drone = drone if drone else _batch_drone
+    try:
+        if launches_coll is None and not drone.simulate:
+            launches_coll = get_launchpad().launches
+        t_id, d = drone.assimilate(path, launches_coll=launches_coll)
+        return path, t_id, None
+    except:
+        return path, None, traceback.format_exc()
+
+
+def _assimilate_chunk(paths, drone=None, launches_coll=None):
+    # _assimilate_one() over paths with the task docs written in bulk;
+    # returns the list of results, with write errors as errors
+    drone = drone if drone else _batch_drone
+    results = [_assimilate_one(path, drone, launches_coll) for path in paths]
+    write_errors = {}
+    for err in drone.flush_writes():
+        if err['tag'] is None:
+            logger.error("Bulk write error: {}".format(err['error']))
+        else:
+            write_errors[err['tag']] = err['error']
+    return [(path, None, "Bulk write failed: {}".format(write_errors[path]))
+            if path in write_errors and not error else (path, t_id, error)
+            for path, t_id, error in results]
+
+
+def _chunks(items, n):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == n:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
 class MPVaspDrone(VaspToDbTaskDrone):
+    def __init__(self, **kwargs):
+        # the base drone opens (and throws away) a fresh MongoClient in its
+        # constructor just to set up the task_id counter; do that through the
+        # shared connection registry instead
+        simulate_mode = kwargs.pop('simulate_mode', False)
+        # with stream_dos, the DOS is not parsed with the rest of the
+        # vasprun.xml but streamed straight into GridFS at insertion time
+        self.stream_dos = kwargs.pop('stream_dos', False)
+        # DOS and band structures go into GridFS as compact binary blobs
+        # (see mpworks.db_utils.blobs) unless this is turned off
+        self.binary_blobs = kwargs.pop('binary_blobs', True)
+        # move the ionic steps of each calculation out of the task doc into
+        # trajectory_fs (see mpworks.drones.trajectory)
+        self.offload_trajectories = kwargs.pop('offload_trajectories', False)
+        # if set, task docs are upserted in unordered bulk writes of (up to)
+        # this many docs instead of one by one; see flush_writes()
+        self.bulk_batch_size = kwargs.pop('bulk_batch_size', None)
+        self.bulk_flush_interval = kwargs.pop('bulk_flush_interval', 30)
+        # number of task_ids reserved per round trip to the counter; 1 keeps
+        # them strictly sequential (see mpworks.db_utils.id_allocator)
+        self.id_block_size = kwargs.pop('id_block_size', 1)
+        # per-phase wall-clock times of each assimilation go into
+        # analysis.timing (record_timing) and/or are appended as JSON lines
+        # to timing_log; see mpworks.drones.timing
+        self.record_timing = kwargs.pop('record_timing', False)
+        self.timing_log = kwargs.pop('timing_log', None)
+        # size, mtime and hash of the parsed files of each launch dir go
+        # into the task doc as "fingerprint" (see mpworks.drones.fingerprint),
+        # for reparse_tasks to skip the dirs that did not change
+        self.record_fingerprint = kwargs.pop('record_fingerprint', False)
+        # the new SNL of a relaxation goes into the SNL queue, to be grouped
+        # (and backfilled into the task doc) by a grouping worker, instead of
+        # being added under the SNL db lock right away; see
+        # mpworks.snl_utils.snl_queue
+        self.defer_snl = kwargs.pop('defer_snl', False)
+        # partial mode: assimilate() only recomputes these PARTIAL_FIELDS of
+        # the existing task doc of a dir and $sets them, leaving the rest of
+        # the doc (and GridFS) alone; see reparse_fields()
+        self.partial_fields = kwargs.pop('partial_fields', None)
+        for field in self.partial_fields or []:
+            if field not in PARTIAL_FIELDS:
+                raise ValueError('Cannot reparse {}, only {}'.format(
+                    field, ', '.join(sorted(PARTIAL_FIELDS))))
+        super(MPVaspDrone, self).__init__(simulate_mode=True, **kwargs)
+        self.simulate = simulate_mode
+        if not self.simulate and \
+                (self.host, self.port, self.database) not in _initialized_dbs:
+            db = self._get_db()
+            if db.counter.find_one({"_id": "taskid"}) is None:
+                db.counter.insert_one({"_id": "taskid", "c": 1})
+            for fs_name in ["dos_fs", "band_structure_fs", TRAJECTORY_FS]:
+                ensure_blob_indexes(db, fs_name)
+            _initialized_dbs.add((self.host, self.port, self.database))
+
+    def _get_db(self):
+        return get_database(self.host, self.port, self.database, self.user,
+                            self.password)
+
+    @property
+    def parse_cache(self):
+        if not hasattr(self, '_parse_cache'):
+            self._parse_cache = ParseCache()
+        return self._parse_cache
+
+    @property
+    def bulk_writer(self):
+        if not hasattr(self, '_bulk_writer'):
+            self._bulk_writer = BulkUpsertWriter(
+                self._get_db()[self.collection], self.bulk_batch_size,
+                self.bulk_flush_interval)
+        return self._bulk_writer
+
+    def flush_writes(self):
+        """
+        Write out the task docs buffered in bulk mode (bulk_batch_size).
+
+        :return: list of {'tag': path, 'error': ...} for the docs that could
+            not be written since the last flush_writes()
+        """
+        if not hasattr(self, '_bulk_writer'):
+            return []
+        self._bulk_writer.flush()
+        errors = self._bulk_writer.errors
+        self._bulk_writer.errors = []
+        return errors
+
+    def __getstate__(self):
+        # never ship parsed outputs (or buffered writes) to other processes
+        state = dict(self.__dict__)
+        state.pop('_parse_cache', None)
+        state.pop('_bulk_writer', None)
+        state.pop('_timer', None)
+        return state
+
+    def process_vasprun(self, dir_name, taskname, filename):
+        """
+        Same as the base drone, except that the Vasprun is shared through the
+        parse cache, so the band structure extraction in assimilate() does
+        not need to parse the vasprun.xml a second time.
+
+        In stream_dos mode, the DOS is left out of the parse and only the
+        vasprun.xml it comes from is recorded (as "_dos_file"); assimilate()
+        streams it into GridFS.
+        """
+        vasprun_file = os.path.join(dir_name, filename)
+        parse_projected_eigen = getattr(self, 'parse_projected_eigen', False)
+        if parse_projected_eigen and (parse_projected_eigen != 'final' or
+                                      taskname == self.runs[-1]):
+            parse_projected_eigen = True
+        else:
+            parse_projected_eigen = False
+        parse_dos = self.parse_dos and (self.parse_dos != 'final' or
+                                        taskname == self.runs[-1])
+        stream_dos = parse_dos and self.stream_dos and self.binary_blobs
+        r = self.parse_cache.vasprun(vasprun_file,
+                                     parse_projected_eigen=parse_projected_eigen,
+                                     parse_dos=not stream_dos)
+        d = r.as_dict()
+        d["dir_name"] = os.path.abspath(dir_name)
+        d["completed_at"] = \
+            str(datetime.datetime.fromtimestamp(os.path.getmtime(
+                vasprun_file)))
+        d["cif"] = str(CifWriter(r.final_structure))
+        d["density"] = r.final_structure.density
+        if stream_dos:
+            d["_dos_file"] = vasprun_file
+        elif parse_dos:
+            try:
+                d["dos"] = r.complete_dos.as_dict()
+            except Exception:
+                logger.warn("No valid dos data exist in {}.\n Skipping dos"
+                            .format(dir_name))
+        if taskname == "relax1" or taskname == "relax2":
+            d["task"] = {"type": "aflow", "name": taskname}
+        else:
+            d["task"] = {"type": taskname, "name": taskname}
+        d["oxide_type"] = oxide_type(r.final_structure)
+        return d
+
     def assimilate(self, path, launches_coll=None):
         """
         Parses vasp runs. Then insert the result into the db. and return the
@@ -56,10 +301,222 @@ class MPVaspDrone(VaspToDbTaskDrone):
             If in simulate_mode, the entire doc is returned for debugging
             purposes. Else, only the task_id of the inserted doc is returned.
         """
+        # every output file is parsed at most once per assimilation; drop the
+        # parsed objects as soon as we are done with this directory
+        timer = self._timer = PhaseTimer()
+        t_id, d, ok = None, {}, False
+        try:
+            t_id, d = self._assimilate(path, launches_coll)
+            ok = True
+            return t_id, d
+        finally:
+            self.parse_cache.clear()
+            self._timer = None
+            if self.timing_log:
+                TimingLog(self.timing_log).write(
+                    timer.as_dict(), path=path, task_id=t_id,
+                    task_type=d.get('task_type'), failed=not ok)
+
+    def _phase(self, name):
+        # times a phase of the current assimilation (see PhaseTimer)
+        timer = getattr(self, '_timer', None)
+        return timer.phase(name) if timer else null_phase()
+
+    def post_process(self, dir_name, d):
+        with self._phase('post_process'):
+            super(MPVaspDrone, self).post_process(dir_name, d)
+            # a Vasprun parsed without its DOS (stream_dos) has no Fermi
+            # level; until the streamed DOS gives the exact one at insertion,
+            # take the one of the OUTCAR
+            for calc in d.get("calculations", []):
+                if "_dos_file" in calc and \
+                        calc["output"].get("efermi") is None:
+                    calc["output"]["efermi"] = \
+                        calc["output"].get("outcar", {}).get("efermi")
+
+    def _assimilate(self, path, launches_coll=None):
+        # an archived launch dir is parsed from a temporary copy of the files
+        # the drone reads (the parsers of the base drone only read real
+        # files); the doc still refers to the launch dir itself
+        with extracted(path, is_drone_file) as parse_dir:
+            if self.partial_fields:
+                return self.reparse_fields(path, parse_dir)
+            return self._assimilate_dir(path, parse_dir, launches_coll)
+
+    def reparse_fields(self, path, parse_dir=None):
+        """
+        Recompute the partial_fields of the existing task doc of path and
+        $set only those (a field that does not apply to the task, e.g.
+        run_stats of a static run, is left alone). Setting
+        analysis.errors_MP also sets "state" as a full parse would: "error"
+        if there are critical signals in a successful run, and back to
+        "successful" if a run marked "error" no longer has any. The other
+        fields are then computed with that state.
+
+        :param parse_dir: where the files of path can be read (see
+            _assimilate()); defaults to path
+        :return: (task_id, the $set updates)
+        """
+        parse_dir = parse_dir if parse_dir else path
+        fields = set(['task_id'])
+        for field in self.partial_fields:
+            fields.update(PARTIAL_FIELDS[field])
+        coll = self._get_db()[self.collection]
+        dir_name = get_block_part(os.path.abspath(path))
+        with self._phase('find_existing'):
+            doc = coll.find_one({"dir_name": dir_name},
+                                dict.fromkeys(fields, 1))
+        if doc is None:
+            raise ValueError('No task doc for {}'.format(path))
+
+        updates = {}
+        # errors_MP first, for the state it sets
+        for field in sorted(self.partial_fields,
+                            key=lambda f: f != 'analysis.errors_MP'):
+            with self._phase(field):
+                if field == 'run_stats':
+                    if "optimize structure" in doc['task_type'] and \
+                            os.path.exists(os.path.join(parse_dir, "relax2")):
+                        updates['run_stats'] = self.get_run_stats(parse_dir,
+                                                                  path)
+                elif field == 'analysis.bandgap':
+                    updates.update(self.get_bandgap_updates(parse_dir, doc))
+                elif field == 'analysis.errors_MP':
+                    # a full parse starts from the state of the base drone
+                    # and sets "error" on critical signals; nothing else
+                    # sets "error", and only on successful runs
+                    state = "successful" if doc['state'] == "error" \
+                        else doc['state']
+                    vasp_signals = self.get_errors_MP(parse_dir,
+                                                      dict(doc, state=state),
+                                                      path)
+                    updates['analysis.errors_MP'] = vasp_signals
+                    if vasp_signals['num_critical'] > 0 and \
+                            state == "successful":
+                        state = "error"
+                    if state != doc['state']:
+                        updates['state'] = doc['state'] = state
+                elif field == 'is_compatible':
+                    updates['is_compatible'] = get_is_compatible(doc)
+                elif field == 'task_id_deprecated':
+                    updates['task_id_deprecated'] = \
+                        int(doc['task_id'].split('-')[-1])
+        updates = _relocate(updates, parse_dir, path)
+
+        if updates and not self.simulate:
+            with self._phase('update'):
+                if self.bulk_batch_size:
+                    self.bulk_writer.update({"dir_name": dir_name},
+                                            {'$set': updates}, tag=path)
+                else:
+                    coll.update_one({"dir_name": dir_name},
+                                    {'$set': updates})
+        logger.info("Reparsed {} of {} (taskid = {})".format(
+            ', '.join(sorted(updates)), dir_name, doc["task_id"]))
+        return doc["task_id"], updates
+
+    def get_run_stats(self, parse_dir, path, calculations=None):
+        """
+        The run_stats of a two step relaxation, from the OUTCARs in its
+        relax1 and relax2 subdirs.
 
-        d = self.get_task_doc(path)
+        The run_stats are always read from the head and tail of the OUTCARs
+        only, so that they are the same for a full parse and a reparse of
+        the run_stats field.
+
+        :param calculations: if given, the outcar subdocs of these (the
+            calculations of the task doc) are overridden as well, which does
+            need a full parse of the OUTCARs.
+        """
+        run_stats = {}
+        try:
+            for i in [1, 2]:
+                o_path = os.path.join(parse_dir, "relax" + str(i), "OUTCAR")
+                o_path = o_path if os.path.exists(o_path) else o_path + ".gz"
+                if calculations is not None:
+                    outcar = self.parse_cache.outcar(o_path)
+                    calculations[i - 1]["output"]["outcar"] = outcar.as_dict()
+                run_stats["relax" + str(i)] = get_outcar_run_stats(o_path)
+        except:
+            logger.error("Bad OUTCAR for {}.".format(path))
+
+        try:
+            overall_run_stats = {}
+            for key in ["Total CPU time used (sec)", "User time (sec)",
+                        "System time (sec)", "Elapsed time (sec)"]:
+                overall_run_stats[key] = sum([v[key]
+                                              for v in run_stats.values()])
+            run_stats["overall"] = overall_run_stats
+        except:
+            logger.error("Bad run stats for {}.".format(path))
+
+        return run_stats
+
+    def get_bandgap_updates(self, parse_dir, doc):
+        """
+        The $set updates of the band gap, vbm, cbm and is_gap_direct of a
+        task doc: from the band structure for successful band structure and
+        Uniform runs (as in a full parse), else from the eigenvalues of the
+        last vasprun.xml.
+        """
+        if ('band structure' in doc['task_type'] or
+                "Uniform" in doc['task_type']) and \
+                doc['state'] == 'successful':
+            efermi = doc['calculations'][0]['output']['outcar']['efermi']
+            bs = self.get_band_structure(
+                parse_dir, efermi,
+                line_mode='band structure' in doc['task_type'])
+            gap = bs.get_band_gap()
+            values = {'bandgap': gap['energy'], 'vbm': bs.get_vbm()['energy'],
+                      'cbm': bs.get_cbm()['energy'],
+                      'is_gap_direct': gap['direct']}
+            calc_idx = 0
+        else:
+            vasprun_file = self.get_last_vasprun_file(parse_dir)
+            if not vasprun_file:
+                return {}
+            gap, cbm, vbm, is_direct = self.parse_cache.vasprun(
+                vasprun_file, parse_dos=False).eigenvalue_band_properties
+            values = {'bandgap': gap, 'vbm': vbm, 'cbm': cbm,
+                      'is_gap_direct': is_direct}
+            calc_idx = len(doc.get('calculations', [])) - 1
+        updates = {}
+        for k, v in values.items():
+            updates['analysis.' + k] = v
+            if calc_idx >= 0:
+                updates['calculations.{}.output.{}'.format(calc_idx, k)] = v
+        return updates
+
+    def get_last_vasprun_file(self, parse_dir):
+        """
+        The vasprun.xml of the last run in parse_dir (found like the base
+        drone finds the runs of a dir), or None.
+        """
+        manifest = DirManifest(parse_dir)
+        for r in reversed(self.runs):
+            if manifest.exists(r):
+                found = manifest.subdir(r).glob("vasprun.xml*") \
+                    if manifest.isdir(r) else []
+            else:
+                found = manifest.glob("vasprun.xml.{}*".format(r))
+            if found:
+                return found[0]
+        found = manifest.glob("vasprun.xml*")
+        return found[0] if found else None
+
+    def _assimilate_dir(self, path, parse_dir, launches_coll=None):
+        fingerprint = None
+        if self.record_fingerprint:
+            with self._phase('fingerprint'):
+                fingerprint = get_fingerprint(path, DRONE_VERSION)
+        with self._phase('parse'):
+            d = self.get_task_doc(parse_dir)
+        if parse_dir != path:
+            d = _relocate(d, parse_dir, path)
         if self.additional_fields:
             d.update(self.additional_fields)  # always add additional fields, even for failed jobs
+        if fingerprint:
+            d["fingerprint"] = fingerprint
 
         try:
             d["dir_name_full"] = d["dir_name"].split(":")[1]
@@ -72,37 +529,53 @@ class MPVaspDrone(VaspToDbTaskDrone):
             raise ValueError('IMPROPER PARSING OF {}'.format(path))
 
         if not self.simulate:
-            # Perform actual insertion into db. Because db connections cannot
-            # be pickled, every insertion needs to create a new connection
-            # to the db.
-            conn = MongoClient(self.host, self.port)
-            db = conn[self.database]
-            if self.user:
-                db.authenticate(self.user, self.password)
+            # Perform actual insertion into db. db connections cannot be
+            # pickled, so they are not kept on the drone; the registry hands
+            # out one shared connection per process instead.
+            db = self._get_db()
             coll = db[self.collection]
 
             # Insert dos data into gridfs and then remove it from the dict.
             # DOS data tends to be above the 4Mb limit for mongo docs. A ref
             # to the dos file is in the dos_fs_id.
-            result = coll.find_one({"dir_name": d["dir_name"]})
+            # when updating, only the task_id of the existing doc is needed
+            with self._phase('find_existing'):
+                result = coll.find_one({"dir_name": d["dir_name"]},
+                                       {"task_id": 1} if self.update_duplicates
+                                       else None)
 
             if result is None or self.update_duplicates:
-                if self.parse_dos and "calculations" in d:
-                    for calc in d["calculations"]:
-                        if "dos" in calc:
-                            dos = json.dumps(calc["dos"], cls=MontyEncoder)
-                            fs = gridfs.GridFS(db, "dos_fs")
-                            dosid = fs.put(dos)
-                            calc["dos_fs_id"] = dosid
-                            del calc["dos"]
+                with self._phase('gridfs'):
+                    if self.parse_dos and "calculations" in d:
+                        for calc in d["calculations"]:
+                            if "dos" in calc:
+                                fs = gridfs.GridFS(db, "dos_fs")
+                                dosid = self.put_blob(fs, calc["dos"], 'dos')
+                                calc["dos_fs_id"] = dosid
+                                del calc["dos"]
+                            elif "_dos_file" in calc:
+                                dosid, efermi = self.put_dos_stream(
+                                    db, calc.pop("_dos_file"),
+                                    calc["output"]["crystal"])
+                                calc["dos_fs_id"] = dosid
+                                if efermi is not None:
+                                    calc["output"]["efermi"] = efermi
+
+                    if self.offload_trajectories and "calculations" in d:
+                        fs = gridfs.GridFS(db, TRAJECTORY_FS)
+                        for calc in d["calculations"]:
+                            ionic_steps = calc["output"].get("ionic_steps")
+                            if ionic_steps:
+                                calc["output"]["ionic_steps_fs_id"] = \
+                                    put_trajectory(fs, ionic_steps)
+                                del calc["output"]["ionic_steps"]
 
                 d["last_updated"] = datetime.datetime.today()
                 if result is None:
                     if ("task_id" not in d) or (not d["task_id"]):
-                        d["task_id"] = "mp-{}".format(
-                            db.counter.find_one_and_update(
-                                {"_id": "taskid"}, {"$inc": {"c": 1}}
-                            )["c"])
+                        d["task_id"] = "mp-{}".format(get_allocator(
+                            db.counter, "c", {"_id": "taskid"},
+                            self.id_block_size).next_id())
                     logger.info("Inserting {} with taskid = {}"
                                 .format(d["dir_name"], d["task_id"]))
                 elif self.update_duplicates:
@@ -112,7 +585,8 @@ class MPVaspDrone(VaspToDbTaskDrone):
 
                 # Fireworks processing
 
-                self.process_fw(path, d)
+                with self._phase('process_fw'):
+                    self.process_fw(parse_dir, d, path)
 
                 try:
                     # Add oxide_type
@@ -123,56 +597,19 @@ class MPVaspDrone(VaspToDbTaskDrone):
                     d["oxide_type"] = None
 
                 # Override incorrect outcar subdocs for two step relaxations
-                if "optimize structure" in d['task_type'] and \
-                        os.path.exists(os.path.join(path, "relax2")):
-                    try:
-                        run_stats = {}
-                        for i in [1, 2]:
-                            o_path = os.path.join(path, "relax" + str(i), "OUTCAR")
-                            o_path = o_path if os.path.exists(o_path) else o_path + ".gz"
-                            outcar = Outcar(o_path)
-                            d["calculations"][i - 1]["output"]["outcar"] = outcar.as_dict()
-                            run_stats["relax" + str(i)] = outcar.run_stats
-                    except:
-                        logger.error("Bad OUTCAR for {}.".format(path))
-
-                    try:
-                        overall_run_stats = {}
-                        for key in ["Total CPU time used (sec)", "User time (sec)",
-                                    "System time (sec)", "Elapsed time (sec)"]:
-                            overall_run_stats[key] = sum([v[key]
-                                                          for v in run_stats.values()])
-                        run_stats["overall"] = overall_run_stats
-                    except:
-                        logger.error("Bad run stats for {}.".format(path))
-
-                    d["run_stats"] = run_stats
+                with self._phase('outcar_override'):
+                    if "optimize structure" in d['task_type'] and \
+                            os.path.exists(os.path.join(parse_dir, "relax2")):
+                        d["run_stats"] = self.get_run_stats(
+                            parse_dir, path, d["calculations"])
 
                 # add is_compatible
-                mpc = MaterialsProjectCompatibility("Advanced")
-
-                try:
-                    func = d["pseudo_potential"]["functional"]
-                    labels = d["pseudo_potential"]["labels"]
-                    symbols = ["{} {}".format(func, label) for label in labels]
-                    parameters = {"run_type": d["run_type"],
-                                  "is_hubbard": d["is_hubbard"],
-                                  "hubbards": d["hubbards"],
-                                  "potcar_symbols": symbols}
-                    entry = ComputedEntry(Composition(d["unit_cell_formula"]),
-                                          0.0, 0.0, parameters=parameters,
-                                          entry_id=d["task_id"])
-
-                    d['is_compatible'] = bool(mpc.process_entry(entry))
-                except:
-                    traceback.print_exc()
-                    print 'ERROR in getting compatibility'
-                    d['is_compatible'] = None
+                with self._phase('compatibility'):
+                    d['is_compatible'] = get_is_compatible(d)
 
                 # task_type dependent processing
                 if 'static' in d['task_type']:
-                    launch_doc = launches_coll.find_one({"fw_id": d['fw_id'], "launch_dir": {
-                                                        "$regex": d["dir_name"]}}, {"action.stored_data": 1})
+                    launch_doc = self.get_launch_doc(launches_coll, d['fw_id'], d["dir_name"])
                     for i in ["conventional_standard_structure", "symmetry_operations",
                               "symmetry_dataset", "refined_structure"]:
                         try:
@@ -183,9 +620,8 @@ class MPVaspDrone(VaspToDbTaskDrone):
                 # parse band structure if necessary
                 if ('band structure' in d['task_type'] or "Uniform" in d['task_type'])\
                         and d['state'] == 'successful':
-                    launch_doc = launches_coll.find_one({"fw_id": d['fw_id'], "launch_dir": {"$regex": d["dir_name"]}},
-                                                        {"action.stored_data": 1})
-                    vasp_run = Vasprun(zpath(os.path.join(path, "vasprun.xml")), parse_projected_eigen=False)
+                    launch_doc = self.get_launch_doc(launches_coll, d['fw_id'], d["dir_name"])
+                    efermi = d['calculations'][0]['output']['outcar']['efermi']
 
                     if 'band structure' in d['task_type']:
                         def string_to_numlist(stringlist):
@@ -198,15 +634,13 @@ class MPVaspDrone(VaspToDbTaskDrone):
                         for i in kpoints_doc:
                             if isinstance(kpoints_doc[i], str):
                                 kpoints_doc[i] = string_to_numlist(kpoints_doc[i])
-                        bs = vasp_run.get_band_structure(efermi=d['calculations'][0]['output']['outcar']['efermi'],
-                                                         line_mode=True)
+                        bs = self.get_band_structure(parse_dir, efermi, line_mode=True)
                     else:
-                        bs = vasp_run.get_band_structure(efermi=d['calculations'][0]['output']['outcar']['efermi'],
-                                                         line_mode=False)
-                    bs_json = json.dumps(bs.as_dict(), cls=MontyEncoder)
-                    fs = gridfs.GridFS(db, "band_structure_fs")
-                    bs_id = fs.put(bs_json)
-                    d['calculations'][0]["band_structure_fs_id"] = bs_id
+                        bs = self.get_band_structure(parse_dir, efermi, line_mode=False)
+                    with self._phase('gridfs'):
+                        fs = gridfs.GridFS(db, "band_structure_fs")
+                        bs_id = self.put_blob(fs, bs.as_dict(), 'band_structure')
+                        d['calculations'][0]["band_structure_fs_id"] = bs_id
 
                     # also override band gap in task doc
                     gap = bs.get_band_gap()
@@ -217,7 +651,20 @@ class MPVaspDrone(VaspToDbTaskDrone):
                     d['analysis'].update(update_doc)
                     d['calculations'][0]['output'].update(update_doc)
 
-                coll.update_one({"dir_name": d["dir_name"]}, {'$set': d}, upsert=True)
+                if self.record_timing:
+                    # everything but the upsert itself
+                    d.setdefault('analysis', {})['timing'] = \
+                        self._timer.as_dict()
+
+                if parse_dir != path:
+                    d = _relocate(d, parse_dir, path)
+
+                with self._phase('upsert'):
+                    if self.bulk_batch_size:
+                        self.bulk_writer.upsert({"dir_name": d["dir_name"]},
+                                                {'$set': d}, tag=path)
+                    else:
+                        coll.update_one({"dir_name": d["dir_name"]}, {'$set': d}, upsert=True)
 
                 return d["task_id"], d
             else:
@@ -230,7 +677,164 @@ class MPVaspDrone(VaspToDbTaskDrone):
                         .format(d["dir_name"], d["task_id"]))
             return 0, d
 
-    def process_fw(self, dir_name, d):
+    @staticmethod
+    def is_unchanged(path, fingerprint):
+        """
+        Whether assimilating path again would be a no-op: its files still
+        match the fingerprint stored in its task doc, and that doc was made
+        by the current DRONE_VERSION.
+
+        :param fingerprint: the "fingerprint" of the task doc (may be None)
+        """
+        return is_unchanged(path, fingerprint, DRONE_VERSION)
+
+    @staticmethod
+    def get_launch_doc(launches_coll, fw_id, dir_name):
+        """
+        The stored_data of the launch of fw_id that ran in dir_name (see
+        wf_utils.find_launch()).
+        """
+        return find_launch(launches_coll, fw_id, dir_name,
+                           ["action.stored_data"])
+
+    def put_dos_stream(self, db, vasprun_file, structure):
+        """
+        Stream the DOS of vasprun_file into the dos_fs GridFS without ever
+        holding the whole CompleteDos (or its JSON) in memory. If the
+        streaming reader cannot handle the file, falls back to the full
+        parse.
+
+        :return: (the dos_fs id, the Fermi level of the DOS), or (None,
+            None) if there is no valid DOS
+        """
+        fs = gridfs.GridFS(db, "dos_fs")
+        try:
+            return stream_dos_to_gridfs(vasprun_file, structure, fs)
+        except Exception:
+            logger.warn("Could not stream the dos of {}, parsing it in full"
+                        .format(vasprun_file))
+        try:
+            dos = self.parse_cache.vasprun(vasprun_file).complete_dos
+        except Exception:
+            logger.warn("No valid dos data exist in {}.\n Skipping dos"
+                        .format(vasprun_file))
+            return None, None
+        return self.put_blob(fs, dos.as_dict(), 'dos'), dos.efermi
+
+    def put_blob(self, fs, d, kind):
+        """
+        Put d (a DOS or band structure dict) into fs, as a binary blob or, if
+        binary_blobs is off, as JSON. Either way, a blob with the same
+        content that is already in fs (e.g. when reparsing) is reused.
+        """
+        if self.binary_blobs:
+            return put_blob(fs, d, kind)
+        return put_content(fs, json.dumps(d, cls=MontyEncoder,
+                                          sort_keys=True), kind)
+
+    def get_band_structure(self, path, efermi, line_mode=False):
+        """
+        Band structure of the run in path. Reuses the Vasprun of this
+        assimilation if one was already parsed (the base drone parses it for
+        the calculations of a full assimilation), otherwise streams just the
+        eigenvalues out of the vasprun.xml instead of building a full DOM.
+        """
+        with self._phase('band_structure'):
+            vasprun_file = zpath(os.path.join(path, "vasprun.xml"))
+            vasp_run = self.parse_cache.get_vasprun(vasprun_file)
+            if not vasp_run:
+                try:
+                    return stream_band_structure(vasprun_file, efermi=efermi,
+                                                 line_mode=line_mode)
+                except Exception:
+                    logger.warning("Streaming band structure read failed "
+                                   "for {}, falling back to Vasprun:\n{}"
+                                   .format(vasprun_file,
+                                           traceback.format_exc()))
+                vasp_run = self.parse_cache.vasprun(vasprun_file,
+                                                    parse_dos=False)
+            return vasp_run.get_band_structure(efermi=efermi,
+                                               line_mode=line_mode)
+
+    def iter_assimilate(self, paths, nproc=None, chunksize=1,
+                        launches_coll=None):
+        """
+        Assimilate many launch directories over a pool of worker processes.
+        Each worker keeps a single db connection (and LaunchPad) for all the
+        directories it processes.
+
+        :param paths: list or iterable (e.g. a generator) of launch dirs
+        :param nproc: number of worker processes; defaults to the number of
+            CPUs. With nproc=1 everything runs in the current process.
+        :param chunksize: number of dirs handed to a worker at a time
+        :param launches_coll: launches collection, only used with nproc=1
+            (collections cannot be sent to worker processes)
+        :return: generator of (path, task_id, error) tuples, in the same
+            order as paths. error is None on success, else the traceback.
+
+        With bulk_batch_size set, dirs are handed out bulk_batch_size at a
+        time and a result is only yielded once its doc has been written.
+        """
+        nproc = nproc if nproc else multiprocessing.cpu_count()
+        if self.bulk_batch_size:
+            func, items = _assimilate_chunk, _chunks(paths,
+                                                     self.bulk_batch_size)
+            chunksize = 1
+        else:
+            func, items = _assimilate_one, paths
+
+        if nproc == 1:
+            for item in items:
+                result = func(item, self, launches_coll)
+                for r in result if self.bulk_batch_size else [result]:
+                    yield r
+            return
+
+        pool = multiprocessing.Pool(nproc, initializer=_init_batch_worker,
+                                    initargs=(self,))
+        try:
+            for result in pool.imap(func, items, chunksize):
+                for r in result if self.bulk_batch_size else [result]:
+                    yield r
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def assimilate_batch(self, paths, nproc=None, chunksize=1,
+                         launches_coll=None, manifest_file=None):
+        """
+        Batch version of assimilate(); see iter_assimilate() for the
+        parameters.
+
+        :param manifest_file: if set, the failures are also written to this
+            file as JSON, so that they can be inspected or retried later
+        :return: (results, failures), where results is a list of
+            (path, task_id) for the successful dirs in the order of paths,
+            and failures is a list of {'path': ..., 'error': ...} dicts
+        """
+        results = []
+        failures = []
+        for path, t_id, error in self.iter_assimilate(paths, nproc, chunksize,
+                                                      launches_coll):
+            if error:
+                logger.error("FAILED to assimilate {}:\n{}".format(path, error))
+                failures.append({'path': path, 'error': error})
+            else:
+                logger.info("Assimilated {} as {}".format(path, t_id))
+                results.append((path, t_id))
+
+        logger.info("Batch assimilation done: {} succeeded, {} failed"
+                    .format(len(results), len(failures)))
+        if manifest_file:
+            with open(manifest_file, 'w') as f:
+                json.dump(failures, f, indent=4)
+
+        return results, failures
+
+    def process_fw(self, dir_name, d, launch_dir=None):
         d["task_id_deprecated"] = int(d["task_id"].split('-')[-1])  # useful for WC and AJ
 
         # update the run fields to give species group in root, if exists
@@ -243,7 +847,11 @@ class MPVaspDrone(VaspToDbTaskDrone):
         with zopen(zpath(os.path.join(dir_name, 'FW.json'))) as f:
             fw_dict = json.load(f)
             d['fw_id'] = fw_dict['fw_id']
-            d['snl'] = fw_dict['spec']['mpsnl']
+            if 'mpsnl' in fw_dict['spec']:
+                d['snl'] = fw_dict['spec']['mpsnl']
+            else:
+                # handed over by reference (compact update_spec)
+                d['snl'] = get_ref_field(fw_dict['spec']['task_id'], 'mpsnl')
             d['snlgroup_id'] = fw_dict['spec']['snlgroup_id']
             d['vaspinputset_name'] = fw_dict['spec'].get('vaspinputset_name')
             d['task_type'] = fw_dict['spec']['task_type']
@@ -267,31 +875,52 @@ class MPVaspDrone(VaspToDbTaskDrone):
                                           old_snl.references, old_snl.remarks,
                                           old_snl.data, history)
 
-                    # enter new SNL into SNL db
-                    # get the SNL mongo adapter
-                    sma = SNLMongoAdapter.auto_load()
-
-                    # add snl
-                    mpsnl, snlgroup_id, spec_group = sma.add_snl(new_snl, snlgroup_guess=d['snlgroup_id'])
-                    d['snl_final'] = mpsnl.as_dict()
-                    d['snlgroup_id_final'] = snlgroup_id
-                    d['snlgroup_changed'] = (d['snlgroup_id'] !=
-                                             d['snlgroup_id_final'])
+                    if self.defer_snl:
+                        with self._phase('snl_registration'):
+                            SNLQueue.auto_load().enqueue(
+                                d['task_id'], new_snl,
+                                snlgroup_guess=d['snlgroup_id'])
+                        d['snl_final_pending'] = True
+                    else:
+                        # enter new SNL into SNL db
+                        # get the SNL mongo adapter
+                        with self._phase('snl_registration'):
+                            sma = SNLMongoAdapter.auto_load()
+
+                            # add snl
+                            mpsnl, snlgroup_id, spec_group = sma.add_snl(new_snl, snlgroup_guess=d['snlgroup_id'])
+                            d['snl_final'] = mpsnl.as_dict()
+                            d['snlgroup_id_final'] = snlgroup_id
+                            d['snlgroup_changed'] = (d['snlgroup_id'] !=
+                                                     d['snlgroup_id_final'])
                 else:
                     d['snl_final'] = d['snl']
                     d['snlgroup_id_final'] = d['snlgroup_id']
                     d['snlgroup_changed'] = False
 
         # custom processing for detecting errors
-        new_style = os.path.exists(zpath(os.path.join(dir_name, 'FW.json')))
-        vasp_signals = {}
-        critical_errors = ["INPUTS_DONT_EXIST",
-                           "OUTPUTS_DONT_EXIST", "INCOHERENT_POTCARS",
-                           "VASP_HASNT_STARTED", "VASP_HASNT_COMPLETED",
-                           "CHARGE_UNCONVERGED", "NETWORK_QUIESCED",
-                           "HARD_KILLED", "WALLTIME_EXCEEDED",
-                           "ATOMS_TOO_CLOSE", "DISK_SPACE_EXCEEDED", "NO_RELAX2", "POSITIVE_ENERGY"]
+        vasp_signals = self.get_errors_MP(dir_name, d, launch_dir)
+        if vasp_signals['num_critical'] > 0 and d['state'] == "successful":
+            d["state"] = "error"
+
+        d['analysis'] = d.get('analysis', {})
+        d['analysis']['errors_MP'] = vasp_signals
+
+    def get_errors_MP(self, dir_name, d, launch_dir=None):
+        """
+        The signals (see mpworks.drones.signals) of the run in dir_name, i.e.
+        the analysis.errors_MP subdoc of its task doc d. Only the
+        "state", "task_type" and "output.final_energy" of d are used.
 
+        :param launch_dir: the launch dir that dir_name is a copy of (see
+            _assimilate()), if it is one; the *.error files of old-style
+            runs are looked up in the dir above it
+        """
+        # everything below looks up the files of dir_name (and of its
+        # relax1/relax2 subdirs) in one listing of it
+        manifest = DirManifest(dir_name)
+        new_style = bool(manifest.zname('FW.json'))
+        vasp_signals = {}
         last_relax_dir = dir_name
 
         if not new_style:
@@ -301,11 +930,11 @@ class MPVaspDrone(VaspToDbTaskDrone):
             # Finally, it gets moved to relax2.
             # There are some weird cases where both the current dir and relax2
             # contain data. The relax2 is good, but the current dir is bad.
-            if is_valid_vasp_dir(os.path.join(dir_name, "relax2")):
+            if is_valid_vasp_dir(os.path.join(dir_name, "relax2"), manifest):
                 last_relax_dir = os.path.join(dir_name, "relax2")
-            elif is_valid_vasp_dir(dir_name):
+            elif is_valid_vasp_dir(dir_name, manifest):
                 pass
-            elif is_valid_vasp_dir(os.path.join(dir_name, "relax1")):
+            elif is_valid_vasp_dir(os.path.join(dir_name, "relax1"), manifest):
                 last_relax_dir = os.path.join(dir_name, "relax1")
 
         vasp_signals['last_relax_dir'] = last_relax_dir
@@ -313,35 +942,47 @@ class MPVaspDrone(VaspToDbTaskDrone):
 
         print "getting signals for dir :{}".format(last_relax_dir)
 
-        sl = SignalDetectorList()
-        sl.append(VASPInputsExistSignal())
-        sl.append(VASPOutputsExistSignal())
-        sl.append(VASPOutSignal())
-        sl.append(HitAMemberSignal())
-        sl.append(SegFaultSignal())
-        sl.append(VASPStartedCompletedSignal())
-
-        if d['state'] == 'successful' and 'optimize structure' in d['task_type']:
-            sl.append(Relax2ExistsSignal())
-
-        signals = sl.detect_all(last_relax_dir)
-
-        signals = signals.union(WallTimeSignal().detect(dir_name))
-        if not new_style:
-            root_dir = os.path.dirname(dir_name)  # one level above dir_name
-            signals = signals.union(WallTimeSignal().detect(root_dir))
-
-        signals = signals.union(DiskSpaceExceededSignal().detect(dir_name))
-        if not new_style:
-            root_dir = os.path.dirname(dir_name)  # one level above dir_name
-            signals = signals.union(DiskSpaceExceededSignal().detect(root_dir))
+        with self._phase('signals'):
+            sl = SignalDetectorList()
+            sl.append(VASPInputsExistSignal())
+            sl.append(VASPOutputsExistSignal())
+            sl.append(VASPOutSignal())
+            sl.append(SchedulerErrorSignal(signals=["HIT_A_MEMBER_FAIL",
+                                                    "SEGFAULT"]))
+            sl.append(VASPStartedCompletedSignal())
+
+            if d['state'] == 'successful' and 'optimize structure' in d['task_type']:
+                sl.append(Relax2ExistsSignal())
+
+            # the *.error files of dir_name (and for old-style runs, of the
+            # dir above it) are checked for walltime and disk space too
+            job_sl = SignalDetectorList([SchedulerErrorSignal(
+                signals=["WALLTIME_EXCEEDED", "DISK_SPACE_EXCEEDED"])])
+            checks = [(sl, last_relax_dir, manifest),
+                      (job_sl, dir_name, manifest)]
+            if not new_style:
+                # one level above the launch dir: for an archived launch dir
+                # this is its block dir, not the parent of the temporary
+                # copy in dir_name (DirManifest and the signals read plain
+                # and archived dirs alike, see launch_archive)
+                root_dir = os.path.dirname(
+                    os.path.abspath(launch_dir or dir_name))
+                checks.append((job_sl, root_dir, DirManifest(root_dir)))
+
+            # every file is scanned once for all the strings looked for in it
+            scanner = TextScanner()
+            for l, m_dir, m in checks:
+                l.prepare(m_dir, m, scanner)
+            signals = set()
+            for l, m_dir, m in checks:
+                signals = signals.union(l.detect_all(m_dir, m, scanner))
 
         if d.get('output', {}).get('final_energy', None) > 0:
             signals.add('POSITIVE_ENERGY')
 
         signals = list(signals)
 
-        critical_signals = [val for val in signals if val in critical_errors]
+        critical_signals = [val for val in signals if val in CRITICAL_SIGNALS]
 
         vasp_signals['signals'] = signals
         vasp_signals['critical_signals'] = critical_signals
@@ -349,8 +990,4 @@ class MPVaspDrone(VaspToDbTaskDrone):
         vasp_signals['num_signals'] = len(signals)
         vasp_signals['num_critical'] = len(critical_signals)
 
-        if len(critical_signals) > 0 and d['state'] == "successful":
-            d["state"] = "error"
-
-        d['analysis'] = d.get('analysis', {})
-        d['analysis']['errors_MP'] = vasp_signals
+        return vasp_signals
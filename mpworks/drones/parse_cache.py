@@ -0,0 +1,61 @@
+import os
+from pymatgen.io.vasp.outputs import Vasprun, Outcar
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+
+class ParseCache(object):
+    """
+    Holds the parsed output objects (Vasprun, Outcar) of a single
+    assimilation, so that the ones that are needed again are not parsed a
+    second time. The cache should be cleared as soon as the assimilation is
+    done; the parsed objects are large.
+
+    Only the last Vasprun is kept: the runs of a dir are processed in order
+    (relax1, relax2) and only the final one is read again (band structure),
+    so the Vasprun of a run is let go once the next one is parsed.
+    """
+
+    def __init__(self):
+        self._cache = {}
+
+    def _get(self, cls, filename, **kwargs):
+        key = (cls.__name__, os.path.realpath(filename),
+               tuple(sorted(kwargs.items())))
+        if key not in self._cache:
+            if cls is Vasprun:
+                # release the previous run before parsing the next one
+                for k in [k for k in self._cache if k[0] == 'Vasprun']:
+                    del self._cache[k]
+            self._cache[key] = cls(filename, **kwargs)
+        return self._cache[key]
+
+    def get_vasprun(self, filename):
+        """
+        A Vasprun of filename that was already parsed (with any options),
+        or None. Never parses anything.
+        """
+        path = os.path.realpath(filename)
+        for (cls_name, f, kwargs), obj in self._cache.items():
+            if cls_name == 'Vasprun' and f == path:
+                return obj
+        return None
+
+    def vasprun(self, filename, parse_projected_eigen=False, parse_dos=True):
+        return self._get(Vasprun, filename,
+                         parse_projected_eigen=parse_projected_eigen,
+                         parse_dos=parse_dos)
+
+    def outcar(self, filename):
+        return self._get(Outcar, filename)
+
+    def clear(self):
+        self._cache.clear()
+
+    def __len__(self):
+        return len(self._cache)
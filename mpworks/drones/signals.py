@@ -1,9 +1,8 @@
-import glob
 import os
-import re
-from monty.io import zopen
-from monty.os.path import zpath
-from mpworks.workflows.wf_utils import last_relax
+from collections import OrderedDict
+from mpworks.drones.dir_manifest import get_manifest
+from mpworks.drones.tail_reader import FileFollower, is_outcar_complete, read_head
+from mpworks.drones.text_scan import StreamScanner, TextScanner, find_patterns
 
 __author__ = 'Anubhav Jain'
 __copyright__ = 'Copyright 2013, The Materials Project'
@@ -14,6 +13,14 @@ __date__ = 'Apr 29, 2013'
 
 # TODO: This is all really ugly...
 
+# All file access goes through mpworks.drones.launch_archive, so that the
+# detectors also work on archived launch dirs. What is in a dir is looked up
+# in its DirManifest (mpworks.drones.dir_manifest); detect_all() lists the dir
+# once for all the detectors. Likewise the strings all the detectors look for
+# in a file are searched for in a single scan of it (a TextScanner, see
+# mpworks.drones.text_scan): detectors register() them in prepare() and
+# find() them in detect().
+
 
 def string_list_in_file(s_list, filename, ignore_case=True):
     #based on Michael's code
@@ -24,30 +31,40 @@ def string_list_in_file(s_list, filename, ignore_case=True):
 
     Returns the strings that matched...
 
-    Note: this is going to be slow as mud for huge files (e.g., OUTCAR)
-    Using grep via subprocess might be better, but has dependency of
-    shell (i.e., non-windows)
-
+    The file is read once, in chunks, and searched for all the strings at
+    once (see mpworks.drones.text_scan.find_patterns()).
     """
-    matches = set()
-    with zopen(filename, 'r') as f:
-        for line in f:
-            for s in s_list:
-                if (ignore_case and s.lower() in line.lower()) or s in line:
-                    matches.add(s)
-                    if len(matches) == len(s_list):
-                        return s_list
+    matches = find_patterns(filename, s_list, ignore_case=ignore_case)
+    if len(matches) == len(set(s_list)):
+        return s_list
 
     return list(matches)
 
+def _exists(manifest, path):
+    # path is in manifest's dir or one of its subdirs (see last_relax())
+    m_dir, name = os.path.split(path)
+    return manifest.manifest_of(m_dir).exists(name)
+
+
+def _getsize(manifest, path):
+    m_dir, name = os.path.split(path)
+    return manifest.manifest_of(m_dir).getsize(name)
+
+
 class SignalDetector(object):
     '''
     A SignalDetector is an abstract class that takes in a directory name and returns a set of Strings.
     Each String represents an error code that was detected during the run
     '''
 
-    def detect(self, dir_name):
+    def prepare(self, dir_name, manifest=None, scanner=None):
+        #registers the strings detect() will look for with the TextScanner
+        pass
+
+    def detect(self, dir_name, manifest=None, scanner=None):
         #returns a set() of signals (Strings)
+        #manifest: a DirManifest of dir_name (or of its parent dir), if there is one
+        #scanner: the TextScanner shared by the detectors, if there is one
         raise NotImplementedError
 
 
@@ -56,10 +73,19 @@ class SignalDetectorList(list):
     Takes in a list of SignalDetectors() and provides a convenience method, detect_all(), that can merge the results of all the SignalDetectors()
     Very basic...
     '''
-    def detect_all(self, dir_name):
+    def prepare(self, dir_name, manifest=None, scanner=None):
+        for detector in self:
+            detector.prepare(dir_name, manifest, scanner)
+
+    def detect_all(self, dir_name, manifest=None, scanner=None):
+        # pass the same scanner to several detect_all() calls (having
+        # prepare()d all of them first) to scan the files they share once
+        manifest = get_manifest(dir_name, manifest)
+        scanner = scanner if scanner else TextScanner()
+        self.prepare(dir_name, manifest, scanner)
         signals = set()
         for detector in self:
-            for signal in detector.detect(dir_name):
+            for signal in detector.detect(dir_name, manifest, scanner):
                 signals.add(signal)
         return signals
 
@@ -86,135 +112,225 @@ class SignalDetectorSimple(SignalDetector):
         self.ignore_nonexistent_file = ignore_nonexistent_file
         self.invert_search = invert_search
 
-    def detect(self, dir_name):
+    def _files(self, dir_name, manifest):
+        manifest = get_manifest(dir_name, manifest)
+        for filename in self.filename_list:
+            if not self.ignore_nonexistent_file or manifest.zname(filename):
+                yield manifest.last_relax(filename)
+
+    def prepare(self, dir_name, manifest=None, scanner=None):
+        if scanner:
+            for f in self._files(dir_name, manifest):
+                scanner.register(f, self.signames_targetstrings.values(), self.ignore_case)
+
+    def detect(self, dir_name, manifest=None, scanner=None):
 
         signals = set()
+        scanner = scanner if scanner else TextScanner()
 
-        for filename in self.filename_list:
+        for f in self._files(dir_name, manifest):
             #find the strings that match in the file
-            if not self.ignore_nonexistent_file or os.path.exists(zpath(os.path.join(dir_name, filename))):
-                f = last_relax(os.path.join(dir_name, filename))
-                errors = string_list_in_file(self.signames_targetstrings.values(), f, ignore_case=self.ignore_case)
-                if self.invert_search:
-                    errors_inverted = [item for item in self.targetstrings_signames.keys() if item not in errors]
-                    errors = errors_inverted
-
-                #add the signal names for those strings
-                for e in errors:
-                    signals.add(self.targetstrings_signames[e])
+            errors = scanner.find(f, self.signames_targetstrings.values(), self.ignore_case)
+            if self.invert_search:
+                errors_inverted = [item for item in self.targetstrings_signames.keys() if item not in errors]
+                errors = errors_inverted
+
+            #add the signal names for those strings
+            for e in errors:
+                signals.add(self.targetstrings_signames[e])
         return signals
 
 
+# the signals that make a run an error (state "error" in the tasks collection)
+CRITICAL_SIGNALS = ["INPUTS_DONT_EXIST",
+                    "OUTPUTS_DONT_EXIST", "INCOHERENT_POTCARS",
+                    "VASP_HASNT_STARTED", "VASP_HASNT_COMPLETED",
+                    "CHARGE_UNCONVERGED", "NETWORK_QUIESCED",
+                    "HARD_KILLED", "WALLTIME_EXCEEDED",
+                    "ATOMS_TOO_CLOSE", "DISK_SPACE_EXCEEDED", "NO_RELAX2", "POSITIVE_ENERGY"]
+
+# the errors VASP prints to vasp.out: {signal: string}
+VASP_OUT_ERRORS = OrderedDict([
+    ("TETRAHEDRON_FAIL", "Tetrahedron method fails for"),
+    ("KPOINT_DETECTION_FAIL", "Fatal error detecting k-mesh"),
+    ("ROTMAT_NONINT", "Found some non-integer element in rotation matrix"),
+    ("TETIRR_FAIL", "Routine TETIRR needs special values"),
+    ("CLASSROTMAT_FAIL", 'Reciprocal lattice and k-lattice belong'),
+    ("KPOINT_SHIFT_FAIL", 'Could not get correct shifts'),
+    ("INVROT_FAIL", "inverse of rotation matrix was not found"),
+    ("BROYDENMIX_FAIL", 'BRMIX: very serious problems'),
+    ("DAVIDSON_FAIL", 'WARNING: Sub-Space-Matrix is not hermitian in DAV'),
+    ## FIXME: this needs to be more specific
+    ("NBANDS_FAIL", 'NBANDS'),
+    ("RSPHER_FAIL", "ERROR RSPHER"),
+    ("ZHEGV_FAIL", "ZHEGV"),
+    ("DENTET_FAIL", "WARNING DENTET"),
+    ("REAL_OPTLAY_FAIL", "REAL_OPTLAY: internal error"),
+    ("ZPOTRF", "LAPACK: Routine ZPOTRF failed"),
+    ("FEXCF", "ERROR FEXCF"),
+    ("NETWORK_QUIESCED", "network quiesced"),
+    ("HARD_KILLED", "exit signals: Killed"),
+    ("INCOHERENT_POTCARS", "You have build up your multi-ion-type POTCAR file out of POTCAR"),
+    ("ATOMS_TOO_CLOSE", "The distance between some ions is very small"),
+    ("STOPCAR_EXISTS", "soft stop encountered"),
+    ("SUBSPACE_PSSYEVX_FAIL", "ERROR in subspace rotation PSSYEVX"),
+    ("LATTICE_TOO_LONG", "One of the lattice vectors is very long")])
+
+
 class VASPOutSignal(SignalDetectorSimple):
 
     def __init__(self):
-        err_code = {}
-        err_code["TETRAHEDRON_FAIL"] = "Tetrahedron method fails for"
-        err_code["KPOINT_DETECTION_FAIL"] = "Fatal error detecting k-mesh"
-        err_code["ROTMAT_NONINT"] = "Found some non-integer element in rotation matrix"
-        err_code["TETIRR_FAIL"] = "Routine TETIRR needs special values"
-        err_code["CLASSROTMAT_FAIL"] = 'Reciprocal lattice and k-lattice belong'
-        err_code["KPOINT_SHIFT_FAIL"] = 'Could not get correct shifts'
-        err_code["INVROT_FAIL"] = "inverse of rotation matrix was not found"
-        err_code["BROYDENMIX_FAIL"] = 'BRMIX: very serious problems'
-        err_code["DAVIDSON_FAIL"] = 'WARNING: Sub-Space-Matrix is not hermitian in DAV'
-        ## FIXME: this needs to be more specific
-        err_code["NBANDS_FAIL"] = 'NBANDS'
-        err_code["RSPHER_FAIL"] = "ERROR RSPHER"
-        err_code["ZHEGV_FAIL"] = "ZHEGV"
-        err_code["DENTET_FAIL"] = "WARNING DENTET"
-        err_code["REAL_OPTLAY_FAIL"] = "REAL_OPTLAY: internal error"
-        err_code["ZPOTRF"] = "LAPACK: Routine ZPOTRF failed"
-        err_code["FEXCF"] = "ERROR FEXCF"
-        err_code["NETWORK_QUIESCED"] = "network quiesced"
-        err_code["HARD_KILLED"] = "exit signals: Killed"
-        err_code["INCOHERENT_POTCARS"] = "You have build up your multi-ion-type POTCAR file out of POTCAR"
-        err_code["ATOMS_TOO_CLOSE"] = "The distance between some ions is very small"
-        err_code["STOPCAR_EXISTS"] = "soft stop encountered"
-        err_code["SUBSPACE_PSSYEVX_FAIL"] = "ERROR in subspace rotation PSSYEVX"
-        err_code["LATTICE_TOO_LONG"] = "One of the lattice vectors is very long"
-        super(VASPOutSignal, self).__init__(err_code, ["vasp.out"])
-
-
-class HitAMemberSignal(SignalDetector):
-    def detect(self, dir_name):
-        # Look for 'hit a member that was already found in another star'
-        # in *.error
-        file_names = glob.glob("%s/*.error" % dir_name)
-        for file_name in file_names:
-            if string_list_in_file(["hit a member that was already found in another star"],
-                                          file_name, ignore_case=True):
-                return set(["HIT_A_MEMBER_FAIL"])
-        return set()
-
-
-class WallTimeSignal(SignalDetector):
-
-    def detect(self, dir_name):
-        # Look for *.error
-        file_names = glob.glob(os.path.join(dir_name, "*.error"))
-        for file_name in file_names:
-            if string_list_in_file(["job killed: walltime", "PBS: job killed"], file_name,
-                                          ignore_case=True):
-                return set(["WALLTIME_EXCEEDED"])
-        return set()
-
-
-class DiskSpaceExceededSignal(SignalDetector):
-
-    def detect(self, dir_name):
-        # Look for *.error
-        file_names = glob.glob(os.path.join(dir_name, "*.error"))
-        for file_name in file_names:
-            if string_list_in_file(["No space left"], file_name,
-                                          ignore_case=True):
-                return set(["DISK_SPACE_EXCEEDED"])
-        return set()
-
-
-class SegFaultSignal(SignalDetector):
-
-    def detect(self, dir_name):
-        """
-        Looks through all *.error files for (fault|segmentation)
-
-        Error in UKY looks like this:
-            'forrtl: severe (174): SIGSEGV, segmentation fault occurred'
-        """
-        file_names = glob.glob("%s/*.error" % dir_name)
-        rx = re.compile(r'segmentation', re.IGNORECASE)
-        for file_name in file_names:
-            with zopen(file_name, 'r') as f:
-                lines = f.readlines()
-                for line in lines:
-                    if rx.search(line) is not None:
-                        return set(["SEGFAULT"])
-        return set()
+        super(VASPOutSignal, self).__init__(dict(VASP_OUT_ERRORS), ["vasp.out"])
 
 
-class VASPInputsExistSignal(SignalDetector):
+class SignalWatcher(object):
+    '''
+    Watches output files while they are being written, for a run in progress:
+    each poll() reads only what was appended to the files since the last one
+    (see mpworks.drones.tail_reader.FileFollower) and looks for the target
+    Strings in it (see mpworks.drones.text_scan.StreamScanner).
+    '''
+    def __init__(self, signames_targetstrings, filename_list, dir_name=None, ignore_case=True):
+        '''
 
-    def detect(self, dir_name):
-        names = [last_relax(os.path.join(dir_name, x)) for x in ['POSCAR', 'INCAR', 'KPOINTS', 'POTCAR']]
-        return set() if all([os.path.exists(file_name) for file_name in names]) and all([os.stat(file_name).st_size > 0 for file_name in names]) else set(["INPUTS_DONT_EXIST"])
+        :param signames_targetstrings: A dictionary of signal names to the target String searched for in the files, as in SignalDetectorSimple
+        :param filename_list: A list of filenames to watch (they need not exist yet)
+        :param dir_name: the dir of the files (default: the current dir at each poll())
+        :param ignore_case: ignore case in target String
+        '''
+        self.signames_targetstrings = signames_targetstrings
+        self.targetstrings_signames = dict([[v, k] for k, v in self.signames_targetstrings.items()])
+        self.filename_list = filename_list
+        self.dir_name = dir_name
+        self.ignore_case = ignore_case
+        self._followers = {}
+        self._scanners = {}
 
+    def poll(self):
+        #returns the set() of signals in the files as they are now; a file
+        #that was replaced or truncated (e.g. by the next job of the run)
+        #only counts with its new content
+        signals = set()
+        for filename in self.filename_list:
+            path = os.path.join(self.dir_name, filename) if self.dir_name else os.path.abspath(filename)
+            follower = self._followers.get(path)
+            if follower is None:
+                follower = self._followers[path] = FileFollower(path)
+            while True:
+                data, restarted = follower.read()
+                if restarted or path not in self._scanners:
+                    self._scanners[path] = StreamScanner(self.signames_targetstrings.values(), self.ignore_case)
+                if not data:
+                    break
+                self._scanners[path].feed(data)
+            for s in self._scanners[path].found:
+                signals.add(self.targetstrings_signames[s])
+        return signals
 
-class VASPOutputsExistSignal(SignalDetector):
 
-    def detect(self, dir_name):
+# the scheduler-level signals: {signal: strings that show it in the stderr
+# (*.error) of the job}
+SCHEDULER_RULES = OrderedDict([
+    ("HIT_A_MEMBER_FAIL", ["hit a member that was already found in another star"]),
+    ("WALLTIME_EXCEEDED", ["job killed: walltime", "PBS: job killed"]),
+    ("DISK_SPACE_EXCEEDED", ["No space left"]),
+    # Error in UKY looks like this:
+    #     'forrtl: severe (174): SIGSEGV, segmentation fault occurred'
+    ("SEGFAULT", ["segmentation"])])
 
-        names = [last_relax(os.path.join(dir_name, x)) for x in ['OUTCAR', 'OSZICAR', 'vasprun.xml', 'vasp.out']]
-        return set() if all([os.path.exists(file_name) for file_name in names]) and os.stat(names[0]).st_size > 0 else set(["OUTPUTS_DONT_EXIST"])
 
+class SchedulerErrorSignal(SignalDetector):
+    '''
+    Evaluates all the SCHEDULER_RULES (or only those of the given signals)
+    over the *.error files of the dir, reading each file once for all of
+    them
+    '''
+    def __init__(self, signals=None):
+        self.rules = OrderedDict([(k, v) for k, v in SCHEDULER_RULES.items()
+                                  if signals is None or k in signals])
+        self.target_strings = sorted(set(t for v in self.rules.values()
+                                         for t in v))
+
+    def _files(self, dir_name, manifest):
+        return get_manifest(dir_name, manifest).glob("*.error")
+
+    def prepare(self, dir_name, manifest=None, scanner=None):
+        if scanner:
+            for file_name in self._files(dir_name, manifest):
+                scanner.register(file_name, self.target_strings)
+
+    def detect(self, dir_name, manifest=None, scanner=None):
+        scanner = scanner if scanner else TextScanner()
+        signals = set()
+        for file_name in self._files(dir_name, manifest):
+            matches = scanner.find(file_name, self.target_strings)
+            for signal, target_strings in self.rules.items():
+                if matches.intersection(target_strings):
+                    signals.add(signal)
+        return signals
+
+
+class HitAMemberSignal(SchedulerErrorSignal):
+    def __init__(self):
+        super(HitAMemberSignal, self).__init__(["HIT_A_MEMBER_FAIL"])
 
-class VASPStartedCompletedSignal(SignalDetectorSimple):
 
+class WallTimeSignal(SchedulerErrorSignal):
     def __init__(self):
-        super(VASPStartedCompletedSignal, self).__init__({"VASP_HASNT_STARTED": "vasp", "VASP_HASNT_COMPLETED": "Voluntary context switches:"}, ["OUTCAR"], invert_search=True)
+        super(WallTimeSignal, self).__init__(["WALLTIME_EXCEEDED"])
+
+
+class DiskSpaceExceededSignal(SchedulerErrorSignal):
+    def __init__(self):
+        super(DiskSpaceExceededSignal, self).__init__(["DISK_SPACE_EXCEEDED"])
+
+
+class SegFaultSignal(SchedulerErrorSignal):
+    def __init__(self):
+        super(SegFaultSignal, self).__init__(["SEGFAULT"])
+
+
+class VASPInputsExistSignal(SignalDetector):
+
+    def detect(self, dir_name, manifest=None, scanner=None):
+        manifest = get_manifest(dir_name, manifest)
+        names = [manifest.last_relax(x) for x in ['POSCAR', 'INCAR', 'KPOINTS', 'POTCAR']]
+        return set() if all([_exists(manifest, file_name) for file_name in names]) and all([_getsize(manifest, file_name) > 0 for file_name in names]) else set(["INPUTS_DONT_EXIST"])
+
+
+class VASPOutputsExistSignal(SignalDetector):
+
+    def detect(self, dir_name, manifest=None, scanner=None):
+        manifest = get_manifest(dir_name, manifest)
+        names = [manifest.last_relax(x) for x in ['OUTCAR', 'OSZICAR', 'vasprun.xml', 'vasp.out']]
+        return set() if all([_exists(manifest, file_name) for file_name in names]) and _getsize(manifest, names[0]) > 0 else set(["OUTPUTS_DONT_EXIST"])
+
+
+class VASPStartedCompletedSignal(SignalDetector):
+    '''
+    VASP writes its version at the top of the OUTCAR and the timing section
+    ending with "Voluntary context switches:" at the bottom, so only the
+    head and the tail of the OUTCAR are read (see mpworks.drones.tail_reader)
+    '''
+
+    def detect(self, dir_name, manifest=None, scanner=None):
+        manifest = get_manifest(dir_name, manifest)
+        if not manifest.zname("OUTCAR"):
+            return set()
+        f = manifest.last_relax("OUTCAR")
+        signals = set()
+        if "vasp" not in read_head(f).lower():
+            # not where it should be; look through the whole file
+            scanner = scanner if scanner else TextScanner()
+            if not scanner.find(f, ["vasp"]):
+                signals.add("VASP_HASNT_STARTED")
+        if not is_outcar_complete(f):
+            signals.add("VASP_HASNT_COMPLETED")
+        return signals
 
 
 class Relax2ExistsSignal(SignalDetector):
 
-    def detect(self, dir_name):
-        f_exists = 'relax2' in last_relax(os.path.join(dir_name, 'vasprun.xml'))
+    def detect(self, dir_name, manifest=None, scanner=None):
+        f_exists = 'relax2' in get_manifest(dir_name, manifest).last_relax('vasprun.xml')
         return set() if f_exists else set(["NO_RELAX2"])
\ No newline at end of file
@@ -0,0 +1,300 @@
+import io
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from gzip import GzipFile
+from mpworks.drones import launch_archive
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Reading only the end of (possibly gzipped or archived) output files.
+
+Whether VASP completed and the final run_stats are both in the last few KB
+of an OUTCAR, which can be GBs. Plain files (and
+archive members stored as is) are read backwards from the end in chunks.
+
+A gzip stream cannot be entered in the middle, so gzipped outputs are written
+"tail-indexed" by write_gzip(): as two gzip members, the bulk of the file and
+its last TAIL_SIZE bytes. That is still one valid .gz file for every reader,
+but the tail member can be found by looking for a gzip header just before
+the end, and decompressed on its own (its CRC tells a real member from a
+chance match). For other .gz files the whole stream is decompressed once,
+keeping only the tail; the tails are cached per process so that the checks
+of one assimilation share that.
+
+FileFollower reads a file that is still being written (vasp.out, OUTCAR
+during a run) a piece at a time, each byte once.
+'''
+
+TAIL_SIZE = 1 << 18
+CHUNK_SIZE = 1 << 16
+
+_GZIP_MAGIC = b'\x1f\x8b\x08'
+_GZIP_EXTENSIONS = ['.gz', '.GZ', '.z', '.Z']
+_BZ2_EXTENSIONS = ['.bz2', '.BZ2']
+
+_CACHE_SIZE = 16
+
+_lock = threading.Lock()
+_tails = OrderedDict()
+
+
+def write_gzip(src, dest, tail_size=TAIL_SIZE):
+    """
+    gzip src into dest, with the last tail_size bytes in a gzip member of
+    their own (see read_tail()).
+    """
+    split = max(0, os.path.getsize(src) - tail_size)
+    with open(src, 'rb') as f_in, open(dest, 'wb') as f_out:
+        if split:
+            with GzipFile(fileobj=f_out, mode='wb') as g:
+                remaining = split
+                while remaining:
+                    block = f_in.read(min(CHUNK_SIZE, remaining))
+                    if not block:
+                        break
+                    g.write(block)
+                    remaining -= len(block)
+        with GzipFile(fileobj=f_out, mode='wb') as g:
+            for block in iter(lambda: f_in.read(CHUNK_SIZE), b''):
+                g.write(block)
+
+
+def _gunzip(data):
+    # decompress the gzip members that make up all of data; raises
+    # zlib.error unless data ends exactly with a complete member. The
+    # sentinel ends up in unused_data only if a member really ended (and its
+    # CRC was right), which works without Decompress.eof (Python 2)
+    data += b'\x00'
+    out = []
+    while data != b'\x00':
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        out.append(d.decompress(data))
+        if not d.unused_data:
+            raise zlib.error('truncated gzip member')
+        data = d.unused_data
+    return b''.join(out)
+
+
+def _seek_end(f):
+    # size of f, or None if it cannot seek
+    try:
+        f.seek(0, 2)
+        return f.tell()
+    except (AttributeError, IOError, OSError, ValueError,
+            io.UnsupportedOperation):
+        return None
+
+
+def _gzip_tail(f, size):
+    # (tail, complete) from the last members of a gzip file, or None if
+    # there is no member boundary close enough to the end
+    end = _seek_end(f)
+    if end is None:
+        return None
+    # a member holding size bytes compresses to at most about that much
+    start = max(0, end - size - (size >> 4) - 1024)
+    f.seek(start)
+    data = f.read()
+    pos = len(data)
+    while True:
+        pos = data.rfind(_GZIP_MAGIC, 0, pos)
+        if pos < 0:
+            return None
+        try:
+            tail = _gunzip(data[pos:])
+        except zlib.error:
+            continue
+        complete = start + pos == 0
+        if len(tail) >= size or complete:
+            return tail[-size:], complete and len(tail) <= size
+
+
+def _stream_tail(f, size):
+    # (tail, complete) by reading all of f
+    buf = b''
+    total = 0
+    for block in iter(lambda: f.read(1 << 20), b''):
+        total += len(block)
+        buf = (buf + block)[-size:]
+    return buf, total <= size
+
+
+def _read_tail(filename, size):
+    ext = os.path.splitext(filename)[1]
+    with launch_archive.open_raw(filename) as f:
+        if ext in _GZIP_EXTENSIONS:
+            found = _gzip_tail(f, size)
+            if found:
+                return found
+        elif ext not in _BZ2_EXTENSIONS:
+            end = _seek_end(f)
+            if end is not None:
+                f.seek(max(0, end - size))
+                return f.read(), end <= size
+            return _stream_tail(f, size)
+    with launch_archive.zopen(filename, 'rb') as f:
+        return _stream_tail(f, size)
+
+
+def read_tail(filename, size=TAIL_SIZE):
+    """
+    :return: (the last size bytes of the decompressed content of filename,
+        whether that is all of it)
+    """
+    st = (launch_archive.getsize(filename), launch_archive.getmtime(filename))
+    key = (filename, size)
+    with _lock:
+        cached = _tails.pop(key, None)
+        if cached and cached[0] == st:
+            _tails[key] = cached
+            return cached[1]
+    tail = _read_tail(filename, size)
+    with _lock:
+        _tails[key] = (st, tail)
+        while len(_tails) > _CACHE_SIZE:
+            _tails.popitem(last=False)
+    return tail
+
+
+def _to_str(data):
+    return data if isinstance(data, str) else data.decode('latin-1')
+
+
+def tail_lines(filename, size=TAIL_SIZE):
+    """
+    The complete lines (without line ends) in the last size bytes of
+    filename.
+    """
+    data, complete = read_tail(filename, size)
+    lines = _to_str(data).splitlines()
+    return lines if complete else lines[1:]
+
+
+def reverse_readlines(filename, chunk_size=CHUNK_SIZE, max_bytes=None):
+    """
+    Iterate over the lines (without line ends) of filename, from the last
+    one to the first. Plain files are read backwards in chunks, only as far
+    as the iteration goes. Compressed files are only read back max_bytes
+    (TAIL_SIZE by default; see read_tail()).
+    """
+    ext = os.path.splitext(filename)[1]
+    if ext in _GZIP_EXTENSIONS + _BZ2_EXTENSIONS:
+        for line in reversed(tail_lines(filename, max_bytes or TAIL_SIZE)):
+            yield line
+        return
+    with launch_archive.open_raw(filename) as f:
+        end = _seek_end(f)
+        if end is None:
+            data, complete = _stream_tail(f, max_bytes or TAIL_SIZE)
+            lines = _to_str(data).splitlines()
+            for line in reversed(lines if complete else lines[1:]):
+                yield line
+            return
+        stop = max(0, end - max_bytes) if max_bytes else 0
+        pos = end
+        rest = b''
+        while pos > stop:
+            n = min(chunk_size, pos - stop)
+            pos -= n
+            f.seek(pos)
+            lines = (f.read(n) + rest).splitlines(True)
+            # the first line may continue in the previous chunk
+            rest = lines.pop(0) if lines else b''
+            for line in reversed(lines):
+                yield _to_str(line).rstrip('\r\n')
+        if rest and pos == 0:
+            yield _to_str(rest).rstrip('\r\n')
+
+
+class FileFollower(object):
+    """
+    Returns what was appended to a plain file since the last read(), like
+    "tail -F": if the file is replaced (e.g. custodian moving vasp.out aside
+    for the next job) or truncated, it starts over from the beginning of
+    the new one.
+    """
+
+    def __init__(self, filename, max_read=1 << 24):
+        """
+        :param filename: file to follow (need not exist yet)
+        :param max_read: at most this many bytes are returned per read();
+            the rest is left for the next ones
+        """
+        self.filename = filename
+        self.max_read = max_read
+        self.offset = 0
+        self._inode = None
+
+    def read(self):
+        """
+        :return: (new bytes, whether the file was replaced or truncated
+            since the last read, i.e. the bytes do not continue the earlier
+            ones)
+        """
+        try:
+            st = os.stat(self.filename)
+        except OSError:
+            return b'', False
+        restarted = False
+        if st.st_ino != self._inode or st.st_size < self.offset:
+            restarted = self._inode is not None
+            self._inode = st.st_ino
+            self.offset = 0
+        if st.st_size == self.offset:
+            return b'', restarted
+        with open(self.filename, 'rb') as f:
+            f.seek(self.offset)
+            data = f.read(min(st.st_size - self.offset, self.max_read))
+        self.offset += len(data)
+        return data, restarted
+
+
+def read_head(filename, size=CHUNK_SIZE):
+    with launch_archive.zopen(filename, 'rb') as f:
+        return _to_str(f.read(size))
+
+
+_TIME_PATT = re.compile(r"\((sec|kb)\)")
+
+
+def get_outcar_run_stats(filename):
+    """
+    The run_stats of an OUTCAR, as in pymatgen's Outcar, from its first and
+    last few KB only.
+    """
+    run_stats = {}
+    for line in tail_lines(filename):
+        if _TIME_PATT.search(line):
+            tok = line.strip().split(":")
+            try:
+                run_stats[tok[0].strip()] = float(tok[1].strip())
+            except (IndexError, ValueError):
+                run_stats[tok[0].strip()] = None
+    run_stats['cores'] = None
+    for line in read_head(filename).splitlines():
+        if "serial" in line:
+            run_stats['cores'] = 1
+            break
+        if "running" in line:
+            tok = line.split()
+            run_stats['cores'] = int(tok[2] if tok[1] == "on" else tok[1])
+            break
+    return run_stats
+
+
+def is_outcar_complete(filename):
+    """
+    Whether VASP finished writing filename (an OUTCAR), i.e. printed the
+    end of its final timing section.
+    """
+    return "voluntary context switches:" in \
+        _to_str(read_tail(filename)[0]).lower()
@@ -0,0 +1,57 @@
+from unittest import TestCase
+
+from pymatgen.entries.compatibility import MaterialsProjectCompatibility
+
+from mpworks.drones import compatibility
+from mpworks.drones.compatibility import get_entry, get_is_compatible, \
+    get_is_compatible_batch
+
+
+def _task_doc(task_id, formula, labels, hubbards=None):
+    return {'task_id': task_id, 'unit_cell_formula': formula,
+            'run_type': 'GGA+U' if hubbards else 'GGA',
+            'is_hubbard': bool(hubbards), 'hubbards': hubbards,
+            'pseudo_potential': {'functional': 'PBE', 'labels': labels}}
+
+
+class TestCompatibility(TestCase):
+    def setUp(self):
+        compatibility.clear_cache()
+        self.docs = [
+            _task_doc('mp-1', {'Fe': 4.0, 'O': 6.0}, ['Fe_pv', 'O'],
+                      {'Fe': 5.3, 'O': 0.0}),
+            # an oxide of a U element without U
+            _task_doc('mp-2', {'Fe': 4.0, 'O': 6.0}, ['Fe_pv', 'O']),
+            # the wrong U value
+            _task_doc('mp-3', {'Fe': 4.0, 'O': 6.0}, ['Fe_pv', 'O'],
+                      {'Fe': 4.0, 'O': 0.0}),
+            _task_doc('mp-4', {'Si': 2.0}, ['Si']),
+            _task_doc('mp-5', {'Si': 2.0}, ['Si'], {})]
+
+    def tearDown(self):
+        compatibility.clear_cache()
+
+    def test_memoized_equals_uncached(self):
+        mpc = MaterialsProjectCompatibility("Advanced")
+        expected = dict((d['task_id'], bool(mpc.process_entry(get_entry(d))))
+                        for d in self.docs)
+        self.assertEqual(expected, {'mp-1': True, 'mp-2': False,
+                                    'mp-3': False, 'mp-4': True,
+                                    'mp-5': True})
+        self.assertEqual(get_is_compatible_batch(self.docs), expected)
+        # now from the cache
+        self.assertEqual(get_is_compatible_batch(self.docs), expected)
+        for d in self.docs:
+            self.assertEqual(get_is_compatible(d), expected[d['task_id']])
+
+    def test_key(self):
+        keys = [compatibility._get_key(d, "Advanced") for d in self.docs]
+        # the U values and whether U is on are part of the key
+        self.assertEqual(len(set(keys[:3])), 3)
+        # no hubbards (None) and empty hubbards are the same
+        self.assertEqual(keys[3], keys[4])
+        self.assertNotEqual(keys[0],
+                            compatibility._get_key(self.docs[0], "Legacy"))
+        # the task_id is not
+        other = dict(self.docs[0], task_id='mp-6')
+        self.assertEqual(compatibility._get_key(other, "Advanced"), keys[0])
@@ -0,0 +1,79 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from mpworks.drones import dir_manifest
+from mpworks.drones.dir_manifest import DirManifest, get_manifest
+
+
+class TestDirManifest(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.launch_dir = os.path.join(self.tmp, 'launcher_1')
+        os.makedirs(os.path.join(self.launch_dir, 'relax2'))
+        for name, content in [('OUTCAR', 'outcar'), ('relax2/OUTCAR.gz', 'x'),
+                              ('vasprun.xml.relax1.gz', 'x'),
+                              ('vasprun.xml.relax2.gz', 'x'),
+                              ('CHGCAR.gz', ''), ('job.error', 'err')]:
+            with open(os.path.join(self.launch_dir, name), 'w') as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_manifest(self):
+        m = DirManifest(self.launch_dir)
+        self.assertEqual(m.names, ['CHGCAR.gz', 'OUTCAR', 'job.error', 'relax2',
+                                   'vasprun.xml.relax1.gz',
+                                   'vasprun.xml.relax2.gz'])
+        self.assertTrue(m.isdir('relax2'))
+        self.assertEqual(m.zname('CHGCAR'), 'CHGCAR.gz')
+        self.assertIsNone(m.zname('POSCAR'))
+        self.assertEqual(m.getsize('OUTCAR'), 6)
+        self.assertEqual(m.getsize('CHGCAR.gz'), 0)
+        self.assertEqual(m.glob('*.error'),
+                         [os.path.join(self.launch_dir, 'job.error')])
+        self.assertIs(get_manifest(os.path.join(self.launch_dir, 'relax2'), m),
+                      m.subdir('relax2'))
+
+    def test_last_relax(self):
+        m = DirManifest(self.launch_dir)
+        self.assertEqual(m.last_relax('OUTCAR'),
+                         os.path.join(self.launch_dir, 'relax2', 'OUTCAR.gz'))
+        self.assertEqual(m.last_relax('vasprun.xml'),
+                         os.path.join(self.launch_dir, 'vasprun.xml.relax2.gz'))
+        self.assertEqual(m.last_relax('POSCAR'),
+                         os.path.join(self.launch_dir, 'POSCAR'))
+
+    def test_archived(self):
+        with zipfile.ZipFile(self.launch_dir + '.zip', 'w') as z:
+            for root, dirs, files in os.walk(self.launch_dir):
+                for name in files:
+                    full = os.path.join(root, name)
+                    z.write(full, os.path.relpath(full, self.launch_dir))
+        shutil.rmtree(self.launch_dir)
+        m = DirManifest(self.launch_dir)
+        self.assertEqual(m.zname('CHGCAR'), 'CHGCAR.gz')
+        self.assertEqual(m.getsize('OUTCAR'), 6)
+        self.assertEqual(m.last_relax('OUTCAR'),
+                         os.path.join(self.launch_dir, 'relax2', 'OUTCAR.gz'))
+        self.assertFalse(DirManifest(os.path.join(self.tmp, 'missing')).names)
+
+    def test_without_scandir(self):
+        scandir = dir_manifest.scandir
+        dir_manifest.scandir = None
+        try:
+            m = DirManifest(self.launch_dir)
+        finally:
+            dir_manifest.scandir = scandir
+        self.assertEqual(len(m.names), 6)
+        # only the entries asked about are stat'ed
+        self.assertEqual(set(m._is_dir.values()), set([None]))
+        self.assertTrue(m.isdir('relax2'))
+        self.assertTrue(m.isfile('OUTCAR'))
+        self.assertFalse(m.isfile('relax2'))
+        self.assertFalse(m.isdir('POSCAR'))
+        self.assertIsNone(m._is_dir['job.error'])
+        self.assertEqual(m.subdir('relax2').names, ['OUTCAR.gz'])
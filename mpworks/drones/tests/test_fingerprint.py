@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mpworks.drones.fingerprint import get_fingerprint, is_drone_file, \
+    is_unchanged
+
+
+class TestFingerprint(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmp, 'relax2'))
+        for name in ['OUTCAR', 'INCAR.relax1.gz', 'relax2/vasprun.xml.gz',
+                     'job.error', 'WAVECAR', 'CHGCAR.relax1.gz']:
+            self._write(name, name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, name, content):
+        with open(os.path.join(self.tmp, name), 'w') as f:
+            f.write(content)
+
+    def test_drone_files(self):
+        self.assertTrue(is_drone_file('OUTCAR.relax2.gz'))
+        self.assertTrue(is_drone_file('vasprun.xml'))
+        self.assertTrue(is_drone_file('mp-1.error'))
+        self.assertFalse(is_drone_file('WAVECAR.gz'))
+        self.assertFalse(is_drone_file('OUTCARS'))
+        fp = get_fingerprint(self.tmp, 1)
+        self.assertEqual([f['name'] for f in fp['files']],
+                         ['INCAR.relax1.gz', 'OUTCAR', 'job.error',
+                          os.path.join('relax2', 'vasprun.xml.gz')])
+
+    def test_unchanged(self):
+        fp = get_fingerprint(self.tmp, 1)
+        self._write('WAVECAR', 'other wavefunctions')
+        self.assertTrue(is_unchanged(self.tmp, fp, 1))
+        self.assertFalse(is_unchanged(self.tmp, fp, 2))
+        self._write('OUTCAR', 'other OUTCAR')
+        self.assertFalse(is_unchanged(self.tmp, fp, 1))
@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import zipfile
+from unittest import TestCase
+
+from mpworks.drones import launch_archive
+from mpworks.drones.fingerprint import is_drone_file
+
+
+class TestLaunchArchive(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.launch_dir = os.path.join(self.tmp, 'launcher_1')
+        with zipfile.ZipFile(self.launch_dir + '.zip', 'w') as z:
+            for name in ['OUTCAR', 'relax2/OUTCAR.gz', 'INCAR.relax1.gz',
+                         'WAVECAR', 'relax2/CHGCAR.gz', 'job.error']:
+                z.writestr(name, name)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_extracted(self):
+        with launch_archive.extracted(self.launch_dir, is_drone_file) as d:
+            self.assertEqual(sorted(os.listdir(d)),
+                             ['INCAR.relax1.gz', 'OUTCAR', 'job.error',
+                              'relax2'])
+            self.assertEqual(os.listdir(os.path.join(d, 'relax2')),
+                             ['OUTCAR.gz'])
+        self.assertFalse(os.path.exists(d))
+        with launch_archive.extracted(self.launch_dir) as d:
+            self.assertTrue(os.path.exists(os.path.join(d, 'WAVECAR')))
+
+    def test_copy(self):
+        dest = os.path.join(self.tmp, 'run')
+        os.makedirs(dest)
+        launch_archive.copy(os.path.join(self.launch_dir, 'relax2',
+                                         'CHGCAR.gz'), dest)
+        with open(os.path.join(dest, 'CHGCAR.gz')) as f:
+            self.assertEqual(f.read(), 'relax2/CHGCAR.gz')
+        self.assertRaises(IOError, launch_archive.copy,
+                          os.path.join(self.launch_dir, 'CONTCAR'), dest)
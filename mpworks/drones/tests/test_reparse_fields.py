@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import mongomock
+
+from mpworks.db_utils import connections
+from mpworks.drones.mp_vaspdrone import MPVaspDrone
+from mpworks.maintenance_scripts.archive_launch_dirs import \
+    archive_launch_dir
+from mpworks.maintenance_scripts.benchmark_corpus import load_corpus, \
+    make_corpus
+from mpworks.workflows.wf_utils import get_block_part
+
+
+class TestReparseFields(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        connections.reset()
+        connections.set_client_factory(mongomock.MongoClient)
+        make_corpus(self.tmp, runs=['static'])
+        self.launch_dir = load_corpus(self.tmp)['launches'][0]['launch_dir']
+        self.tasks = connections.get_database(
+            'localhost', 27017, 'mp_test')['tasks']
+        self.tasks.insert_one({
+            'task_id': 'mp-7', 'dir_name': get_block_part(self.launch_dir),
+            'task_type': 'GGA static', 'state': 'error',
+            'output': {'final_energy': -10.8},
+            'analysis': {'errors_MP': {'num_critical': 1}}})
+
+    def tearDown(self):
+        connections.set_client_factory(None)
+        connections.reset()
+        shutil.rmtree(self.tmp)
+
+    def _drone(self, fields, **kwargs):
+        return MPVaspDrone(host='localhost', port=27017, database='mp_test',
+                           collection='tasks', partial_fields=fields,
+                           **kwargs)
+
+    def test_unknown_field(self):
+        self.assertRaises(ValueError, self._drone, ['output'])
+
+    def test_errors_MP_sets_state(self):
+        drone = self._drone(['analysis.errors_MP', 'task_id_deprecated'])
+        t_id, updates = drone.assimilate(self.launch_dir)
+        self.assertEqual(t_id, 'mp-7')
+        # the critical signals are gone, so is the error state
+        doc = self.tasks.find_one({'task_id': 'mp-7'})
+        self.assertEqual(doc['state'], 'successful')
+        self.assertEqual(doc['analysis']['errors_MP']['num_critical'], 0)
+        self.assertEqual(doc['task_id_deprecated'], 7)
+        self.assertEqual(doc['output'], {'final_energy': -10.8})
+
+        os.remove(os.path.join(self.launch_dir, 'vasp.out.gz'))
+        with open(os.path.join(self.launch_dir, 'vasp.out'), 'w') as f:
+            f.write('The distance between some ions is very small\n')
+        drone.assimilate(self.launch_dir)
+        doc = self.tasks.find_one({'task_id': 'mp-7'})
+        self.assertEqual(doc['state'], 'error')
+        self.assertIn('ATOMS_TOO_CLOSE',
+                      doc['analysis']['errors_MP']['critical_signals'])
+
+    def test_errors_MP_archived_old_style(self):
+        # an old-style run (no FW.json) is also checked for job signals in
+        # the dir above it: for an archived launch dir that is the block
+        # dir, not the parent of the extracted copy that is parsed
+        for name in os.listdir(self.launch_dir):
+            if name.startswith('FW.json'):
+                os.remove(os.path.join(self.launch_dir, name))
+        with open(os.path.join(os.path.dirname(self.launch_dir),
+                               'job.error'), 'w') as f:
+            f.write('=>> PBS: job killed: walltime 3605 exceeded limit '
+                    '3600\n')
+        archive_launch_dir(self.launch_dir)
+        self.assertFalse(os.path.isdir(self.launch_dir))
+
+        drone = self._drone(['analysis.errors_MP'])
+        drone.assimilate(self.launch_dir)
+        doc = self.tasks.find_one({'task_id': 'mp-7'})
+        self.assertIn('WALLTIME_EXCEEDED',
+                      doc['analysis']['errors_MP']['signals'])
+        self.assertEqual(doc['analysis']['errors_MP']['last_relax_dir'],
+                         self.launch_dir)
+
+    def test_bulk_does_not_insert(self):
+        drone = self._drone(['task_id_deprecated'], bulk_batch_size=10)
+        drone.assimilate(self.launch_dir)
+        self.tasks.delete_many({})
+        self.assertEqual(drone.flush_writes(), [])
+        self.assertEqual(self.tasks.count_documents({}), 0)
+        self.assertRaises(ValueError, drone.assimilate, self.launch_dir)
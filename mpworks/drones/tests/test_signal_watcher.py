@@ -0,0 +1,41 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mpworks.drones.signals import SignalWatcher, VASP_OUT_ERRORS
+
+
+class TestSignalWatcher(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.vasp_out = os.path.join(self.tmp, 'vasp.out')
+        errors = dict((s, VASP_OUT_ERRORS[s]) for s in
+                      ['ATOMS_TOO_CLOSE', 'NETWORK_QUIESCED'])
+        self.watcher = SignalWatcher(errors, ['vasp.out', 'OUTCAR'],
+                                     dir_name=self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, s, mode='a'):
+        with open(self.vasp_out, mode) as f:
+            f.write(s)
+
+    def test_poll(self):
+        self.assertEqual(self.watcher.poll(), set())
+        self._write(' running on    4 total cores\n' * 1000)
+        self.assertEqual(self.watcher.poll(), set())
+        # a string split across two polls
+        self._write(' The distance between some ions')
+        self.assertEqual(self.watcher.poll(), set())
+        self._write(' is very small\n')
+        self.assertEqual(self.watcher.poll(), set(['ATOMS_TOO_CLOSE']))
+        self.assertEqual(self.watcher.poll(), set(['ATOMS_TOO_CLOSE']))
+
+    def test_restart(self):
+        self._write('The distance between some ions is very small\n')
+        self.assertEqual(self.watcher.poll(), set(['ATOMS_TOO_CLOSE']))
+        # the next job truncates vasp.out
+        self._write('network quiesced\n', 'w')
+        self.assertEqual(self.watcher.poll(), set(['NETWORK_QUIESCED']))
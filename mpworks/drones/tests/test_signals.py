@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mpworks.drones import text_scan
+from mpworks.drones.dir_manifest import DirManifest
+from mpworks.drones.signals import SchedulerErrorSignal, SignalDetectorList
+from mpworks.drones.text_scan import TextScanner
+
+
+class TestSchedulerErrorSignal(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tmp, 'relax2'))
+        for name, content in [
+                ('FW_job.error', 'forrtl: severe (174): SIGSEGV, '
+                                 'segmentation fault occurred\n'
+                                 '=>> PBS: job killed: walltime 3605 '
+                                 'exceeded limit 3600\n'),
+                ('relax2/FW_job.error', 'write error: No space left on '
+                                        'device\n')]:
+            with open(os.path.join(self.tmp, name), 'w') as f:
+                f.write(content)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_rules(self):
+        self.assertEqual(SchedulerErrorSignal().detect(self.tmp),
+                         set(['SEGFAULT', 'WALLTIME_EXCEEDED']))
+        self.assertEqual(SchedulerErrorSignal(
+            signals=['HIT_A_MEMBER_FAIL', 'SEGFAULT']).detect(self.tmp),
+            set(['SEGFAULT']))
+        self.assertEqual(SchedulerErrorSignal(
+            signals=['DISK_SPACE_EXCEEDED']).detect(self.tmp), set())
+
+    def test_split_scans_once(self):
+        # as in MPVaspDrone.get_errors_MP(): member/segfault rules on the
+        # last relaxation, walltime/disk space on the launch dir, one scan
+        # of each *.error file
+        scans = []
+        orig = text_scan.find_patterns
+
+        def counting_find_patterns(*args, **kwargs):
+            scans.append(args[0])
+            return orig(*args, **kwargs)
+
+        manifest = DirManifest(self.tmp)
+        relax_sl = SignalDetectorList([SchedulerErrorSignal(
+            signals=['HIT_A_MEMBER_FAIL', 'SEGFAULT'])])
+        job_sl = SignalDetectorList([SchedulerErrorSignal(
+            signals=['WALLTIME_EXCEEDED', 'DISK_SPACE_EXCEEDED'])])
+        text_scan.find_patterns = counting_find_patterns
+        try:
+            for last_relax_dir, expected in [
+                    (self.tmp, set(['SEGFAULT', 'WALLTIME_EXCEEDED'])),
+                    (os.path.join(self.tmp, 'relax2'),
+                     set(['WALLTIME_EXCEEDED']))]:
+                del scans[:]
+                checks = [(relax_sl, last_relax_dir), (job_sl, self.tmp)]
+                scanner = TextScanner()
+                for l, m_dir in checks:
+                    l.prepare(m_dir, manifest, scanner)
+                signals = set()
+                for l, m_dir in checks:
+                    signals.update(l.detect_all(m_dir, manifest, scanner))
+                self.assertEqual(signals, expected)
+                self.assertEqual(len(scans), len(set(scans)))
+        finally:
+            text_scan.find_patterns = orig
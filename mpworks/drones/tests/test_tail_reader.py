@@ -0,0 +1,79 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mpworks.drones import tail_reader
+from mpworks.drones.tail_reader import get_outcar_run_stats, \
+    is_outcar_complete, read_tail, reverse_readlines, write_gzip
+
+OUTCAR_END = """ General timing and accounting informations for this job:
+ ========================================================
+
+                  Total CPU time used (sec):       12.345
+                            User time (sec):       11.000
+                          System time (sec):        1.345
+                         Elapsed time (sec):       15.000
+
+                   Maximum memory used (kb):       40000.
+                   Average memory used (kb):           N/A
+
+                          Minor page faults:        1000
+                          Major page faults:           0
+                 Voluntary context switches:          50
+"""
+
+
+class TestTailReader(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        lines = [' running on    4 total cores\n']
+        lines += ['line {} of the OUTCAR\n'.format(i) for i in range(20000)]
+        self.body = ''.join(lines)
+        self.outcar = os.path.join(self.tmp, 'OUTCAR')
+        with open(self.outcar, 'w') as f:
+            f.write(self.body + OUTCAR_END)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_tail_indexed_gzip(self):
+        write_gzip(self.outcar, self.outcar + '.gz', tail_size=4096)
+        with gzip.open(self.outcar + '.gz', 'rt') as f:
+            self.assertEqual(f.read(), self.body + OUTCAR_END)
+        # the tail member is found without decompressing the rest
+        with open(self.outcar + '.gz', 'rb') as f:
+            tail, complete = tail_reader._gzip_tail(f, 4096)
+        self.assertEqual(tail, (self.body + OUTCAR_END)[-4096:].encode())
+        self.assertFalse(complete)
+
+    def test_read_tail(self):
+        with gzip.open(self.outcar + '.gz', 'wt') as f:
+            f.write(self.body + OUTCAR_END)  # a single gzip member
+        for filename in [self.outcar, self.outcar + '.gz']:
+            tail, complete = read_tail(filename, 100)
+            self.assertEqual(tail, OUTCAR_END[-100:].encode())
+            self.assertFalse(complete)
+            self.assertTrue(is_outcar_complete(filename))
+        tail, complete = read_tail(self.outcar, 10 ** 7)
+        self.assertTrue(complete)
+
+    def test_reverse_readlines(self):
+        expected = list(reversed((self.body + OUTCAR_END).splitlines()))
+        self.assertEqual(list(reverse_readlines(self.outcar, chunk_size=100)),
+                         expected)
+        # only the lines that are complete in the last 200 bytes
+        n = len(OUTCAR_END[-200:].splitlines()) - 1
+        self.assertEqual(list(reverse_readlines(self.outcar, max_bytes=200)),
+                         expected[:n])
+
+    def test_run_stats(self):
+        write_gzip(self.outcar, self.outcar + '.gz')
+        run_stats = get_outcar_run_stats(self.outcar + '.gz')
+        self.assertEqual(run_stats['Total CPU time used (sec)'], 12.345)
+        self.assertIsNone(run_stats['Average memory used (kb)'])
+        self.assertEqual(run_stats['cores'], 4)
+        with open(self.outcar, 'w') as f:
+            f.write(self.body + OUTCAR_END[:200])
+        self.assertFalse(is_outcar_complete(self.outcar))
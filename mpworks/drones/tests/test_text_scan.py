@@ -0,0 +1,54 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mpworks.drones import text_scan
+from mpworks.drones.text_scan import TextScanner, find_patterns
+
+
+class TestTextScan(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmp, 'vasp.out.gz')
+        with gzip.open(self.filename, 'wb') as f:
+            f.write(b'running on 4 nodes\n' + b'x' * 5000 +
+                    b'\nBRMIX: very serious problems\nexit signals: KILLED\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_find_patterns(self):
+        patterns = ['BRMIX: very serious problems', 'BRMIX', 'Killed',
+                    'ZHEGV']
+        for chunk_size in [7, 100, text_scan.CHUNK_SIZE]:
+            self.assertEqual(find_patterns(self.filename, patterns,
+                                           chunk_size=chunk_size),
+                             set(patterns[:3]))
+        self.assertEqual(find_patterns(self.filename, patterns,
+                                       ignore_case=False),
+                         set(patterns[:2]))
+
+    def test_scanner_scans_once(self):
+        scans = []
+        orig = text_scan.find_patterns
+
+        def counting_find_patterns(*args, **kwargs):
+            scans.append(args[0])
+            return orig(*args, **kwargs)
+
+        text_scan.find_patterns = counting_find_patterns
+        try:
+            scanner = TextScanner()
+            scanner.register(self.filename, ['ZHEGV'])
+            scanner.register(self.filename, ['Killed'])
+            self.assertEqual(scanner.find(self.filename, ['ZHEGV']), set())
+            self.assertEqual(scanner.find(self.filename, ['Killed']),
+                             set(['Killed']))
+            self.assertEqual(len(scans), 1)
+            self.assertEqual(scanner.find(self.filename, ['nodes']),
+                             set(['nodes']))
+            self.assertEqual(len(scans), 2)
+        finally:
+            text_scan.find_patterns = orig
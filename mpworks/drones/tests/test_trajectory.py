@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+import gridfs
+import mongomock
+import mongomock.gridfs
+import numpy as np
+from pymatgen.core.lattice import Lattice
+from pymatgen.core.structure import Structure
+
+from mpworks.drones.trajectory import TRAJECTORY_FS, get_final_ionic_step, \
+    load_trajectory, put_trajectory
+
+
+def _ionic_steps(n):
+    steps = []
+    for i in range(n):
+        s = Structure(Lattice.cubic(5.4 + 0.01 * i), ['Si', 'Si'],
+                      [[0, 0, 0], [0.25 + 0.001 * i, 0.25, 0.25]])
+        e_steps = [{'e_fr_energy': -10.0 - i - 0.1 * j, 'alphaZ': 1.0 * j}
+                   for j in range(3 + i % 4)]
+        # only the last electronic step has the total energies
+        e_steps[-1].update({'e_wo_entrp': -10.5 - i, 'e_0_energy': -10.4 - i})
+        steps.append({'structure': s.as_dict(),
+                      'forces': [[0.01 * i, 0, 0], [-0.01 * i, 0, 0]],
+                      'stress': [[1.0 * i, 0, 0], [0, 1.0, 0], [0, 0, 1.0]],
+                      'e_fr_energy': -10.0 - i, 'e_wo_entrp': -10.5 - i,
+                      'e_0_energy': -10.4 - i,
+                      'electronic_steps': e_steps})
+    return steps
+
+
+class TestTrajectory(TestCase):
+    def setUp(self):
+        mongomock.gridfs.enable_gridfs_integration()
+        self.db = mongomock.MongoClient().db
+        self.fs = gridfs.GridFS(self.db, TRAJECTORY_FS)
+
+    def _check_round_trip(self, n):
+        steps = _ionic_steps(n)
+        fs_id = put_trajectory(self.fs, steps)
+        traj = load_trajectory(self.db, fs_id)
+        self.assertEqual(len(traj), n)
+        for expected, step in zip(steps, traj.get_steps()):
+            self.assertEqual(sorted(step), sorted(expected))
+            self.assertEqual(step['electronic_steps'],
+                             expected['electronic_steps'])
+            self.assertTrue(np.allclose(step['forces'], expected['forces']))
+            self.assertEqual(step['e_0_energy'], expected['e_0_energy'])
+            self.assertEqual(Structure.from_dict(step['structure']),
+                             Structure.from_dict(expected['structure']))
+        self.assertEqual(traj.get_step(3)['electronic_steps'],
+                         steps[3]['electronic_steps'])
+        final = get_final_ionic_step(self.db, {'ionic_steps_fs_id': fs_id},
+                                     keys=['stress'])
+        self.assertEqual(final, {'stress': steps[-1]['stress']})
+
+    def test_round_trip(self):
+        self._check_round_trip(5)
+
+    def test_round_trip_long(self):
+        # with this many steps the per-step arrays (e.g. the electronic
+        # step counts) are blob arrays instead of inline lists
+        self._check_round_trip(40)
@@ -0,0 +1,154 @@
+import gzip
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import gridfs
+import mongomock
+import mongomock.gridfs
+import numpy as np
+from pymatgen.electronic_structure.core import Spin
+from pymatgen.electronic_structure.dos import CompleteDos
+from pymatgen.io.vasp.outputs import Vasprun
+
+from mpworks.db_utils.blobs import load_blob
+from mpworks.drones import vasprun_stream
+from mpworks.drones.vasprun_stream import get_band_structure, \
+    stream_dos_to_gridfs
+from mpworks.maintenance_scripts.benchmark_corpus import load_corpus, \
+    make_corpus
+
+
+def add_projected(vasprun_file, n_kpoints, n_bands, n_ions):
+    """
+    Add a <projected> block (as written with LORBIT) to the last
+    calculation of vasprun_file.
+    """
+    out = ['  <projected>\n   <array>\n    <set>\n     <set comment="spin1">\n']
+    for k in range(n_kpoints):
+        out.append('      <set comment="kpoint {}">\n'.format(k + 1))
+        for b in range(n_bands):
+            out.append('       <set comment="band {}">\n'.format(b + 1))
+            out.extend('        <r> 0.1 0.2 0.2 0.2 0.0 0.0 0.0 0.0 0.0 '
+                       '</r>\n' for i in range(n_ions))
+            out.append('       </set>\n')
+        out.append('      </set>\n')
+    out.append('     </set>\n    </set>\n   </array>\n  </projected>\n')
+    with gzip.open(vasprun_file, 'rb') as f:
+        xml = f.read().decode('utf-8')
+    xml = xml.replace('  </dos>\n', '  </dos>\n' + ''.join(out))
+    with gzip.open(vasprun_file, 'wb') as f:
+        f.write(xml.encode('utf-8'))
+
+
+class TestStreamDos(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        make_corpus(self.tmp, runs=['uniform'])
+        corpus = load_corpus(self.tmp)
+        self.vasprun_file = os.path.join(corpus['launches'][0]['launch_dir'],
+                                         'vasprun.xml.gz')
+        mongomock.gridfs.enable_gridfs_integration()
+        self.fs = gridfs.GridFS(mongomock.MongoClient().db, 'dos_fs')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_stream_dos_to_gridfs(self):
+        vr = Vasprun(self.vasprun_file)
+        expected = vr.complete_dos
+        fs_id, efermi = stream_dos_to_gridfs(
+            self.vasprun_file, vr.final_structure.as_dict(), self.fs)
+        self.assertEqual(efermi, expected.efermi)
+        dos = CompleteDos.from_dict(load_blob(self.fs, fs_id).as_dict())
+        self.assertEqual(dos.efermi, expected.efermi)
+        self.assertTrue(np.allclose(dos.energies, expected.energies))
+        for spin in [Spin.up, Spin.down]:
+            if spin in expected.densities:
+                self.assertTrue(np.allclose(dos.densities[spin],
+                                            expected.densities[spin]))
+        self.assertEqual(len(dos.pdos), len(expected.pdos))
+        for site in expected.structure:
+            for orb, d in expected.get_site_spd_dos(site).items():
+                streamed = dos.get_site_spd_dos(site)[orb]
+                for spin in d.densities:
+                    self.assertTrue(np.allclose(streamed.densities[spin],
+                                                d.densities[spin]))
+        for el, d in expected.get_element_dos().items():
+            self.assertTrue(np.allclose(
+                dos.get_element_dos()[el].get_densities(),
+                d.get_densities()))
+
+        # the same DOS again is not stored twice
+        self.assertEqual(stream_dos_to_gridfs(
+            self.vasprun_file, vr.final_structure.as_dict(), self.fs)[0],
+            fs_id)
+
+    def test_releases_eigenvalues_and_projections(self):
+        add_projected(self.vasprun_file, 60, 20, 8)
+        live = []
+        orig = vasprun_stream.iterparse_vasprun
+
+        def counting_iterparse(*args, **kwargs):
+            root = None
+            for event, elem, path in orig(*args, **kwargs):
+                if root is None:
+                    root = elem
+                if event == 'end' and elem.tag == 'r' and \
+                        ('projected' in path or 'eigenvalues' in path):
+                    live.append(sum(1 for r in root.iter('r')))
+                yield event, elem, path
+
+        vasprun_stream.iterparse_vasprun = counting_iterparse
+        try:
+            fs_id, efermi = stream_dos_to_gridfs(
+                self.vasprun_file, Vasprun(
+                    self.vasprun_file, parse_dos=False,
+                    parse_eigen=False).final_structure.as_dict(), self.fs)
+        finally:
+            vasprun_stream.iterparse_vasprun = orig
+        # 9600 <r> rows of projections, and the eigenvalues; the tree only
+        # ever holds the ones the parser has read ahead of its events
+        self.assertGreater(len(live), 9600)
+        self.assertLess(max(live), 1000)
+        self.assertIsNotNone(load_blob(self.fs, fs_id))
+
+
+class TestStreamBandStructure(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        make_corpus(self.tmp, runs=['uniform', 'line_mode'])
+        self.launch_dirs = dict(
+            (l['name'], l['launch_dir'])
+            for l in load_corpus(self.tmp)['launches'])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _check(self, name, line_mode):
+        vasprun_file = os.path.join(self.launch_dirs[name], 'vasprun.xml.gz')
+        add_projected(vasprun_file, 5, 8, 2)
+        expected = Vasprun(vasprun_file).get_band_structure(
+            efermi=5.5, line_mode=line_mode)
+        bs = get_band_structure(vasprun_file, efermi=5.5,
+                                line_mode=line_mode)
+        self.assertEqual(type(bs), type(expected))
+        self.assertTrue(np.allclose([k.frac_coords for k in bs.kpoints],
+                                    [k.frac_coords for k in expected.kpoints]))
+        self.assertEqual(sorted(bs.bands), sorted(expected.bands))
+        for spin in expected.bands:
+            self.assertTrue(np.allclose(bs.bands[spin], expected.bands[spin]))
+        self.assertEqual(bs.get_band_gap(), expected.get_band_gap())
+        self.assertEqual(bs.structure, expected.structure)
+        return bs, expected
+
+    def test_uniform(self):
+        self._check('uniform', False)
+
+    def test_line_mode(self):
+        bs, expected = self._check('line_mode', True)
+        self.assertEqual(sorted(bs.labels_dict),
+                         sorted(expected.labels_dict))
+        self.assertEqual([b['name'] for b in bs.branches],
+                         [b['name'] for b in expected.branches])
@@ -0,0 +1,148 @@
+import re
+from mpworks.drones.launch_archive import zopen
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Single-pass search for many fixed strings in (possibly compressed or
+archived) text files, e.g. the error messages of the signal detectors in
+vasp.out, OUTCAR and *.error.
+
+find_patterns() reads a file in large chunks and matches all the strings at
+once with one compiled alternation, instead of checking every string against
+every line. A pattern is dropped from the alternation as soon as it is found
+and the scan stops once all have been found, so files that contain the
+strings early (e.g. "vasp" at the top of an OUTCAR) are barely read.
+
+StreamScanner does the same over data that comes in piece by piece (e.g. an
+output file that is still being written). TextScanner collects the patterns
+that several detectors want to look for in the same file and serves all of
+them from a single scan of it.
+'''
+
+CHUNK_SIZE = 1 << 20
+
+_CACHE_SIZE = 256
+_regexes = {}
+
+
+def _to_bytes(s):
+    return s if isinstance(s, bytes) else s.encode('utf-8')
+
+
+def _compile(keys, ignore_case):
+    # one alternation of the (escaped) keys, longest first
+    cache_key = (tuple(sorted(keys)), ignore_case)
+    rx = _regexes.get(cache_key)
+    if rx is None:
+        if len(_regexes) >= _CACHE_SIZE:
+            _regexes.clear()
+        rx = re.compile(b'|'.join(re.escape(k) for k in
+                                  sorted(keys, key=len, reverse=True)),
+                        re.IGNORECASE if ignore_case else 0)
+        _regexes[cache_key] = rx
+    return rx
+
+
+class StreamScanner(object):
+    """
+    Looks for patterns in a stream of data, fed to it in blocks of any size.
+    """
+
+    def __init__(self, patterns, ignore_case=True):
+        """
+        :param patterns: the strings to look for (none may contain a newline)
+        :param ignore_case: match regardless of (ASCII) case
+        """
+        self.ignore_case = ignore_case
+        self.remaining = {}
+        for p in patterns:
+            key = _to_bytes(p).lower() if ignore_case else _to_bytes(p)
+            if key:
+                self.remaining.setdefault(key, []).append(p)
+        self.found = set()
+        self._tail = b''
+
+    def feed(self, block):
+        """
+        :return: the set of the patterns first found in block
+        """
+        found = set()
+        if not self.remaining or not block:
+            return found
+        buf = self._tail + block
+        rx = _compile(self.remaining, self.ignore_case)
+        m = rx.search(buf)
+        while m:
+            key = m.group(0).lower() if self.ignore_case else m.group(0)
+            found.update(self.remaining.pop(key))
+            if not self.remaining:
+                break
+            # another pattern may overlap this match, but none starts
+            # before it
+            rx = _compile(self.remaining, self.ignore_case)
+            m = rx.search(buf, m.start())
+        # keep enough of the end to catch a match across blocks
+        n = max(len(k) for k in self.remaining) - 1 if self.remaining else 0
+        self._tail = buf[-n:] if n > 0 else b''
+        self.found.update(found)
+        return found
+
+
+def find_patterns(filename, patterns, ignore_case=True,
+                  chunk_size=CHUNK_SIZE):
+    """
+    :param filename: file to search (gzipped, bzipped and archived files are
+        read through mpworks.drones.launch_archive.zopen())
+    :param patterns: the strings to look for (none may contain a newline)
+    :param ignore_case: match regardless of (ASCII) case
+    :return: the set of the patterns that occur in the file
+    """
+    scanner = StreamScanner(patterns, ignore_case)
+    with zopen(filename, 'rb') as f:
+        while scanner.remaining:
+            block = f.read(chunk_size)
+            if not block:
+                break
+            scanner.feed(block)
+    return scanner.found
+
+
+class TextScanner(object):
+    """
+    Scans each file once for everything that was register()ed for it before
+    the first find() on it. Patterns that come in after a file was scanned
+    are looked for in another scan of only those patterns.
+    """
+
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        # (filename, ignore_case) -> patterns registered but not scanned for
+        self._pending = {}
+        # (filename, ignore_case) -> patterns scanned for / found
+        self._scanned = {}
+        self._found = {}
+
+    def register(self, filename, patterns, ignore_case=True):
+        key = (filename, ignore_case)
+        scanned = self._scanned.get(key, set())
+        self._pending.setdefault(key, set()).update(
+            p for p in patterns if p not in scanned)
+
+    def find(self, filename, patterns, ignore_case=True):
+        """
+        :return: the set of the patterns that occur in filename
+        """
+        self.register(filename, patterns, ignore_case)
+        key = (filename, ignore_case)
+        pending = self._pending.pop(key, set())
+        if pending:
+            self._found.setdefault(key, set()).update(find_patterns(
+                filename, pending, ignore_case, self.chunk_size))
+            self._scanned.setdefault(key, set()).update(pending)
+        return self._found.get(key, set()).intersection(patterns)
@@ -0,0 +1,70 @@
+from contextlib import contextmanager
+import datetime
+import json
+import os
+import time
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+
+class PhaseTimer(object):
+    """
+    Wall-clock time spent in each named phase of one assimilation. Phases
+    may nest (e.g. "post_process" runs inside "parse"), so they do not add
+    up to the total; a phase entered several times accumulates.
+    """
+
+    def __init__(self):
+        self.start = time.time()
+        self.phases = {}
+
+    @contextmanager
+    def phase(self, name):
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0) + time.time() - t0
+
+    def as_dict(self):
+        return {'total': time.time() - self.start,
+                'phases': dict(self.phases)}
+
+
+@contextmanager
+def null_phase():
+    yield
+
+
+class TimingLog(object):
+    """
+    Local metrics sink: appends one JSON line per assimilation to a file.
+    Lines are written with a single write() in append mode, so several
+    processes can share one file.
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+
+    def write(self, timing, **fields):
+        """
+        :param timing: PhaseTimer.as_dict()
+        :param fields: anything else to record (task_id, task_type, ...)
+        """
+        entry = dict(fields)
+        entry.update(timing)
+        entry['timestamp'] = datetime.datetime.utcnow().isoformat()
+        entry['pid'] = os.getpid()
+        with open(self.filename, 'a') as f:
+            f.write(json.dumps(entry, default=str) + '\n')
+
+    def read(self):
+        with open(self.filename) as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
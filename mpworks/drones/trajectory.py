@@ -0,0 +1,189 @@
+import copy
+import gridfs
+import numpy as np
+from pymatgen.core.structure import Structure
+from mpworks.db_utils.blobs import load_blob, put_blob
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Compact storage of the ionic steps of a calculation outside of the task doc.
+
+The "ionic_steps" of a calculation output are turned into stacked arrays
+(lattices, fractional coordinates, forces, stresses, energies; one row per
+ionic step) and put into the trajectory_fs GridFS as a blob (see
+mpworks.db_utils.blobs). The task doc keeps "ionic_steps_fs_id" instead.
+Since blob arrays are stored in chunks of rows, a single step (e.g. the
+final stress) can be read without decoding the whole trajectory.
+'''
+
+TRAJECTORY_FS = 'trajectory_fs'
+
+
+def encode_trajectory(ionic_steps):
+    """
+    :param ionic_steps: the "ionic_steps" of a Vasprun.as_dict() output
+    :return: dict of stacked arrays, which TrajectoryReader.get_step() turns
+        back into the individual steps
+    """
+    n = len(ionic_steps)
+    template = copy.deepcopy(ionic_steps[0]['structure'])
+    template['lattice'] = {}
+    for site in template['sites']:
+        site.pop('abc', None)
+        site.pop('xyz', None)
+
+    common = set(ionic_steps[0])
+    for step in ionic_steps[1:]:
+        common &= set(step)
+    arrays = {}
+    for k in common - {'structure', 'electronic_steps'}:
+        a = _stack([s[k] for s in ionic_steps])
+        if a is not None:
+            arrays[k] = a
+    stacked = sorted(arrays)
+
+    d = {"@module": "mpworks.drones.trajectory", "@class": "Trajectory",
+         "n_steps": n, "structure": template,
+         "lattice": np.array([s['structure']['lattice']['matrix']
+                              for s in ionic_steps]),
+         "frac_coords": np.array([[site['abc'] for site in
+                                   s['structure']['sites']]
+                                  for s in ionic_steps]),
+         "keys": stacked,
+         "extra": [{k: v for k, v in s.items() if k not in arrays and
+                    k not in ('structure', 'electronic_steps')}
+                   for s in ionic_steps]}
+    d.update(arrays)
+
+    # electronic steps: every key flattened over all steps of all ionic
+    # steps, NaN where a step does not have the key
+    e_steps = [s.get('electronic_steps', []) for s in ionic_steps]
+    flat = [e for steps in e_steps for e in steps]
+    e_keys = sorted(set(k for e in flat for k in e))
+    d["electronic_steps"] = {
+        "counts": [len(steps) for steps in e_steps], "keys": e_keys,
+        "values": np.array([[e.get(k, np.nan) for k in e_keys] for e in flat],
+                           dtype=float).reshape(len(flat), len(e_keys))}
+    return d
+
+
+def put_trajectory(fs, ionic_steps):
+    """
+    Put the ionic steps into fs (the trajectory_fs GridFS).
+
+    :return: the GridFS id
+    """
+    return put_blob(fs, encode_trajectory(ionic_steps), 'trajectory')
+
+
+def load_trajectory(db, file_id):
+    """
+    :return: a TrajectoryReader of the trajectory file_id in trajectory_fs
+    """
+    return TrajectoryReader(load_blob(gridfs.GridFS(db, TRAJECTORY_FS),
+                                      file_id))
+
+
+class TrajectoryReader(object):
+    """
+    Lazy access to a trajectory put with put_trajectory(). Only the rows
+    of the steps asked for are read.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.doc = reader.doc
+        self.n_steps = self.doc['n_steps']
+        self._e_starts = None
+
+    def __len__(self):
+        return self.n_steps
+
+    def get_array(self, key, rows=None):
+        """
+        :param key: "lattice", "frac_coords" or any of the stacked step keys
+            ("forces", "stress", "e_fr_energy", ...)
+        :param rows: slice (or (start, stop) tuple) of the steps
+        """
+        return _get_rows(self.reader, self.doc[key], rows)
+
+    def get_step(self, i, keys=None):
+        """
+        The ionic step i (negative indices count from the end), as in
+        Vasprun.as_dict().
+
+        :param keys: only decode these keys of the step, e.g. ["stress"]
+        """
+        i = range(self.n_steps)[i]
+        rows = (i, i + 1)
+        step = dict(self.doc['extra'][i])
+        for k in self.doc['keys']:
+            if keys is None or k in keys:
+                step[k] = self.get_array(k, rows)[0].tolist()
+        if keys is None or 'structure' in keys:
+            structure = copy.deepcopy(self.doc['structure'])
+            structure['lattice'] = {
+                'matrix': self.get_array('lattice', rows)[0].tolist()}
+            for site, abc in zip(structure['sites'],
+                                 self.get_array('frac_coords', rows)[0]):
+                site['abc'] = abc.tolist()
+            step['structure'] = Structure.from_dict(structure).as_dict()
+        if keys is None or 'electronic_steps' in keys:
+            step['electronic_steps'] = self._get_electronic_steps(i)
+        if keys is not None:
+            step = {k: v for k, v in step.items() if k in keys}
+        return step
+
+    def get_steps(self):
+        return [self.get_step(i) for i in range(self.n_steps)]
+
+    def _get_electronic_steps(self, i):
+        e = self.doc['electronic_steps']
+        if self._e_starts is None:
+            # the counts are a blob array too once there are enough steps
+            counts = _get_rows(self.reader, e['counts'], None).astype(int)
+            self._e_starts = np.concatenate([[0], np.cumsum(counts)])
+        values = _get_rows(self.reader, e['values'],
+                           (int(self._e_starts[i]),
+                            int(self._e_starts[i + 1])))
+        return [{k: v for k, v in zip(e['keys'], row.tolist())
+                 if not np.isnan(v)} for row in values]
+
+
+def get_final_ionic_step(db, output, keys=None):
+    """
+    The last ionic step of a calculation output of a task doc, whether the
+    steps are in the doc or were offloaded to trajectory_fs.
+
+    :param keys: only these keys of the step are needed (see
+        TrajectoryReader.get_step)
+    """
+    if output.get('ionic_steps'):
+        return output['ionic_steps'][-1]
+    return load_trajectory(db, output['ionic_steps_fs_id']).get_step(
+        -1, keys=keys)
+
+
+def _get_rows(reader, value, rows):
+    # small arrays stay inline in the blob index
+    if isinstance(value, dict) and '@blob' in value:
+        return reader.get_array(value['@blob'], rows=rows)
+    rows = slice(*rows) if isinstance(rows, tuple) else rows
+    return np.array(value, dtype=float)[rows if rows else slice(None)]
+
+
+def _stack(values):
+    # values of one key over all steps as a float array, or None if they are
+    # not all numbers (or lists of numbers) of the same shape
+    if any(v is None or isinstance(v, (bool, dict)) for v in values):
+        return None
+    try:
+        return np.array(values, dtype=float)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,361 @@
+import os
+import numpy as np
+from monty.io import zopen
+from monty.os.path import zpath
+from pymatgen.core.lattice import Lattice
+from pymatgen.core.structure import Structure
+from pymatgen.electronic_structure.bandstructure import BandStructure, \
+    BandStructureSymmLine
+from pymatgen.electronic_structure.core import Spin
+from pymatgen.io.vasp.inputs import Kpoints
+from mpworks.db_utils.blobs import BlobWriter, close_blob_file
+
+try:
+    import xml.etree.cElementTree as ET
+except ImportError:
+    import xml.etree.ElementTree as ET
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Streaming (iterparse) readers for the parts of a vasprun.xml that the DB
+insertion actually needs: the eigenvalues of a band structure and the DOS.
+Unlike pymatgen's Vasprun, these never build the DOM of the whole file, so
+memory scales with the data that is kept rather than with the size of the
+file.
+'''
+
+
+def _floats(text):
+    return [float(x) for x in text.split()]
+
+
+def iterparse_vasprun(filename, keep=None):
+    """
+    Iterate over (event, elem, path) of a (possibly compressed) vasprun.xml,
+    where event is 'start' or 'end' and path is the list of tags from the
+    root down to elem.
+
+    Once its end event has been handled, an element is cleared and dropped
+    from its parent, so that the tree only ever holds the elements that are
+    still open. The exception are the descendants of the elements that
+    keep(elem, path) returned True for on their start event: those are left
+    in place until the kept element itself ends, to be read from it then.
+    """
+    path = []
+    elems = []
+    kept = []
+    n_kept = 0
+    with zopen(filename, 'rb') as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                path.append(elem.tag)
+                elems.append(elem)
+                kept.append(bool(keep and keep(elem, path)))
+                n_kept += kept[-1]
+                yield event, elem, path
+            else:
+                yield event, elem, path
+                path.pop()
+                elems.pop()
+                n_kept -= kept.pop()
+                if not n_kept:
+                    elem.clear()
+                    if elems:
+                        elems[-1].remove(elem)
+
+
+def _varray(elem):
+    return [_floats(v.text) for v in elem.findall('v')]
+
+
+def _keep_eigenvalue_rows(elem, path):
+    # the elements that parse_eigenvalue_data() reads the children of: the
+    # k-points, lattices and positions, the species and the eigenvalues of
+    # each k-point
+    if elem.tag == 'varray':
+        return path[-2] in ('kpoints', 'crystal', 'structure')
+    return (elem.tag == 'array' and path[-2:-1] == ['atominfo'] and
+            elem.attrib.get('name') == 'atoms') or \
+        (elem.tag == 'set' and path[-6:-1] == ['calculation', 'eigenvalues',
+                                               'array', 'set', 'set'])
+
+
+def parse_eigenvalue_data(filename):
+    """
+    Pull the eigenvalues, occupations, k-points, final structure and Fermi
+    level out of a vasprun.xml in a single streaming pass.
+
+    :param filename: path to the vasprun.xml(.gz)
+    :return: dict with keys 'kpoints' (nkpts x 3, fractional), 'weights',
+        'eigenvalues' and 'occupations' ({spin index: nbands x nkpts
+        array}), 'species', 'lattice' (3x3), 'frac_coords', 'efermi' and
+        'lhfcalc'
+    """
+    data = {'kpoints': None, 'weights': None, 'species': [],
+            'lattice': None, 'frac_coords': None, 'efermi': None,
+            'lhfcalc': False}
+    eigen = None  # spin -> list of per-kpoint (nbands x 2) arrays
+    spin = None
+    structure = {}
+
+    for event, elem, path in iterparse_vasprun(filename,
+                                               _keep_eigenvalue_rows):
+        tag = elem.tag
+        parent = path[-2] if len(path) > 1 else None
+        if event == 'start':
+            if tag == 'eigenvalues' and parent == 'calculation':
+                # only keep the eigenvalues of the last ionic step
+                eigen = {}
+            elif tag == 'set' and eigen is not None and \
+                    path[-5:-1] == ['calculation', 'eigenvalues', 'array',
+                                    'set']:
+                spin = int(elem.attrib['comment'].split()[-1])
+                eigen[spin] = []
+            elif tag == 'structure':
+                structure = {'name': elem.attrib.get('name')}
+            continue
+
+        if tag == 'varray' and parent == 'kpoints':
+            if elem.attrib.get('name') == 'kpointlist':
+                data['kpoints'] = np.array(_varray(elem))
+            elif elem.attrib.get('name') == 'weights':
+                data['weights'] = np.array(_varray(elem)).flatten()
+        elif tag == 'array' and parent == 'atominfo' and \
+                elem.attrib.get('name') == 'atoms':
+            data['species'] = [rc.find('c').text.strip()
+                               for rc in elem.find('set').findall('rc')]
+        elif tag == 'i' and parent in ('incar', 'separator') and \
+                elem.attrib.get('name') == 'LHFCALC':
+            data['lhfcalc'] = elem.text.strip().upper().startswith('T')
+        elif tag == 'i' and parent == 'dos' and \
+                elem.attrib.get('name') == 'efermi':
+            data['efermi'] = float(elem.text)
+        elif tag == 'set' and eigen is not None and spin is not None and \
+                path[-6:-1] == ['calculation', 'eigenvalues', 'array', 'set',
+                                'set']:
+            # one k-point of one spin: rows of "energy occupation"
+            eigen[spin].append(np.array([_floats(r.text)
+                                         for r in elem.findall('r')]))
+        elif tag == 'varray' and elem.attrib.get('name') == 'basis' and \
+                path[-3:-1] == ['structure', 'crystal']:
+            structure['lattice'] = np.array(_varray(elem))
+        elif tag == 'varray' and elem.attrib.get('name') == 'positions' \
+                and parent == 'structure':
+            structure['frac_coords'] = np.array(_varray(elem))
+        elif tag == 'structure' and structure.get('name') == 'finalpos':
+            data['lattice'] = structure.get('lattice')
+            data['frac_coords'] = structure.get('frac_coords')
+
+    data['eigenvalues'] = {}
+    data['occupations'] = {}
+    for spin, kpts in (eigen or {}).items():
+        arr = np.array(kpts)  # nkpts x nbands x 2
+        data['eigenvalues'][spin] = arr[:, :, 0].T
+        data['occupations'][spin] = arr[:, :, 1].T
+    return data
+
+
+def get_band_structure(vasprun_file, efermi=None, line_mode=False,
+                       kpoints_filename=None):
+    """
+    Build a BandStructure (or BandStructureSymmLine) from a vasprun.xml,
+    reading only the eigenvalues, k-points and final lattice. Equivalent to
+    Vasprun(vasprun_file).get_band_structure(...) for non-hybrid runs.
+
+    :param vasprun_file: path to the vasprun.xml(.gz)
+    :param efermi: Fermi level; defaults to the one in the vasprun.xml
+    :param line_mode: if True, return a BandStructureSymmLine with the
+        labels from the KPOINTS file
+    :param kpoints_filename: KPOINTS file for the line mode labels; defaults
+        to the KPOINTS next to the vasprun.xml
+    """
+    data = parse_eigenvalue_data(vasprun_file)
+    if data['lhfcalc']:
+        # hybrid band structures carry the zero-weight k-point trick that
+        # only the full Vasprun parser knows how to deal with
+        raise NotImplementedError("Hybrid functional band structures are not "
+                                  "supported by the streaming reader")
+    if not data['eigenvalues']:
+        raise ValueError("No eigenvalues found in {}".format(vasprun_file))
+    if data['lattice'] is None:
+        raise ValueError("No final structure in {}".format(vasprun_file))
+
+    structure = Structure(data['lattice'], data['species'],
+                          data['frac_coords'])
+    lattice_rec = Lattice(structure.lattice.reciprocal_lattice.matrix)
+    efermi = efermi if efermi is not None else data['efermi']
+    kpoints = [np.array(k) for k in data['kpoints']]
+    eigenvals = {Spin.up if spin == 1 else Spin.down: v
+                 for spin, v in data['eigenvalues'].items()}
+
+    if line_mode:
+        if not kpoints_filename:
+            kpoints_filename = zpath(os.path.join(
+                os.path.dirname(vasprun_file), 'KPOINTS'))
+        kpoint_file = Kpoints.from_file(kpoints_filename)
+        labels_dict = {}
+        for c, label in enumerate(kpoint_file.labels):
+            if label is not None:
+                labels_dict[label] = kpoint_file.kpts[c]
+        return BandStructureSymmLine(kpoints, eigenvals, lattice_rec, efermi,
+                                     labels_dict, structure=structure)
+    return BandStructure(kpoints, eigenvals, lattice_rec, efermi,
+                         structure=structure)
+
+
+# the order of pymatgen's Orbital enum, which is how lm-decomposed partial
+# DOS columns are named in CompleteDos.as_dict()
+LM_ORBITALS = ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz', 'dx2',
+               'f_3', 'f_2', 'f_1', 'f0', 'f1', 'f2', 'f3']
+
+
+def _spin_key(spin_index):
+    # str(Spin.up) == "1", str(Spin.down) == "-1"
+    return "1" if spin_index == 1 else "-1"
+
+
+def _add_densities(total, densities):
+    for spin, dens in densities.items():
+        if spin in total:
+            total[spin] += dens
+        else:
+            total[spin] = np.array(dens, dtype=float)
+
+
+def stream_dos_to_gridfs(vasprun_file, structure, fs, **kwargs):
+    """
+    Parse the DOS of a vasprun.xml and write it into GridFS as it goes, as a
+    blob (see mpworks.db_utils.blobs) of CompleteDos.as_dict(). Only one
+    ion's projected DOS is held in memory at a time (plus the total,
+    per-element and per-orbital-type sums), so peak memory does not grow
+    with NEDOS x atoms x spins the way Vasprun(...).complete_dos does. The
+    rest of the file (eigenvalues, projections, ionic steps) is let go
+    element by element as it is read.
+
+    :param vasprun_file: path to the vasprun.xml(.gz)
+    :param structure: the final structure as a dict (the DOS structure)
+    :param fs: gridfs.GridFS to write into
+    :param kwargs: passed to fs.new_file()
+    :return: (the GridFS id of the DOS (of the existing blob, if the same
+        DOS is already in fs), its Fermi level)
+    """
+    species = []
+    doc = {"@module": "pymatgen.electronic_structure.dos",
+           "@class": "CompleteDos", "efermi": None, "structure": structure,
+           "densities": {}, "pdos": []}
+    energies = None
+    total_done = False
+    element_dos = {}
+    spd_dos = {}
+    orbitals = None
+    n_dos = 0
+    ion = None
+
+    f = fs.new_file(**kwargs)
+    try:
+        w = BlobWriter(f)
+        for event, elem, path in iterparse_vasprun(vasprun_file,
+                                                   _keep_dos_rows):
+            tag = elem.tag
+            parent = path[-2] if len(path) > 1 else None
+            if event == 'start':
+                if tag == 'dos':
+                    n_dos += 1
+                    if n_dos > 1:
+                        raise ValueError("More than one DOS in {}"
+                                         .format(vasprun_file))
+                elif tag == 'partial' and parent == 'dos':
+                    orbitals = []
+                elif tag == 'set' and path[-4:-1] == ['partial', 'array',
+                                                      'set']:
+                    ion = {}
+                continue
+
+            if tag == 'array' and parent == 'atominfo' and \
+                    elem.attrib.get('name') == 'atoms':
+                species = [rc.find('c').text.strip()
+                           for rc in elem.find('set').findall('rc')]
+            elif tag == 'i' and parent == 'dos' and \
+                    elem.attrib.get('name') == 'efermi':
+                doc["efermi"] = float(elem.text)
+            elif tag == 'set' and path[-4:-1] == ['total', 'array', 'set']:
+                rows = np.array([_floats(r.text) for r in elem.findall('r')])
+                spin = _spin_key(int(elem.attrib['comment'].split()[-1]))
+                if energies is None:
+                    energies = w.add_array("energies", rows[:, 0])
+                doc["densities"][spin] = w.add_array("densities/" + spin,
+                                                     rows[:, 1])
+            elif tag == 'total' and parent == 'dos':
+                total_done = True
+            elif tag == 'field' and path[-3:-1] == ['partial', 'array']:
+                orbitals.append(elem.text.strip())
+            elif tag == 'set' and path[-5:-1] == ['partial', 'array', 'set',
+                                                  'set']:
+                # one spin of one ion
+                rows = np.array([_floats(r.text) for r in elem.findall('r')])
+                spin = _spin_key(int(elem.attrib['comment'].split()[-1]))
+                ion[spin] = rows[:, 1:]
+            elif tag == 'set' and path[-4:-1] == ['partial', 'array', 'set']:
+                # an ion is complete: write it out and add it to the sums
+                ion_index = int(elem.attrib['comment'].split()[-1]) - 1
+                doc["pdos"].append(_add_ion_pdos(
+                    w, ion, ion_index, orbitals[1:], species, element_dos,
+                    spd_dos))
+                ion = None
+
+        if not total_done:
+            raise ValueError("No complete DOS in {}".format(vasprun_file))
+        doc["energies"] = energies
+        if element_dos:
+            doc["atom_dos"] = {
+                el: _add_dos(w, "atom_dos/" + el, doc["efermi"], energies,
+                             dens) for el, dens in element_dos.items()}
+            doc["spd_dos"] = {
+                orb: _add_dos(w, "spd_dos/" + orb, doc["efermi"], energies,
+                              dens) for orb, dens in spd_dos.items()}
+        w.close(doc, kind='dos')
+    except:
+        f.abort()
+        raise
+    return close_blob_file(fs, f, w, kind='dos'), doc["efermi"]
+
+
+def _keep_dos_rows(elem, path):
+    # the elements that stream_dos_to_gridfs() reads the children of: the
+    # species and the spin sets (of the total and of each ion) of the DOS
+    return (elem.tag == 'array' and path[-2:-1] == ['atominfo'] and
+            elem.attrib.get('name') == 'atoms') or \
+        (elem.tag == 'set' and (path[-4:-1] == ['total', 'array', 'set'] or
+                                path[-5:-1] == ['partial', 'array', 'set',
+                                                'set']))
+
+
+def _add_dos(w, name, efermi, energies, densities):
+    # same as Dos.as_dict(), sharing the energies of the CompleteDos
+    return {"@module": "pymatgen.electronic_structure.dos", "@class": "Dos",
+            "efermi": efermi, "energies": energies,
+            "densities": {spin: w.add_array(name + "/densities/" + spin, dens)
+                          for spin, dens in densities.items()}}
+
+
+def _add_ion_pdos(w, ion, ion_index, orbitals, species, element_dos,
+                  spd_dos):
+    lm = any(['x' in o for o in orbitals])
+    pdos = {}
+    for j, orb in enumerate(orbitals):
+        name = LM_ORBITALS[j] if lm else orb
+        prefix = "pdos/{}/{}/densities/".format(ion_index, name)
+        pdos[name] = {"densities": {
+            spin: w.add_array(prefix + spin, dens[:, j])
+            for spin, dens in ion.items()}}
+        _add_densities(spd_dos.setdefault(name[0], {}),
+                       {spin: dens[:, j] for spin, dens in ion.items()})
+    _add_densities(element_dos.setdefault(species[ion_index], {}),
+                   {spin: dens.sum(axis=1) for spin, dens in ion.items()})
+    return pdos
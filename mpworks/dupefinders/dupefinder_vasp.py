@@ -1,4 +1,5 @@
 from fireworks.features.dupefinder import DupeFinderBase
+from mpworks.firetasks.task_refs import SNL_PENDING_KEY
 
 __author__ = 'Anubhav Jain'
 __copyright__ = 'Copyright 2013, The Materials Project'
@@ -20,6 +21,13 @@ class DupeFinderVasp(DupeFinderBase):
         return set(spec1.get('run_tags', [])) == set(spec2.get('run_tags', []))
 
     def query(self, spec):
+        if SNL_PENDING_KEY in spec:
+            # the final snlgroup_id is not known until the grouping worker
+            # gets to the SNL (which then backfills it into the spec), and
+            # the checkout must not wait for that: only the Fireworks
+            # waiting on the same SNL can be duplicates until then
+            return {'spec.task_type': spec['task_type'],
+                    'spec.' + SNL_PENDING_KEY: spec[SNL_PENDING_KEY]}
         return {'spec.task_type': spec['task_type'],
                 'spec.snlgroup_id': spec['snlgroup_id']}
 
@@ -4,6 +4,7 @@ from fireworks.utilities.fw_serializers import FWSerializable
 from fireworks.utilities.fw_utilities import get_slug
 from mpworks.dupefinders.dupefinder_vasp import DupeFinderVasp, DupeFinderDB
 from mpworks.firetasks.custodian_task import get_custodian_task
+from mpworks.firetasks.task_refs import get_bandgap, get_spec_field
 from mpworks.firetasks.vasp_io_tasks import VaspCopyTask, VaspToDBTask
 from mpworks.firetasks.vasp_setup_tasks import SetupStaticRunTask, \
     SetupNonSCFTask
@@ -36,8 +37,9 @@ class AddEStructureTask(FireTaskBase, FWSerializable):
         print 'sleeping 10s for Mongo'
         time.sleep(10)
         print 'done sleeping'
-        print 'the gap is {}, the cutoff is {}'.format(fw_spec['analysis']['bandgap'], self.gap_cutoff)
-        if fw_spec['analysis']['bandgap'] >= self.gap_cutoff:
+        gap = get_bandgap(fw_spec)
+        print 'the gap is {}, the cutoff is {}'.format(gap, self.gap_cutoff)
+        if gap >= self.gap_cutoff:
             static_dens = 90
             uniform_dens = 1000
             line_dens = 20
@@ -46,7 +48,7 @@ class AddEStructureTask(FireTaskBase, FWSerializable):
             uniform_dens = 1500
             line_dens = 30
 
-        if fw_spec['analysis']['bandgap'] <= self.metal_cutoff:
+        if gap <= self.metal_cutoff:
             user_incar_settings = {"ISMEAR": 1, "SIGMA": 0.2}
         else:
             user_incar_settings = {}
@@ -55,7 +57,7 @@ class AddEStructureTask(FireTaskBase, FWSerializable):
 
         type_name = 'GGA+U' if 'GGA+U' in fw_spec['prev_task_type'] else 'GGA'
 
-        snl = fw_spec['mpsnl']
+        snl = get_spec_field(fw_spec, 'mpsnl')
         f = Composition(snl.structure.composition.reduced_formula).alphabetical_formula
 
         fws = []
@@ -148,13 +150,14 @@ class AddEStructureTask_old(FireTaskBase, FWSerializable):
         print 'sleeping 10s for Mongo'
         time.sleep(10)
         print 'done sleeping'
-        print 'the gap is {}, the cutoff is {}'.format(fw_spec['analysis']['bandgap'], self.gap_cutoff)
+        gap = get_bandgap(fw_spec)
+        print 'the gap is {}, the cutoff is {}'.format(gap, self.gap_cutoff)
 
-        if fw_spec['analysis']['bandgap'] >= self.gap_cutoff:
+        if gap >= self.gap_cutoff:
             print 'Adding more runs...'
             type_name = 'GGA+U' if 'GGA+U' in fw_spec['prev_task_type'] else 'GGA'
 
-            snl = fw_spec['mpsnl']
+            snl = get_spec_field(fw_spec, 'mpsnl')
             f = Composition(snl.structure.composition.reduced_formula).alphabetical_formula
 
             fws = []
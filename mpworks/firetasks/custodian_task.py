@@ -1,5 +1,6 @@
-from gzip import GzipFile
+import json
 import logging
+import traceback
 # import socket
 
 from fireworks.fw_config import FWData
@@ -14,7 +15,13 @@ from custodian.vasp.jobs import VaspJob
 import shlex
 import os
 from fireworks.utilities.fw_utilities import get_slug
-from mpworks.workflows.wf_utils import j_decorate, ScancelJobStepTerminator
+from mpworks.db_utils.connections import get_launchpad
+from mpworks.drones.tail_reader import write_gzip
+from mpworks.firetasks.signal_watcher import VaspSignalWatcher, \
+    VaspSignalError, WATCHED_SIGNALS
+from mpworks.firetasks.task_refs import SNL_PENDING_KEY, get_spec_field
+from mpworks.workflows.wf_utils import j_decorate, ScancelJobStepTerminator, \
+    set_launch_dir_block
 from pymatgen.io.vasp.inputs import Incar
 from monty.json import MontyDecoder
 
@@ -74,6 +81,9 @@ class VaspCustodianTask(FireTaskBase, FWSerializable):
         self.handlers = map(dec.process_decoded, self['handlers'])
         self.max_errors = self.get('max_errors', 1)
         self.gzip_output = self.get('gzip_output', True)
+        # signals to stop the run on as soon as they show up in its outputs
+        # (see mpworks.firetasks.signal_watcher); empty to not watch
+        self.watch_signals = self.get('watch_signals', WATCHED_SIGNALS)
 
     def run_task(self, fw_spec):
 
@@ -81,6 +91,10 @@ class VaspCustodianTask(FireTaskBase, FWSerializable):
         # easier file system browsing
         self._write_formula_file(fw_spec)
 
+        # key this launch by its block-relative dir, by which its
+        # stored_data is looked up at DB insertion
+        self._set_launch_dir_block()
+
         fw_env = fw_spec.get("_fw_env", {})
 
         if "mpi_cmd" in fw_env:
@@ -130,17 +144,34 @@ class VaspCustodianTask(FireTaskBase, FWSerializable):
 
         logging.basicConfig(level=logging.DEBUG)
 
-        c = Custodian(self.handlers, self.jobs, max_errors=self.max_errors, gzipped_output=False,
+        handlers = list(self.handlers)
+        watcher = None
+        if self.watch_signals:
+            watcher = VaspSignalWatcher(self.watch_signals)
+            handlers.append(watcher)
+
+        c = Custodian(handlers, self.jobs, max_errors=self.max_errors, gzipped_output=False,
                       validators=[VasprunXMLValidator()],
                       terminate_func=terminate_func, terminate_on_nonzero_returncode=False)  # manual gzip
-        custodian_out = c.run()
+        try:
+            custodian_out = c.run()
+        except Exception:
+            if watcher is None or not watcher.found:
+                raise
+            # the job was killed early; the signals end up in the
+            # stored_data of the launch (see VaspSignalError.to_dict())
+            all_errors = set()
+            for run in c.run_log:
+                for correction in run['corrections']:
+                    all_errors.update(correction['errors'])
+            raise VaspSignalError(watcher.found, list(all_errors))
 
         if self.gzip_output:
+            # tail-indexed, so that the completion checks of the drone only
+            # decompress the end of the OUTCAR etc.
             for f in os.listdir(os.getcwd()):
                 if not f.lower().endswith("gz") and not f.endswith(".OU") and not f.endswith(".ER"):
-                    with open(f, 'rb') as f_in, \
-                            GzipFile('{}.gz'.format(f), 'wb') as f_out:
-                        f_out.writelines(f_in)
+                    write_gzip(f, '{}.gz'.format(f))
                     os.remove(f)
 
         all_errors = set()
@@ -151,10 +182,18 @@ class VaspCustodianTask(FireTaskBase, FWSerializable):
         stored_data = {'error_list': list(all_errors)}
         update_spec = {'prev_vasp_dir': os.getcwd(),
                        'prev_task_type': fw_spec['task_type'],
-                       'mpsnl': fw_spec['mpsnl'],
-                       'snlgroup_id': fw_spec['snlgroup_id'],
+                       'snlgroup_id': get_spec_field(fw_spec, 'snlgroup_id', wait=False),
                        'run_tags': fw_spec['run_tags'],
                        'parameters': fw_spec.get('parameters')}
+        if SNL_PENDING_KEY in fw_spec:
+            # the SNL is still being grouped; hand that on rather than wait
+            # for it with the nodes of the job allocated
+            update_spec[SNL_PENDING_KEY] = fw_spec[SNL_PENDING_KEY]
+        if 'mpsnl' in fw_spec:
+            update_spec['mpsnl'] = fw_spec['mpsnl']
+        else:
+            # handed over by reference (see mpworks.firetasks.task_refs)
+            update_spec['task_id'] = fw_spec['task_id']
 
         return FWAction(stored_data=stored_data, update_spec=update_spec)
 
@@ -199,12 +238,27 @@ class VaspCustodianTask(FireTaskBase, FWSerializable):
 
     @staticmethod
     def _write_formula_file(fw_spec):
+        # only the composition is needed, which the SNL the parent started
+        # from has as well
         filename = get_slug(
-            'JOB--' + fw_spec['mpsnl'].structure.composition.reduced_formula +
+            'JOB--' + get_spec_field(fw_spec, 'mpsnl', wait=False).structure.composition.reduced_formula +
             '--' + fw_spec['task_type'])
         with open(filename, 'w+') as f:
             f.write('')
 
+    @staticmethod
+    def _set_launch_dir_block():
+        # FireWorks writes FW.json into the launch dir (except offline);
+        # launches this misses are keyed by backfill_launch_dir_block.py
+        if not os.path.exists('FW.json'):
+            return
+        try:
+            with open('FW.json') as f:
+                fw_id = json.load(f)['fw_id']
+            set_launch_dir_block(get_launchpad().launches, fw_id, os.getcwd())
+        except Exception:
+            traceback.print_exc()
+
 
 def get_custodian_task(spec):
     task_type = spec['task_type']
@@ -1,7 +1,6 @@
 from monty.os.path import zpath
 import os
 import json
-from pymongo import MongoClient
 import numpy as np
 from decimal import Decimal
 
@@ -16,8 +15,11 @@ from pymatgen.analysis.elasticity.strain import DeformedStructureSet, Independen
 from pymatgen.analysis.elasticity.stress import Stress
 from pymatgen.analysis.elasticity.elastic import ElasticTensor
 from fireworks.core.firework import Firework, Workflow
+from mpworks.db_utils.connections import get_db_creds, get_tasks_db
+from mpworks.drones.trajectory import get_final_ionic_step
 from mpworks.firetasks.vasp_io_tasks import VaspWriterTask, VaspToDBTask
 from mpworks.firetasks.custodian_task import get_custodian_task
+from mpworks.firetasks.task_refs import get_spec_field
 from fireworks.utilities.fw_utilities import get_slug
 from pymatgen import Composition
 from pymatgen.matproj.snl import StructureNL
@@ -73,7 +75,7 @@ class SetupDeformedStructTask(FireTaskBase, FWSerializable):
 
     def run_task(self, fw_spec):
         # Read structure from previous relaxation
-        relaxed_struct = fw_spec['output']['crystal']
+        relaxed_struct = get_spec_field(fw_spec, 'output')['crystal']
         # Generate deformed structures
         d_struct_set = DeformedStructureSet(relaxed_struct, ns=0.06)
         wf=[]
@@ -133,15 +135,10 @@ class AddElasticDataToDBTask(FireTaskBase, FWSerializable):
     _fw_name = "Add Elastic Data to DB"
 
     def run_task(self, fw_spec):
-        db_dir = os.environ['DB_LOC']
-        db_path = os.path.join(db_dir, 'tasks_db.json')
         i = fw_spec['original_task_id']
 
-        with open(db_path) as f:
-            db_creds = json.load(f)
-        connection = MongoClient(db_creds['host'], db_creds['port'])
-        tdb = connection[db_creds['database']]
-        tdb.authenticate(db_creds['admin_user'], db_creds['admin_password'])
+        db_creds = get_db_creds('tasks_db.json')
+        tdb = get_tasks_db()
         tasks = tdb[db_creds['collection']]
         elasticity = tdb['elasticity']
         ndocs = tasks.find({"original_task_id": i,
@@ -163,7 +160,8 @@ class AddElasticDataToDBTask(FireTaskBase, FWSerializable):
         ss_dict = {}
         for k in tasks.find({"original_task_id": i},
                             {"deformation_matrix":1,
-                             "calculations.output":1,
+                             "calculations.output.ionic_steps":1,
+                             "calculations.output.ionic_steps_fs_id":1,
                              "state":1, "task_id":1}):
             defo = k['deformation_matrix']
             d_ind = np.nonzero(defo - np.eye(3))
@@ -186,8 +184,11 @@ class AddElasticDataToDBTask(FireTaskBase, FWSerializable):
                                              "strain" : sm.tolist(),
                                              "task_id": k["task_id"]}
             if k["state"] == "successful":
-                st = Stress(k["calculations"][-1]["output"] \
-                            ["ionic_steps"][-1]["stress"])
+                # ionic steps may have been offloaded; only the last
+                # stress is read back in that case
+                st = Stress(get_final_ionic_step(
+                    tdb, k["calculations"][-1]["output"],
+                    keys=["stress"])["stress"])
                 ss_dict[sm] = st
         d["snl"] = o["snl"]
         if "run_tags" in o.keys():
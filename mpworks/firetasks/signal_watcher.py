@@ -0,0 +1,91 @@
+import os
+from custodian.custodian import ErrorHandler
+from mpworks.drones.signals import CRITICAL_SIGNALS, VASP_OUT_ERRORS, \
+    SignalWatcher
+from mpworks.drones.tail_reader import is_outcar_complete
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Stopping VASP runs early that can no longer succeed.
+
+VASPOutSignal finds the errors in vasp.out only once the run is over, when
+the task is inserted. VaspSignalWatcher is a custodian monitor that looks for
+the same strings in vasp.out and OUTCAR while VASP runs, reading only what
+was written since its last check. If it finds one of the signals that make
+the task an error anyway, custodian kills the job and gives up, instead of
+letting it run out its allocation.
+
+Errors that custodian's own handlers correct (BRMIX, ZBRENT, EDDDAV, ...)
+are not in the default signals, so that those still get fixed and rerun.
+'''
+
+# the signals of VASPOutSignal that make a task an error whatever happens
+# after they show up
+WATCHED_SIGNALS = [s for s in VASP_OUT_ERRORS if s in CRITICAL_SIGNALS]
+
+OUTPUT_FILENAMES = ["vasp.out", "OUTCAR"]
+
+
+class VaspSignalWatcher(ErrorHandler):
+    """
+    Monitor for the VASPOutSignal errors in the outputs of a running job.
+    Its correction has no actions, i.e. the error is not recoverable.
+    """
+
+    is_monitor = True
+    is_terminating = True
+    raises_runtime_error = True
+
+    def __init__(self, signals=None, output_filenames=None):
+        """
+        :param signals: the signals (keys of VASP_OUT_ERRORS) to stop the
+            job on (default: WATCHED_SIGNALS)
+        :param output_filenames: the files to watch (default:
+            OUTPUT_FILENAMES)
+        """
+        self.signals = signals if signals else WATCHED_SIGNALS
+        self.output_filenames = output_filenames if output_filenames \
+            else OUTPUT_FILENAMES
+        unknown = [s for s in self.signals if s not in VASP_OUT_ERRORS]
+        if unknown:
+            raise ValueError("Unknown signals: {}".format(unknown))
+        self.watcher = SignalWatcher(
+            dict((s, VASP_OUT_ERRORS[s]) for s in self.signals),
+            self.output_filenames)
+        self.found = []
+
+    def check(self):
+        found = self.watcher.poll()
+        if found and os.path.exists("OUTCAR") and \
+                is_outcar_complete("OUTCAR"):
+            # custodian also checks the monitors after the job; a run that
+            # completed is left to the checks at insertion, as before
+            found = set()
+        self.found = sorted(found)
+        return len(self.found) > 0
+
+    def correct(self):
+        return {"errors": self.found, "actions": None}
+
+
+class VaspSignalError(RuntimeError):
+    """
+    Raised by VaspCustodianTask when VaspSignalWatcher stopped the run. Its
+    to_dict() is kept in the stored_data of the launch.
+    """
+
+    def __init__(self, signals, error_list):
+        super(VaspSignalError, self).__init__(
+            "VASP run stopped on signals: {}".format(signals))
+        self.signals = signals
+        self.error_list = error_list
+
+    def to_dict(self):
+        return {'killed_on_signals': self.signals,
+                'error_list': self.error_list}
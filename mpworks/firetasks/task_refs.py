@@ -0,0 +1,136 @@
+import threading
+from collections import OrderedDict
+from monty.json import MontyDecoder
+from mpworks.db_utils.connections import get_db_creds, get_tasks_db
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Reference-based handoff between Fireworks.
+
+With a compact update_spec (COMPACT_UPDATE_SPEC), VaspToDBTask hands its
+children only the task_id and a few scalars ("snlgroup_id" for the
+dupefinders, "bandgap" for the controllers) instead of the whole
+"analysis", "output", "vasp" and "mpsnl". Tasks that need one of those call
+get_spec_field(fw_spec, key): it returns fw_spec[key] if it is there (full
+specs keep working) and otherwise reads it from the task doc of
+fw_spec["task_id"]. Task docs are cached per process, so the Fireworks of a
+resident process (e.g. the DB insertion service) do not read the same
+task twice.
+
+With defer_snl, the final SNL of a relaxation may not be grouped yet when
+VaspToDBTask is done. It then hands over the SNL it started from, plus the
+task_id to wait for as "snl_final_pending". The children resolve the final
+"mpsnl" and "snlgroup_id" with resolve_snl() (get_spec_field() does so for
+those keys) when they first need them, so that only they wait on the
+grouping worker, not the DB insertion. The custodian task (which holds the
+nodes of its job) and the dupefinders (which run in a LaunchPad checkout)
+never wait: they use the SNL the parent started from and hand the marker
+on. The grouping worker writes the final ones into the specs of the
+Fireworks that are still marked (see mpworks.snl_utils.snl_queue).
+'''
+
+# spec key -> (task doc fields to read, function of the task doc)
+REF_FIELDS = {
+    'analysis': (['analysis'], lambda doc: doc['analysis']),
+    'output': (['output'], lambda doc: doc['output']),
+    'mpsnl': (['snl_final', 'snl'],
+              lambda doc: doc['snl_final'] if 'snl_final' in doc
+              else doc['snl']),
+    'vasp': (['calculations.input.incar', 'calculations.input.kpoints'],
+             lambda doc: {'incar': doc['calculations'][-1]['input']['incar'],
+                          'kpoints':
+                              doc['calculations'][-1]['input']['kpoints']})}
+
+# spec key of the task whose SNL is still being grouped
+SNL_PENDING_KEY = 'snl_final_pending'
+# seconds a child waits for that SNL
+SNL_WAIT_TIMEOUT = 3600
+
+_CACHE_SIZE = 256
+
+_lock = threading.Lock()
+_cache = OrderedDict()
+
+
+def compact_update_spec(d):
+    """
+    The part of the update_spec of a successful task doc d that is not
+    looked up by reference.
+    """
+    return {'task_id': d['task_id'],
+            'bandgap': d['analysis'].get('bandgap')}
+
+
+def get_ref_field(task_id, key):
+    """
+    :param task_id: a task in the tasks db (tasks_db.json)
+    :param key: a key of REF_FIELDS
+    :return: the value of key for task_id, as stored (not deserialized)
+    """
+    with _lock:
+        if (task_id, key) in _cache:
+            value = _cache.pop((task_id, key))
+            _cache[(task_id, key)] = value
+            return value
+    fields, func = REF_FIELDS[key]
+    tasks = get_tasks_db()[get_db_creds('tasks_db.json')['collection']]
+    doc = tasks.find_one({'task_id': task_id}, dict.fromkeys(fields, 1))
+    if doc is None:
+        raise ValueError('Task {} not found'.format(task_id))
+    value = func(doc)
+    with _lock:
+        _cache[(task_id, key)] = value
+        while len(_cache) > _CACHE_SIZE:
+            _cache.popitem(last=False)
+    return value
+
+
+def resolve_snl(fw_spec, timeout=SNL_WAIT_TIMEOUT):
+    """
+    If the parent handed over its SNL before it was grouped (see
+    mpworks.snl_utils.snl_queue), wait for the grouping worker and put the
+    final "mpsnl" and "snlgroup_id" into fw_spec (in place). Specs that
+    have the final ones are left alone.
+
+    :return: fw_spec
+    """
+    t_id = fw_spec.get(SNL_PENDING_KEY)
+    if t_id is None:
+        return fw_spec
+    # import here: only deferred SNLs need the SNL db
+    from mpworks.snl_utils.snl_queue import SNLQueue
+    result = SNLQueue.auto_load().wait(t_id, timeout=timeout)
+    fw_spec['mpsnl'] = MontyDecoder().process_decoded(result['snl_final'])
+    fw_spec['snlgroup_id'] = result['snlgroup_id_final']
+    del fw_spec[SNL_PENDING_KEY]
+    return fw_spec
+
+
+def get_spec_field(fw_spec, key, wait=True):
+    """
+    fw_spec[key], or if the spec was handed over by reference, the same
+    value read from the task doc of fw_spec['task_id'] (and deserialized, as
+    FireWorks does with specs).
+
+    :param wait: if True, "mpsnl" and "snlgroup_id" are the final ones (see
+        resolve_snl()). Otherwise a spec whose SNL is still being grouped
+        gives the ones the parent started from, without waiting.
+    """
+    if wait and key in ('mpsnl', 'snlgroup_id'):
+        resolve_snl(fw_spec)
+    if key in fw_spec or key not in REF_FIELDS or 'task_id' not in fw_spec:
+        return fw_spec[key]
+    return MontyDecoder().process_decoded(get_ref_field(fw_spec['task_id'],
+                                                        key))
+
+
+def get_bandgap(fw_spec):
+    if 'bandgap' in fw_spec:
+        return fw_spec['bandgap']
+    return get_spec_field(fw_spec, 'analysis')['bandgap']
@@ -0,0 +1,86 @@
+import json
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+import mongomock
+
+from mpworks.db_utils import connections
+from mpworks.firetasks import task_refs
+from mpworks.firetasks.task_refs import compact_update_spec, get_bandgap, \
+    get_spec_field
+
+
+class TestTaskRefs(TestCase):
+    def setUp(self):
+        self.db_loc = tempfile.mkdtemp()
+        with open(os.path.join(self.db_loc, 'tasks_db.json'), 'w') as f:
+            json.dump({'host': 'localhost', 'port': 27017,
+                       'database': 'mp_test', 'collection': 'tasks',
+                       'admin_user': None, 'admin_password': None}, f)
+        # get_ref_field() reads the credentials from $DB_LOC
+        self._db_loc = os.environ.get('DB_LOC')
+        os.environ['DB_LOC'] = self.db_loc
+        connections.reset()
+        connections.set_client_factory(mongomock.MongoClient)
+        task_refs._cache.clear()
+        self.doc = {'task_id': 'mp-1', 'state': 'successful',
+                    'analysis': {'bandgap': 1.2, 'errors_MP': []},
+                    'output': {'final_energy': -10.0},
+                    'snl': {'about': 'initial'},
+                    'snl_final': {'about': 'final'},
+                    'calculations': [{'input': {'incar': {'ISIF': 3},
+                                                'kpoints': {'kpts': [[4]]}}},
+                                     {'input': {'incar': {'ISIF': 2},
+                                                'kpoints': {'kpts': [[6]]}}}]}
+        connections.get_tasks_db()['tasks'].insert_one(dict(self.doc))
+
+    def tearDown(self):
+        if self._db_loc is None:
+            del os.environ['DB_LOC']
+        else:
+            os.environ['DB_LOC'] = self._db_loc
+        connections.set_client_factory(None)
+        connections.reset()
+        task_refs._cache.clear()
+        shutil.rmtree(self.db_loc)
+
+    def test_full_spec(self):
+        fw_spec = {'analysis': {'bandgap': 0.3}, 'mpsnl': {'about': 'spec'},
+                   'task_id': 'mp-1'}
+        self.assertEqual(get_bandgap(fw_spec), 0.3)
+        self.assertEqual(get_spec_field(fw_spec, 'mpsnl'), {'about': 'spec'})
+        self.assertEqual(get_spec_field(fw_spec, 'analysis'),
+                         {'bandgap': 0.3})
+
+    def test_compact_spec(self):
+        fw_spec = compact_update_spec(self.doc)
+        self.assertEqual(fw_spec, {'task_id': 'mp-1', 'bandgap': 1.2})
+        self.assertEqual(get_bandgap(fw_spec), 1.2)
+        self.assertEqual(get_spec_field(fw_spec, 'analysis'),
+                         self.doc['analysis'])
+        self.assertEqual(get_spec_field(fw_spec, 'output'),
+                         self.doc['output'])
+        self.assertEqual(get_spec_field(fw_spec, 'mpsnl'), {'about': 'final'})
+        self.assertEqual(get_spec_field(fw_spec, 'vasp'),
+                         {'incar': {'ISIF': 2}, 'kpoints': {'kpts': [[6]]}})
+        self.assertRaises(KeyError, get_spec_field, fw_spec, 'prev_vasp_dir')
+        # read once per process
+        connections.get_tasks_db()['tasks'].delete_many({})
+        self.assertEqual(get_bandgap({'task_id': 'mp-1'}), 1.2)
+        self.assertRaises(ValueError, get_spec_field, {'task_id': 'mp-2'},
+                          'analysis')
+
+    def test_pending_snl_no_wait(self):
+        fw_spec = {'mpsnl': {'about': 'initial'}, 'snlgroup_id': 5,
+                   task_refs.SNL_PENDING_KEY: 'mp-1'}
+        self.assertEqual(get_spec_field(fw_spec, 'mpsnl', wait=False),
+                         {'about': 'initial'})
+        self.assertEqual(get_spec_field(fw_spec, 'snlgroup_id', wait=False),
+                         5)
+        self.assertEqual(fw_spec[task_refs.SNL_PENDING_KEY], 'mp-1')
+        # handed over by reference: the SNL of the task doc
+        fw_spec = {'task_id': 'mp-1', task_refs.SNL_PENDING_KEY: 'mp-1'}
+        self.assertEqual(get_spec_field(fw_spec, 'mpsnl', wait=False),
+                         {'about': 'final'})
@@ -4,23 +4,23 @@
 
 """
 import gzip
-import json
 import logging
 import os
-import shutil
 import sys
-from monty.os.path import zpath
 from custodian.vasp.handlers import UnconvergedErrorHandler
-from fireworks.core.launchpad import LaunchPad
-
 from fireworks.utilities.fw_serializers import FWSerializable
 from fireworks.core.firework import FireTaskBase, FWAction, Firework, Workflow
 from fireworks.utilities.fw_utilities import get_slug
+from mpworks.db_utils.connections import get_db_creds, get_launchpad
+from mpworks.drones import launch_archive
+from mpworks.drones.dir_manifest import DirManifest
 from mpworks.drones.mp_vaspdrone import MPVaspDrone
 from mpworks.dupefinders.dupefinder_vasp import DupeFinderVasp
 from mpworks.firetasks.custodian_task import get_custodian_task
 from mpworks.firetasks.vasp_setup_tasks import SetupUnconvergedHandlerTask
-from mpworks.workflows.wf_settings import QA_VASP, QA_DB, MOVE_TO_GARDEN_PROD, MOVE_TO_GARDEN_DEV
+from mpworks.firetasks.task_refs import compact_update_spec, SNL_PENDING_KEY
+from mpworks.workflows.wf_settings import QA_VASP, QA_DB, MOVE_TO_GARDEN_PROD, MOVE_TO_GARDEN_DEV, \
+    COMPACT_UPDATE_SPEC
 from mpworks.workflows.wf_utils import last_relax, get_loc, move_to_garden
 from pymatgen import Composition
 from pymatgen.io.vasp.inputs import Incar, Poscar, Potcar, Kpoints
@@ -79,21 +79,24 @@ class VaspCopyTask(FireTaskBase, FWSerializable):
 
     def run_task(self, fw_spec):
         prev_dir = get_loc(fw_spec['prev_vasp_dir'])
+        # list prev_dir (and its relax subdirs) once for all the files
+        manifest = DirManifest(prev_dir)
 
         if '$ALL' in self.files:
-            self.files = os.listdir(prev_dir)
+            self.files = manifest.names
 
         for file in self.files:
-            prev_filename = last_relax(os.path.join(prev_dir, file))
+            prev_filename = manifest.last_relax(file)
             dest_file = 'POSCAR' if file == 'CONTCAR' and self.use_contcar else file
             if prev_filename.endswith('.gz'):
                 dest_file += '.gz'
 
             print 'COPYING', prev_filename, dest_file
-            if self.missing_CHGCAR_OK and 'CHGCAR' in dest_file and not os.path.exists(zpath(prev_filename)):
+            if self.missing_CHGCAR_OK and 'CHGCAR' in dest_file and not manifest.manifest_of(os.path.dirname(prev_filename)).zname(os.path.basename(prev_filename)):
                 print 'Skipping missing CHGCAR'
             else:
-                shutil.copy2(prev_filename, dest_file)
+                # prev_dir may be archived
+                launch_archive.copy(prev_filename, dest_file)
                 if '.gz' in dest_file:
                     # unzip dest file
                     f = gzip.open(dest_file, 'rb')
@@ -115,13 +118,21 @@ class VaspToDBTask(FireTaskBase, FWSerializable):
 
     def __init__(self, parameters=None):
         """
-        :param parameters: (dict) Potential keys are 'additional_fields', and 'update_duplicates'
+        :param parameters: (dict) Potential keys are 'additional_fields', 'update_duplicates', 'stream_dos',
+            'offload_trajectories', 'record_timing', 'timing_log', 'defer_snl' and
+            'compact_update_spec'
         """
         parameters = parameters if parameters else {}
         self.update(parameters)
 
         self.additional_fields = self.get('additional_fields', {})
         self.update_duplicates = self.get('update_duplicates', False)  # off so DOS/BS doesn't get entered twice
+        self.stream_dos = self.get('stream_dos', True)  # stream the DOS into GridFS rather than parsing it in memory
+        self.offload_trajectories = self.get('offload_trajectories', False)  # keep ionic_steps in trajectory_fs, not in the task doc
+        self.record_timing = self.get('record_timing', False)  # per-phase drone timings in analysis.timing
+        self.timing_log = self.get('timing_log')  # file the drone appends its timings to (JSON lines)
+        self.defer_snl = self.get('defer_snl', False)  # queue the relaxed SNL for the grouping worker instead of adding it here
+        self.compact_update_spec = self.get('compact_update_spec', COMPACT_UPDATE_SPEC)  # hand results over by task_id
 
     def run_task(self, fw_spec):
         if '_fizzled_parents' in fw_spec and 'prev_vasp_dir' not in fw_spec:
@@ -147,32 +158,45 @@ class VaspToDBTask(FireTaskBase, FWSerializable):
         elif MOVE_TO_GARDEN_PROD:
             prev_dir = move_to_garden(prev_dir, prod=True)
 
-        # get the directory containing the db file
-        db_dir = os.environ['DB_LOC']
-        db_path = os.path.join(db_dir, 'tasks_db.json')
-
         logging.basicConfig(level=logging.INFO)
         logger = logging.getLogger('MPVaspDrone')
         logger.setLevel(logging.INFO)
-        sh = logging.StreamHandler(stream=sys.stdout)
-        sh.setLevel(getattr(logging, 'INFO'))
-        logger.addHandler(sh)
-        with open(db_path) as f:
-            db_creds = json.load(f)
-            drone = MPVaspDrone(host=db_creds['host'], port=db_creds['port'],
-                                database=db_creds['database'], user=db_creds['admin_user'],
-                                password=db_creds['admin_password'],
-                                collection=db_creds['collection'], parse_dos=parse_dos,
-                                additional_fields=self.additional_fields,
-                                update_duplicates=self.update_duplicates)
-            t_id, d = drone.assimilate(prev_dir, launches_coll=LaunchPad.auto_load().launches)
+        if not logger.handlers:
+            # only once per process; a resident process (the DB insertion
+            # service) runs many of these tasks
+            sh = logging.StreamHandler(stream=sys.stdout)
+            sh.setLevel(getattr(logging, 'INFO'))
+            logger.addHandler(sh)
+        # the credentials, db connection and LaunchPad are cached per process
+        db_creds = get_db_creds('tasks_db.json')
+        drone = MPVaspDrone(host=db_creds['host'], port=db_creds['port'],
+                            database=db_creds['database'], user=db_creds['admin_user'],
+                            password=db_creds['admin_password'],
+                            collection=db_creds['collection'], parse_dos=parse_dos,
+                            additional_fields=self.additional_fields,
+                            update_duplicates=self.update_duplicates,
+                            stream_dos=self.stream_dos,
+                            offload_trajectories=self.offload_trajectories,
+                            record_timing=self.record_timing,
+                            timing_log=self.timing_log,
+                            defer_snl=self.defer_snl)
+        t_id, d = drone.assimilate(prev_dir, launches_coll=get_launchpad().launches)
 
         mpsnl = d['snl_final'] if 'snl_final' in d else d['snl']
         snlgroup_id = d['snlgroup_id_final'] if 'snlgroup_id_final' in d else d['snlgroup_id']
         update_spec.update({'mpsnl': mpsnl, 'snlgroup_id': snlgroup_id})
+        if d.get('snl_final_pending'):
+            # the final SNL is still being grouped; the children wait for it
+            # when they need it (see mpworks.firetasks.task_refs.resolve_snl)
+            update_spec[SNL_PENDING_KEY] = t_id
 
         print 'ENTERED task id:', t_id
         stored_data = {'task_id': t_id}
+        if d['state'] == 'successful' and self.compact_update_spec:
+            # the children read the rest from the task doc (see mpworks.firetasks.task_refs)
+            del update_spec['mpsnl']
+            update_spec.update(compact_update_spec(d))
+            return FWAction(stored_data=stored_data, update_spec=update_spec)
         if d['state'] == 'successful':
             update_spec['analysis'] = d['analysis']
             update_spec['output'] = d['output']
@@ -198,6 +222,8 @@ class VaspToDBTask(FireTaskBase, FWSerializable):
                         'parameters': fw_spec.get('parameters'),
                         '_dupefinder': DupeFinderVasp().to_dict(),
                         '_priority': fw_spec['_priority']}
+                if SNL_PENDING_KEY in update_spec:
+                    spec[SNL_PENDING_KEY] = update_spec[SNL_PENDING_KEY]
                 # Pass elastic tensor spec
                 if 'deformation_matrix' in fw_spec.keys():
                     spec['deformation_matrix'] = fw_spec['deformation_matrix']
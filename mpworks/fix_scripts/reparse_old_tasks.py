@@ -12,8 +12,7 @@ import json
 import logging
 import os
 import sys
-from pymongo import MongoClient
-from fireworks.core.launchpad import LaunchPad
+from mpworks.db_utils.connections import get_tasks_db
 from mpworks.drones.mp_vaspdrone import MPVaspDrone
 import multiprocessing
 import traceback
@@ -38,17 +37,11 @@ class OldTaskFixer():
 
     @classmethod
     def setup(cls):
-        db_dir = os.environ['DB_LOC']
-        db_path = os.path.join(db_dir, 'tasks_db.json')
-        with open(db_path) as f2:
-            db_creds = json.load(f2)
-            mc2 = MongoClient(db_creds['host'], db_creds['port'])
-            db2 = mc2[db_creds['database']]
-            db2.authenticate(db_creds['admin_user'], db_creds['admin_password'])
-
-            cls.tasks = db2['tasks']
+        cls.tasks = get_tasks_db()['tasks']
 
     def process_task(self, path):
+        # the registry gives each pool worker its own (reused) connection
+        tasks = get_tasks_db()['tasks']
         try:
             #Override incorrect outcar subdocs for two step relaxations
             if os.path.exists(os.path.join(path, "relax2")):
@@ -57,7 +50,7 @@ class OldTaskFixer():
                     for i in [1,2]:
                         outcar = Outcar(zpath(os.path.join(path,"relax"+str(i), "OUTCAR")))
                         m_key = "calculations."+str(i-1)+".output.outcar"
-                        self.tasks.update({'dir_name_full': path}, {'$set': {m_key: outcar.as_dict()}})
+                        tasks.update({'dir_name_full': path}, {'$set': {m_key: outcar.as_dict()}})
                         run_stats["relax"+str(i)] = outcar.run_stats
                 except:
                     logger.error("Bad OUTCAR for {}.".format(path))
@@ -72,15 +65,17 @@ class OldTaskFixer():
                 except:
                     logger.error("Bad run stats for {}.".format(path))
 
-                self.tasks.update({'dir_name_full': path}, {'$set': {"run_stats": run_stats}})
+                tasks.update({'dir_name_full': path}, {'$set': {"run_stats": run_stats}})
                 print 'FINISHED', path
             else:
                 print 'SKIPPING', path
+            return path, None
         except:
             print '-----'
             print 'ENCOUNTERED AN EXCEPTION!!!', path
             traceback.print_exc()
             print '-----'
+            return path, traceback.format_exc()
 
 
 def _analyze(data):
@@ -106,5 +101,10 @@ if __name__ == '__main__':
         m_data.append(d['dir_name_full'])
     print 'GOT all tasks...'
     pool = multiprocessing.Pool(16)
-    pool.map(_analyze, m_data)
-    print 'DONE'
+    failures = [{'path': path, 'error': error} for path, error in
+                pool.imap(_analyze, m_data, chunksize=16) if error]
+    pool.close()
+    pool.join()
+    with open('reparse_old_failures.json', 'w') as f:
+        json.dump(failures, f, indent=4)
+    print 'DONE, {} failures'.format(len(failures))
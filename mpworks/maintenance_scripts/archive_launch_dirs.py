@@ -0,0 +1,119 @@
+from argparse import ArgumentParser
+import glob
+import os
+import shutil
+import time
+import zipfile
+from mpworks.drones.launch_archive import LaunchArchive
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Packs each launch dir of finished blocks in the garden into a single zip
+archive next to it (<block>/<launcher>.zip), then removes the dir. The drone,
+is_valid_vasp_dir and the signal detectors read archived launch dirs in place
+(see mpworks.drones.launch_archive), so the task docs do not change.
+
+Files that are already compressed (.gz, .bz2) are stored as is, the others
+are deflated. Each archive is written under a temporary name, checked
+against the dir (names, sizes and CRCs) and only then renamed into place and
+the dir removed, so an interrupted run leaves every launch dir either plain
+or archived.
+
+Only dirs in which nothing changed for --min_age days are packed; dirs in the
+garden are normally complete once they are moved there.
+'''
+
+_STORED_EXTENSIONS = ('.gz', '.GZ', '.bz2', '.BZ2', '.z', '.Z')
+
+
+def _files(launch_dir):
+    for root, dirs, files in os.walk(launch_dir):
+        for f in files:
+            full = os.path.join(root, f)
+            if os.path.isfile(full) and not os.path.islink(full):
+                yield full, os.path.relpath(full, launch_dir)
+
+
+def _newest_mtime(launch_dir):
+    return max([os.path.getmtime(full) for full, name in _files(launch_dir)]
+               + [os.path.getmtime(launch_dir)])
+
+
+def archive_launch_dir(launch_dir, remove=True):
+    """
+    :param launch_dir: the launch dir to pack into launch_dir + '.zip'
+    :param remove: remove the launch dir once the archive is in place
+    :return: the archive file name
+    """
+    launch_dir = launch_dir.rstrip('/')
+    archive = launch_dir + '.zip'
+    tmp = archive + '.tmp'
+    files = sorted(_files(launch_dir), key=lambda x: x[1])
+    with zipfile.ZipFile(tmp, 'w', allowZip64=True) as z:
+        for full, name in files:
+            compress_type = zipfile.ZIP_STORED if \
+                name.endswith(_STORED_EXTENSIONS) else zipfile.ZIP_DEFLATED
+            z.write(full, name, compress_type)
+
+    # check the archive before the dir goes away
+    with zipfile.ZipFile(tmp) as z:
+        bad = z.testzip()
+    if bad is not None:
+        os.remove(tmp)
+        raise ValueError('Bad member {} in {}'.format(bad, tmp))
+    members = LaunchArchive(tmp).members
+    expected = {name: os.path.getsize(full) for full, name in files}
+    if {name: size for name, (size, mtime) in members.items()} != expected:
+        os.remove(tmp)
+        raise ValueError('Archive {} does not match {}'.format(tmp, launch_dir))
+
+    os.rename(tmp, archive)
+    if remove:
+        shutil.rmtree(launch_dir)
+    return archive
+
+
+def archive_blocks(block_dirs, min_age_days=7, dry_run=False):
+    """
+    Archive all the launch dirs (launcher_*) of the given block dirs.
+
+    :return: (number of dirs archived, list of (launch_dir, error))
+    """
+    cutoff = time.time() - min_age_days * 86400
+    n, failures = 0, []
+    for block_dir in block_dirs:
+        for launch_dir in sorted(glob.glob(os.path.join(block_dir, 'launcher_*'))):
+            if not os.path.isdir(launch_dir):
+                continue
+            if _newest_mtime(launch_dir) > cutoff:
+                print 'TOO RECENT', launch_dir
+                continue
+            if dry_run:
+                print 'WOULD ARCHIVE', launch_dir
+                n += 1
+                continue
+            try:
+                archive_launch_dir(launch_dir)
+                print 'ARCHIVED', launch_dir
+                n += 1
+            except Exception as e:
+                print 'FAILED', launch_dir, e
+                failures.append((launch_dir, repr(e)))
+    return n, failures
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Pack the launch dirs of finished blocks into zip archives')
+    parser.add_argument('blocks', nargs='+', help='block dirs (e.g. $GARDEN/block_2013-05-01-00-00-00-000000)')
+    parser.add_argument('--min_age', help='only archive launch dirs unchanged for this many days', type=float, default=7)
+    parser.add_argument('--dry_run', help='only print what would be archived', action='store_true')
+    args = parser.parse_args()
+
+    n, failures = archive_blocks(args.blocks, args.min_age, args.dry_run)
+    print 'DONE, {} launch dirs archived, {} failed'.format(n, len(failures))
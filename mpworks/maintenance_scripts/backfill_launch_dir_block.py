@@ -0,0 +1,45 @@
+from argparse import ArgumentParser
+from pymongo import ASCENDING, UpdateOne
+from mpworks.db_utils.connections import get_launchpad
+from mpworks.workflows.wf_utils import LAUNCH_DIR_BLOCK_KEY, \
+    get_launch_dir_block
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Indexes (fw_id, launch_dir_block) and sets "launch_dir_block" (the
+block-relative launch directory) on all launches that do not have it yet.
+MPVaspDrone looks up the stored_data of static and non-SCF launches by this
+key (see mpworks.workflows.wf_utils.find_launch()); new launches get it from
+the custodian task. Safe to re-run.
+'''
+
+
+def backfill_launch_dir_block(launches, batch_size=1000):
+    launches.create_index([('fw_id', ASCENDING), (LAUNCH_DIR_BLOCK_KEY, ASCENDING)])
+    n = 0
+    requests = []
+    for l in launches.find({LAUNCH_DIR_BLOCK_KEY: {'$exists': False}}, {'launch_dir': 1}):
+        if not l.get('launch_dir'):
+            continue
+        requests.append(UpdateOne({'_id': l['_id']}, {'$set': {LAUNCH_DIR_BLOCK_KEY: get_launch_dir_block(l['launch_dir'])}}))
+        if len(requests) == batch_size:
+            n += launches.bulk_write(requests, ordered=False).modified_count
+            requests = []
+            print 'UPDATED', n
+    if requests:
+        n += launches.bulk_write(requests, ordered=False).modified_count
+    print 'DONE, updated {} launches'.format(n)
+    return n
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--batch_size', help='number of launches per bulk write', type=int, default=1000)
+    args = parser.parse_args()
+    backfill_launch_dir_block(get_launchpad().launches, args.batch_size)
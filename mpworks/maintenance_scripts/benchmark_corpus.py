@@ -0,0 +1,806 @@
+from collections import OrderedDict
+import glob
+import gzip
+import json
+import math
+import os
+import shutil
+import numpy as np
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+A small, reproducible corpus of launch dirs for benchmarking MPVaspDrone
+(see drone_benchmark.py).
+
+make_corpus() writes one synthetic launch dir for each kind of run that the
+drone treats differently: a double relaxation, a static run, a Uniform and a
+line-mode band structure run (both read stored_data from their launch), a
+GGA+U double relaxation and a deformed structure optimization. The dirs look
+like the ones left behind by VaspCustodianTask (every file gzipped, outputs
+of a double relaxation suffixed .relax1/.relax2), with a complete but small
+vasprun.xml and OUTCAR. scale makes the k-point lists, band counts, DOS grids
+and ionic steps proportionally bigger. Nothing is random and all mtimes are
+fixed, so a given CORPUS_VERSION always writes the same bytes.
+
+trim_launch_dir() adds a copy of a real launch dir with only the files the
+drone reads (no CHGCAR, WAVECAR, ...).
+
+A corpus dir holds one block of launch dirs and a corpus.json that lists them
+with the stored_data of their launches.
+'''
+
+# bump whenever make_corpus() writes different files
+CORPUS_VERSION = 1
+CORPUS_FILE = 'corpus.json'
+BLOCK = 'block_2013-01-01-00-00-00-000000'
+# mtime of every file written by make_corpus()
+MTIME = 1357000000
+
+# what trim_launch_dir() keeps: everything the drone and its signal detectors
+# read
+DRONE_FILES = ['FW.json*', 'INCAR*', 'KPOINTS*', 'POSCAR*', 'POTCAR*',
+               'CONTCAR*', 'OUTCAR*', 'OSZICAR*', 'vasprun.xml*', 'vasp.out*',
+               'custodian.json*', 'transformations.json*', '*.error*']
+
+_FCC = [[0.0, 0.5, 0.5], [0.5, 0.0, 0.5], [0.5, 0.5, 0.0]]
+
+# fcc primitive cells; energy is the final energy per atom
+STRUCTURES = {
+    'Si': {'a': 5.468, 'species': ['Si', 'Si'],
+           'coords': [[0.0, 0.0, 0.0], [0.25, 0.25, 0.25]],
+           'energy': -5.425, 'gap': 0.61},
+    'FeO': {'a': 4.334, 'species': ['Fe', 'O'],
+            'coords': [[0.0, 0.0, 0.0], [0.5, 0.5, 0.5]],
+            'energy': -7.741, 'gap': 2.05}}
+
+# element -> (POTCAR symbol, mass, valence)
+POTCARS = {'Si': ('PAW_PBE Si 05Jan2001', 28.085, 4.0),
+           'Fe': ('PAW_PBE Fe_pv 06Sep2000', 55.847, 14.0),
+           'O': ('PAW_PBE O 08Apr2002', 16.0, 6.0)}
+
+# the fcc high-symmetry path of the line-mode run
+KPATH = {'kpoints': OrderedDict([('\\Gamma', [0.0, 0.0, 0.0]),
+                                 ('X', [0.5, 0.0, 0.5]),
+                                 ('W', [0.5, 0.25, 0.75]),
+                                 ('L', [0.5, 0.5, 0.5])]),
+         'path': [['\\Gamma', 'X', 'W', 'L', '\\Gamma']]}
+
+# name -> how the run looks; n_kpoints, nedos and ionic_steps are multiplied
+# by scale
+RUNS = OrderedDict([
+    ('relax_2x', {'task_type': 'GGA optimize structure (2x)',
+                  'structure': 'Si', 'relax': [1.02, 1.005, 1.0],
+                  'n_kpoints': 10, 'nedos': 301, 'ionic_steps': 4}),
+    ('static', {'task_type': 'GGA static v2', 'structure': 'Si',
+                'n_kpoints': 20, 'nedos': 601, 'ionic_steps': 1}),
+    ('uniform', {'task_type': 'GGA Uniform v2', 'structure': 'Si',
+                 'n_kpoints': 60, 'nedos': 2001, 'ionic_steps': 1,
+                 'nscf': True}),
+    ('line_mode', {'task_type': 'GGA band structure v2', 'structure': 'Si',
+                   'kpath_divisions': 10, 'nedos': 601, 'ionic_steps': 1,
+                   'nscf': True}),
+    ('gga_u', {'task_type': 'GGA+U optimize structure (2x)',
+               'structure': 'FeO', 'relax': [1.03, 1.008, 1.0],
+               'n_kpoints': 10, 'nedos': 301, 'ionic_steps': 4,
+               'ldau': {'Fe': 5.3}, 'ispin': 2}),
+    ('deformed', {'task_type': 'Optimize deformed structure',
+                  'structure': 'Si',
+                  'deformation': [[1.01, 0.0, 0.0], [0.0, 1.0, 0.0],
+                                  [0.0, 0.0, 1.0]],
+                  'n_kpoints': 20, 'nedos': 301, 'ionic_steps': 4})])
+
+
+def make_corpus(corpus_dir, scale=1, runs=None):
+    """
+    Write the synthetic launch dirs (and corpus.json) into corpus_dir.
+
+    :param scale: size factor of the outputs (1 is a few hundred kB per dir)
+    :param runs: names of RUNS to write (default: all)
+    :return: the corpus (contents of corpus.json)
+    """
+    corpus = load_corpus(corpus_dir) if \
+        os.path.exists(os.path.join(corpus_dir, CORPUS_FILE)) else \
+        {'version': CORPUS_VERSION, 'launches': []}
+    for name in runs if runs else RUNS:
+        launch_dir = os.path.join(corpus_dir, BLOCK, 'launcher_' + name)
+        if os.path.exists(launch_dir):
+            shutil.rmtree(launch_dir)
+        os.makedirs(launch_dir)
+        run = _SyntheticRun(name, RUNS[name], scale,
+                            fw_id=list(RUNS).index(name) + 1)
+        run.write(launch_dir)
+        _add_launch(corpus, corpus_dir, launch_dir, name, run.fw_id,
+                    run.task_type, run.stored_data, scale=scale)
+    _save_corpus(corpus_dir, corpus)
+    return corpus
+
+
+def trim_launch_dir(src, corpus_dir, name=None, stored_data=None):
+    """
+    Copy the files of a real launch dir that the drone reads into the
+    corpus (and corpus.json).
+
+    :param name: name of the copy (default: basename of src)
+    :param stored_data: the stored_data of its launch, for static and band
+        structure runs
+    """
+    name = name if name else os.path.basename(src.rstrip('/'))
+    launch_dir = os.path.join(corpus_dir, BLOCK, 'launcher_' + name)
+    if os.path.exists(launch_dir):
+        shutil.rmtree(launch_dir)
+    for sub in ['', 'relax1', 'relax2']:
+        if not os.path.isdir(os.path.join(src, sub)):
+            continue
+        for pattern in DRONE_FILES:
+            for f in glob.glob(os.path.join(src, sub, pattern)):
+                dest = os.path.join(launch_dir, sub)
+                if not os.path.isdir(dest):
+                    os.makedirs(dest)
+                shutil.copy2(f, dest)
+    fw_json = glob.glob(os.path.join(launch_dir, 'FW.json*'))
+    if not fw_json:
+        raise ValueError('No FW.json in {}'.format(src))
+    with _open(fw_json[0]) as f:
+        fw_dict = json.loads(f.read().decode('utf-8'))
+    corpus = load_corpus(corpus_dir) if \
+        os.path.exists(os.path.join(corpus_dir, CORPUS_FILE)) else \
+        {'version': CORPUS_VERSION, 'launches': []}
+    _add_launch(corpus, corpus_dir, launch_dir, name, fw_dict['fw_id'],
+                fw_dict['spec']['task_type'], stored_data or {}, source=src)
+    _save_corpus(corpus_dir, corpus)
+    return launch_dir
+
+
+def load_corpus(corpus_dir):
+    """
+    :return: the contents of corpus.json, with absolute launch dirs
+    """
+    with open(os.path.join(corpus_dir, CORPUS_FILE)) as f:
+        corpus = json.load(f)
+    for l in corpus['launches']:
+        l['launch_dir'] = os.path.join(os.path.abspath(corpus_dir),
+                                       l['launch_dir'])
+    return corpus
+
+
+def _add_launch(corpus, corpus_dir, launch_dir, name, fw_id, task_type,
+                stored_data, **fields):
+    entry = {'name': name, 'fw_id': fw_id, 'task_type': task_type,
+             'launch_dir': os.path.relpath(launch_dir, corpus_dir),
+             'stored_data': stored_data}
+    entry.update(fields)
+    corpus['launches'] = [l for l in corpus['launches'] if l['name'] != name]
+    corpus['launches'].append(entry)
+
+
+def _save_corpus(corpus_dir, corpus):
+    launches = []
+    for l in corpus['launches']:
+        l = dict(l)
+        if os.path.isabs(l['launch_dir']):
+            l['launch_dir'] = os.path.relpath(l['launch_dir'], corpus_dir)
+        launches.append(l)
+    with open(os.path.join(corpus_dir, CORPUS_FILE), 'w') as f:
+        json.dump({'version': corpus['version'], 'launches': launches}, f,
+                  indent=4, sort_keys=True)
+
+
+def _open(filename):
+    return gzip.open(filename, 'rb') if filename.endswith('.gz') else \
+        open(filename, 'rb')
+
+
+def _fmt(values, f='{:16.8f}'):
+    return ' '.join(f.format(v) for v in values)
+
+
+def _varray(name, rows, indent=' '):
+    return '{0}<varray name="{1}">\n{2}{0}</varray>\n'.format(
+        indent, name, ''.join('{} <v>{} </v>\n'.format(indent, _fmt(r))
+                              for r in rows))
+
+
+class _SyntheticRun(object):
+    # the files of one synthetic launch dir
+
+    def __init__(self, name, settings, scale, fw_id):
+        self.name = name
+        self.task_type = settings['task_type']
+        self.fw_id = fw_id
+        s = STRUCTURES[settings['structure']]
+        self.species = s['species']
+        self.elements = list(OrderedDict.fromkeys(self.species))
+        self.coords = s['coords']
+        self.lattice = s['a'] * np.array(_FCC)
+        if 'deformation' in settings:
+            self.deformation = settings['deformation']
+            self.lattice = np.dot(self.lattice,
+                                  np.array(settings['deformation']).T)
+        else:
+            self.deformation = None
+        self.energy = s['energy'] * len(self.species)
+        self.gap = s['gap']
+        self.efermi = 5.0
+        self.ispin = settings.get('ispin', 1)
+        self.ldau = settings.get('ldau')
+        self.nscf = settings.get('nscf', False)
+        self.nelect = sum(POTCARS[e][2] for e in self.species)
+        self.nocc = int(self.nelect) // 2
+        self.nbands = self.nocc + 4 * scale
+        self.nedos = settings['nedos'] * scale
+        self.ionic_steps = settings['ionic_steps'] * scale \
+            if settings['ionic_steps'] > 1 else 1
+        # lattice scale of each relaxation: [start, end of relax1, end of
+        # relax2]; single runs start where they end
+        self.relax = settings.get('relax')
+        if 'kpath_divisions' in settings:
+            self.line_divisions = settings['kpath_divisions'] * scale
+            path = KPATH['path'][0]
+            self.kpoints = []
+            for start, end in zip(path[:-1], path[1:]):
+                k0 = np.array(KPATH['kpoints'][start])
+                k1 = np.array(KPATH['kpoints'][end])
+                for i in range(self.line_divisions):
+                    t = float(i) / (self.line_divisions - 1)
+                    self.kpoints.append(list(k0 + t * (k1 - k0)))
+        else:
+            self.line_divisions = None
+            self.kpoints = self._mesh(settings['n_kpoints'] * scale)
+        self.weights = [1.0 / len(self.kpoints)] * len(self.kpoints)
+        self.stored_data = {}
+        if 'static' in self.task_type:
+            self.stored_data = {'conventional_standard_structure':
+                                self.structure_dict(self.lattice)}
+        elif self.line_divisions:
+            self.stored_data = {'kpath_name': 'fcc',
+                                'kpath': {'kpoints': dict(KPATH['kpoints']),
+                                          'path': KPATH['path']}}
+
+    @staticmethod
+    def _mesh(n):
+        # the first n points of an irreducible-looking wedge of a mesh
+        kpoints = []
+        m = int(math.ceil(n ** (1.0 / 3))) + 1
+        for i in range(m + 1):
+            for j in range(i + 1):
+                for k in range(j + 1):
+                    kpoints.append([0.5 * i / m, 0.5 * j / m, 0.5 * k / m])
+        return kpoints[:n]
+
+    def structure_dict(self, lattice):
+        return {'@module': 'pymatgen.core.structure', '@class': 'Structure',
+                'lattice': {'matrix': [list(v) for v in lattice]},
+                'sites': [{'species': [{'element': e, 'occu': 1}],
+                           'abc': list(c), 'label': e}
+                          for e, c in zip(self.species, self.coords)]}
+
+    def snl_dict(self):
+        d = self.structure_dict(self.lattice)
+        d.update({'@module': 'pymatgen.matproj.snl', '@class': 'StructureNL'})
+        d['about'] = {'authors': [{'name': 'MP benchmark',
+                                   'email': 'benchmark@materialsproject.org'}],
+                      'projects': ['drone benchmark'], 'references': '',
+                      'remarks': [], 'history': [],
+                      'created_at': {'@module': 'datetime',
+                                     '@class': 'datetime',
+                                     'string': '2013-01-01 00:00:00'}}
+        return d
+
+    # --- layout of the launch dir
+
+    def write(self, launch_dir):
+        if self.relax:
+            jobs = [('.relax1', self.relax[0], self.relax[1], False),
+                    ('.relax2', self.relax[1], self.relax[2], True)]
+        else:
+            jobs = [('', 1.0, 1.0, True)]
+        files = {}
+        for suffix, start, end, final in jobs:
+            run_files = self.run_files(start, end)
+            for f, content in run_files.items():
+                if f == 'CONTCAR' and not final:
+                    continue
+                files[f + ('' if f == 'CONTCAR' else suffix)] = content
+        files['FW.json'] = json.dumps(self.fw_dict(), indent=4,
+                                      sort_keys=True)
+        files['custodian.json'] = json.dumps(
+            [{'job': {'@module': 'custodian.vasp.jobs', '@class': 'VaspJob',
+                      'vasp_cmd': 'VASP_EXE', 'output_file': 'vasp.out',
+                      'suffix': suffix, 'final': final},
+              'corrections': []} for suffix, start, end, final in jobs],
+            indent=4, sort_keys=True)
+        files['FW_job.out'] = 'Running VASP\n'
+        files['FW_job.error'] = ''
+        for f, content in files.items():
+            # as VaspCustodianTask leaves them (gzip_output)
+            filename = os.path.join(launch_dir, f + '.gz')
+            with open(filename, 'wb') as raw:
+                z = gzip.GzipFile(f, 'wb', 6, raw, mtime=MTIME)
+                z.write(content.encode('utf-8'))
+                z.close()
+            os.utime(filename, (MTIME, MTIME))
+
+    def fw_dict(self):
+        spec = {'task_type': self.task_type, 'mpsnl': self.snl_dict(),
+                'snlgroup_id': self.fw_id,
+                'run_tags': ['benchmark', self.name],
+                'vaspinputset_name': 'MPVaspInputSet', '_priority': 1}
+        if self.deformation:
+            spec['deformation_matrix'] = self.deformation
+            spec['original_task_id'] = 'mp-1'
+        return {'fw_id': self.fw_id, 'name': self.name, 'spec': spec,
+                'created_on': '2013-01-01T00:00:00'}
+
+    def run_files(self, start, end):
+        steps = self.steps(start, end)
+        return {'INCAR': self.incar(), 'KPOINTS': self.kpoints_file(),
+                'POSCAR': self.poscar(steps[0]['lattice']),
+                'CONTCAR': self.poscar(steps[-1]['lattice']),
+                'POTCAR': self.potcar(), 'vasprun.xml': self.vasprun(steps),
+                'OUTCAR': self.outcar(steps), 'OSZICAR': self.oszicar(steps),
+                'vasp.out': self.vasp_out(steps)}
+
+    def steps(self, start, end):
+        n = self.ionic_steps
+        steps = []
+        for i in range(n):
+            t = float(i) / (n - 1) if n > 1 else 1.0
+            scale = start + t * (end - start)
+            f = 0.2 * 0.5 ** i if n > 1 else 0.0
+            steps.append({'lattice': self.lattice * scale,
+                          'energy': self.energy + 0.4 * (scale - 1) ** 2 * 100 +
+                          0.01 * (n - 1 - i),
+                          'forces': [[f, -f, f] if j % 2 else [-f, f, -f]
+                                     for j in range(len(self.species))],
+                          'stress': 100 * (scale - 1) * np.eye(3) * -10,
+                          'n_sc': 8 if i == 0 else 4})
+        return steps
+
+    # --- inputs
+
+    def incar(self):
+        incar = OrderedDict([('PREC', 'Accurate'), ('ENCUT', 520),
+                             ('EDIFF', 5e-05), ('ISMEAR', -5),
+                             ('ISPIN', self.ispin), ('NELM', 100),
+                             ('LWAVE', 'F'), ('LORBIT', 11)])
+        if self.nscf:
+            incar.update([('ICHARG', 11), ('NSW', 0), ('IBRION', -1),
+                           ('NEDOS', self.nedos)])
+        elif self.ionic_steps > 1:
+            incar.update([('NSW', 99), ('IBRION', 2),
+                          ('ISIF', 2 if self.deformation else 3)])
+        else:
+            incar.update([('NSW', 0), ('IBRION', -1), ('NEDOS', self.nedos)])
+        if self.ispin == 2:
+            incar['MAGMOM'] = ' '.join('5' if e == 'Fe' else '0.6'
+                                       for e in self.species)
+        if self.ldau:
+            incar.update(self._ldau())
+        return ''.join('{} = {}\n'.format(k, v) for k, v in incar.items())
+
+    def _ldau(self):
+        return [('LDAU', 'T'), ('LDAUTYPE', 2),
+                ('LDAUL', ' '.join('2' if e in self.ldau else '0'
+                                   for e in self.elements)),
+                ('LDAUU', ' '.join(str(self.ldau.get(e, 0))
+                                   for e in self.elements)),
+                ('LDAUJ', ' '.join('0' for e in self.elements))]
+
+    def kpoints_file(self):
+        if self.line_divisions:
+            lines = ['Line_mode KPOINTS file', str(self.line_divisions),
+                     'Line_mode', 'Reciprocal']
+            path = KPATH['path'][0]
+            for start, end in zip(path[:-1], path[1:]):
+                for label in (start, end):
+                    lines.append('{} ! {}'.format(
+                        _fmt(KPATH['kpoints'][label], '{:.5f}'), label))
+                lines.append('')
+            return '\n'.join(lines) + '\n'
+        if self.nscf:
+            lines = ['Uniform grid', str(len(self.kpoints)), 'Reciprocal']
+            lines.extend('{} 1'.format(_fmt(k, '{:.8f}'))
+                         for k in self.kpoints)
+            return '\n'.join(lines) + '\n'
+        return 'Automatic kpoint scheme\n0\nGamma\n4 4 4\n'
+
+    def poscar(self, lattice):
+        lines = [''.join(self.elements), '1.0']
+        lines.extend(_fmt(v, '{:.8f}') for v in lattice)
+        lines.append(' '.join(self.elements))
+        lines.append(' '.join(str(self.species.count(e))
+                              for e in self.elements))
+        lines.append('direct')
+        lines.extend('{} {}'.format(_fmt(c, '{:.8f}'), e)
+                     for e, c in zip(self.species, self.coords))
+        return '\n'.join(lines) + '\n'
+
+    def potcar(self):
+        # a stand-in with the header of each POTCAR, not a usable potential
+        blocks = []
+        for e in self.elements:
+            symbol, mass, zval = POTCARS[e]
+            blocks.append(
+                '  {0}\n {2:.8f}\n parameters from PSCTR are:\n'
+                '   VRHFIN ={3}: benchmark stand-in\n'
+                '   LEXCH  = PE\n'
+                '   TITEL  = {0}\n'
+                '   LULTRA =        F    use ultrasoft PP ?\n'
+                '   POMASS = {1:8.3f}; ZVAL   = {2:8.3f}    mass and valenz\n'
+                '   ENMAX  =  400.000; ENMIN  =  300.000 eV\n'
+                '   LPAW   =        T    paw PP\n'
+                ' END of PSCTR-controll parameters\n'
+                ' End of Dataset\n'.format(symbol, mass, zval,
+                                           symbol.split()[1]))
+        return ''.join(blocks)
+
+    # --- outputs
+
+    def eigenvalues(self, k):
+        # a direct gap at Gamma, with the valence band maximum just below
+        # the Fermi level; bands 1.5 eV apart
+        disp = 0.1 * sum(math.cos(2 * math.pi * x) for x in k)
+        vbm = self.efermi - 0.2
+        return [vbm - 0.3 - 1.5 * (self.nocc - 1 - b) + disp
+                if b < self.nocc else
+                vbm + self.gap + 0.3 + 1.5 * (b - self.nocc) - disp
+                for b in range(self.nbands)]
+
+    def vasprun(self, steps):
+        out = ['<?xml version="1.0" encoding="ISO-8859-1"?>\n<modeling>\n',
+               ' <generator>\n'
+               '  <i name="program" type="string">vasp </i>\n'
+               '  <i name="version" type="string">5.3.5  </i>\n'
+               '  <i name="subversion" type="string">31Mar14 (build Jan 01 '
+               '2014 00:00:00) complex  parallel </i>\n'
+               '  <i name="platform" type="string">LinuxIFC </i>\n'
+               '  <i name="date" type="string">2013 01 01 </i>\n'
+               '  <i name="time" type="string">00:00:00 </i>\n'
+               ' </generator>\n',
+               self._xml_incar(), self._xml_kpoints(),
+               self._xml_parameters(), self._xml_atominfo(),
+               self._xml_structure(steps[0]['lattice'], 'initialpos')]
+        for i, step in enumerate(steps):
+            out.append(self._xml_calculation(step, i == len(steps) - 1))
+        out.append(self._xml_structure(steps[-1]['lattice'], 'finalpos'))
+        out.append('</modeling>\n')
+        return ''.join(out)
+
+    def _xml_i(self, name, value, indent='  '):
+        if isinstance(value, bool):
+            return '{}<i type="logical" name="{}"> {}  </i>\n'.format(
+                indent, name, 'T' if value else 'F')
+        if isinstance(value, int):
+            return '{}<i type="int" name="{}"> {:5d}</i>\n'.format(
+                indent, name, value)
+        if isinstance(value, float):
+            return '{}<i name="{}"> {:16.8f}</i>\n'.format(indent, name,
+                                                            value)
+        return '{}<i type="string" name="{}">{}</i>\n'.format(indent, name,
+                                                              value)
+
+    def _xml_v(self, name, values, indent='  '):
+        if all(isinstance(v, int) for v in values):
+            return '{}<v type="int" name="{}"> {} </v>\n'.format(
+                indent, name, _fmt(values, '{:4d}'))
+        return '{}<v name="{}"> {} </v>\n'.format(indent, name,
+                                                  _fmt(values))
+
+    def _ldau_params(self, indent):
+        if not self.ldau:
+            return ''
+        return (self._xml_i('LDAU', True, indent) +
+                self._xml_i('LDAUTYPE', 2, indent) +
+                self._xml_v('LDAUL', [2 if e in self.ldau else 0
+                                      for e in self.elements], indent) +
+                self._xml_v('LDAUU', [float(self.ldau.get(e, 0))
+                                      for e in self.elements], indent) +
+                self._xml_v('LDAUJ', [0.0 for e in self.elements], indent))
+
+    def _magmom(self):
+        return [5.0 if e == 'Fe' else 0.6 for e in self.species] \
+            if self.ispin == 2 else [1.0] * len(self.species)
+
+    def _nsw(self):
+        return 99 if self.ionic_steps > 1 else 0
+
+    def _xml_incar(self):
+        out = [' <incar>\n', self._xml_i('PREC', 'accurate'),
+               self._xml_i('ENCUT', 520.0), self._xml_i('EDIFF', 5e-05),
+               self._xml_i('ISMEAR', -5), self._xml_i('ISPIN', self.ispin),
+               self._xml_i('NSW', self._nsw()), self._xml_i('LWAVE', False),
+               self._xml_i('LORBIT', 11)]
+        if self.nscf:
+            out.append(self._xml_i('ICHARG', 11))
+        if self.ispin == 2:
+            out.append(self._xml_v('MAGMOM', self._magmom()))
+        out.append(self._ldau_params('  '))
+        out.append(' </incar>\n')
+        return ''.join(out)
+
+    def _xml_kpoints(self):
+        if self.line_divisions:
+            path = KPATH['path'][0]
+            gen = ('  <generation param="listgenerated">\n'
+                   '   <i type="int" name="divisions"> {:5d}</i>\n'.format(
+                       self.line_divisions) +
+                   ''.join('   <v> {} </v>\n'.format(_fmt(KPATH['kpoints'][l]))
+                           for l in path) +
+                   '  </generation>\n')
+        elif self.nscf:
+            gen = ''
+        else:
+            gen = ('  <generation param="Gamma">\n'
+                   '   <v type="int" name="divisions">  4 4 4 </v>\n'
+                   '   <v name="usershift"> {0} </v>\n'
+                   '   <v name="genvec1"> {1} </v>\n'
+                   '   <v name="genvec2"> {2} </v>\n'
+                   '   <v name="genvec3"> {3} </v>\n'
+                   '   <v name="shift"> {0} </v>\n'
+                   '  </generation>\n'.format(_fmt([0.0] * 3),
+                                              _fmt([0.25, 0.0, 0.0]),
+                                              _fmt([0.0, 0.25, 0.0]),
+                                              _fmt([0.0, 0.0, 0.25])))
+        return (' <kpoints>\n' + gen +
+                _varray('kpointlist', self.kpoints, '  ') +
+                _varray('weights', [[w] for w in self.weights], '  ') +
+                ' </kpoints>\n')
+
+    def _xml_parameters(self):
+        i, v = self._xml_i, self._xml_v
+        ind = '    '
+        return ''.join([
+            ' <parameters>\n',
+            '  <separator name="general">\n',
+            i('SYSTEM', 'benchmark ' + self.name, ind),
+            '  </separator>\n',
+            '  <separator name="electronic">\n',
+            i('PREC', 'accura', ind), i('ENMAX', 520.0, ind),
+            i('EDIFF', 5e-05, ind), i('IALGO', 38, ind),
+            i('NELECT', float(self.nelect), ind),
+            i('NBANDS', self.nbands, ind), i('NELM', 100, ind),
+            '   <separator name="electronic spin">\n',
+            i('ISPIN', self.ispin, ind + ' '),
+            i('LNONCOLLINEAR', False, ind + ' '),
+            v('MAGMOM', self._magmom(), ind + ' '),
+            '   </separator>\n',
+            '   <separator name="electronic exchange-correlation">\n',
+            i('GGA', '--', ind + ' '), i('LASPH', False, ind + ' '),
+            i('METAGGA', 'none', ind + ' '),
+            '   </separator>\n',
+            '  </separator>\n',
+            '  <separator name="ionic">\n',
+            i('NSW', self._nsw(), ind),
+            i('IBRION', 2 if self.ionic_steps > 1 else -1, ind),
+            i('ISIF', 2 if self.deformation else 3, ind),
+            '  </separator>\n',
+            '  <separator name="dos">\n',
+            i('ISMEAR', -5, ind), i('SIGMA', 0.05, ind),
+            i('NEDOS', self.nedos, ind), i('EFERMI', self.efermi, ind),
+            '  </separator>\n',
+            '  <separator name="LDA+U">\n',
+            self._ldau_params(ind) if self.ldau else i('LDAU', False, ind),
+            '  </separator>\n',
+            '  <separator name="Hartree Fock">\n',
+            i('LHFCALC', False, ind), i('AEXX', 0.0, ind),
+            i('AGGAX', 1.0, ind), i('HFSCREEN', 0.0, ind),
+            '  </separator>\n',
+            '  <separator name="vdW DFT">\n',
+            i('LUSE_VDW', False, ind),
+            '  </separator>\n',
+            '  <separator name="orbital magnetization">\n',
+            i('LCHIMAG', False, ind),
+            '  </separator>\n',
+            ' </parameters>\n'])
+
+    def _xml_atominfo(self):
+        atoms = ''.join('    <rc><c>{:2s}</c><c>{:4d}</c></rc>\n'.format(
+            e, self.elements.index(e) + 1) for e in self.species)
+        types = ''.join(
+            '    <rc><c>{:4d}</c><c>{:2s}</c><c>{:16.8f}</c><c>{:16.8f}</c>'
+            '<c>  {:37s}</c></rc>\n'.format(
+                self.species.count(e), e, POTCARS[e][1], POTCARS[e][2],
+                POTCARS[e][0]) for e in self.elements)
+        return (' <atominfo>\n'
+                '  <atoms>{}</atoms>\n  <types>{}</types>\n'
+                '  <array name="atoms">\n'
+                '   <dimension dim="1">ion</dimension>\n'
+                '   <field type="string">element</field>\n'
+                '   <field type="int">atomtype</field>\n'
+                '   <set>\n{}   </set>\n  </array>\n'
+                '  <array name="atomtypes">\n'
+                '   <dimension dim="1">type</dimension>\n'
+                '   <field type="int">atomspertype</field>\n'
+                '   <field type="string">element</field>\n'
+                '   <field>mass</field>\n   <field>valence</field>\n'
+                '   <field type="string">pseudopotential</field>\n'
+                '   <set>\n{}   </set>\n  </array>\n'
+                ' </atominfo>\n'.format(len(self.species), len(self.elements),
+                                        atoms, types))
+
+    def _xml_structure(self, lattice, name=None):
+        return (' <structure{}>\n  <crystal>\n'.format(
+            ' name="{}"'.format(name) if name else '') +
+            _varray('basis', lattice, '   ') +
+            '   <i name="volume"> {:16.8f} </i>\n'.format(
+                abs(np.linalg.det(lattice))) +
+            _varray('rec_basis', np.linalg.inv(lattice).T, '   ') +
+            '  </crystal>\n' + _varray('positions', self.coords, '  ') +
+            ' </structure>\n')
+
+    def _xml_energy(self, e, indent):
+        return ('{0}<energy>\n'
+                '{0} <i name="e_fr_energy"> {1:16.8f} </i>\n'
+                '{0} <i name="e_wo_entrp"> {1:16.8f} </i>\n'
+                '{0} <i name="e_0_energy"> {1:16.8f} </i>\n'
+                '{0}</energy>\n'.format(indent, e))
+
+    def _xml_calculation(self, step, last):
+        out = [' <calculation>\n']
+        for j in range(step['n_sc']):
+            e = step['energy'] + 10.0 ** (1 - j) if j < step['n_sc'] - 1 \
+                else step['energy']
+            out.append('  <scstep>\n' + self._xml_energy(e, '   ') +
+                       '  </scstep>\n')
+        out.append(self._xml_structure(step['lattice']))
+        out.append(_varray('forces', step['forces'], '  '))
+        out.append(_varray('stress', step['stress'], '  '))
+        out.append(self._xml_energy(step['energy'], '  '))
+        if last:
+            out.append(self._xml_eigenvalues())
+            out.append(self._xml_dos())
+        out.append(' </calculation>\n')
+        return ''.join(out)
+
+    def _xml_eigenvalues(self):
+        out = ['  <eigenvalues>\n   <array>\n'
+               '    <dimension dim="1">band</dimension>\n'
+               '    <dimension dim="2">kpoint</dimension>\n'
+               '    <dimension dim="3">spin</dimension>\n'
+               '    <field>eigene</field>\n    <field>occ</field>\n'
+               '    <set>\n']
+        for spin in range(self.ispin):
+            out.append('     <set comment="spin {}">\n'.format(spin + 1))
+            for i, k in enumerate(self.kpoints):
+                out.append('      <set comment="kpoint {}">\n'.format(i + 1))
+                out.extend('       <r> {:10.4f} {:8.4f} </r>\n'.format(
+                    e, 1.0 if b < self.nocc else 0.0)
+                    for b, e in enumerate(self.eigenvalues(k)))
+                out.append('      </set>\n')
+            out.append('     </set>\n')
+        out.append('    </set>\n   </array>\n  </eigenvalues>\n')
+        return ''.join(out)
+
+    def _xml_dos(self):
+        eig = np.array([self.eigenvalues(k) for k in self.kpoints])
+        energies = np.linspace(eig.min() - 2, eig.max() + 2, self.nedos)
+        total = np.zeros(self.nedos)
+        for w, row in zip(self.weights, eig):
+            for e in row:
+                total += w * np.exp(-((energies - e) / 0.05) ** 2) / \
+                    (0.05 * math.sqrt(math.pi))
+        integrated = np.cumsum(total) * (energies[1] - energies[0])
+        # s, py, pz, px, dxy, dyz, dz2, dxz, x2-y2
+        orbitals = ['s', 'py', 'pz', 'px', 'dxy', 'dyz', 'dz2', 'dxz',
+                    'x2-y2']
+        weights = np.array([0.3, 0.2, 0.2, 0.2, 0.02, 0.02, 0.02, 0.02,
+                            0.02]) / len(self.species)
+        out = ['  <dos>\n   <i name="efermi"> {:12.8f} </i>\n'.format(
+            self.efermi),
+            '   <total>\n    <array>\n'
+            '     <dimension dim="1">gridpoints</dimension>\n'
+            '     <dimension dim="2">spin</dimension>\n'
+            '     <field>energy</field>\n     <field>total</field>\n'
+            '     <field>integrated</field>\n     <set>\n']
+        for spin in range(self.ispin):
+            out.append('      <set comment="spin {}">\n'.format(spin + 1))
+            out.extend('       <r> {:10.4f} {:10.4f} {:10.4f} </r>\n'.format(
+                e, t, n) for e, t, n in zip(energies, total, integrated))
+            out.append('      </set>\n')
+        out.append('     </set>\n    </array>\n   </total>\n')
+        out.append('   <partial>\n    <array>\n'
+                   '     <dimension dim="1">gridpoints</dimension>\n'
+                   '     <dimension dim="2">spin</dimension>\n'
+                   '     <dimension dim="3">ion</dimension>\n'
+                   '     <field>energy</field>\n' +
+                   ''.join('     <field>{:>6s}</field>\n'.format(o)
+                           for o in orbitals) + '     <set>\n')
+        for ion in range(len(self.species)):
+            out.append('      <set comment="ion {}">\n'.format(ion + 1))
+            for spin in range(self.ispin):
+                out.append('       <set comment="spin {}">\n'.format(
+                    spin + 1))
+                out.extend('        <r> {:10.4f} {} </r>\n'.format(
+                    e, _fmt(t * weights, '{:8.4f}'))
+                    for e, t in zip(energies, total))
+                out.append('       </set>\n')
+            out.append('      </set>\n')
+        out.append('     </set>\n    </array>\n   </partial>\n  </dos>\n')
+        return ''.join(out)
+
+    def outcar(self, steps):
+        out = [' vasp.5.3.5 31Mar14 (build Jan 01 2014 00:00:00) complex\n',
+               ' executed on             LinuxIFC date 2013.01.01  '
+               '00:00:00\n',
+               ' running on   16 total cores\n',
+               ' distrk:  each k-point on   16 cores,    1 groups\n\n',
+               ' Dimension of arrays:\n'
+               '   k-points           NKPTS = {:6d}   k-points in BZ     '
+               'NKDIM = {:6d}   number of bands    NBANDS= {:6d}\n'.format(
+                   len(self.kpoints), len(self.kpoints), self.nbands),
+               '   number of dos      NEDOS = {:6d}   number of ions     '
+               'NIONS = {:6d}\n'.format(self.nedos, len(self.species)),
+               '   total plane-waves  NPLWV =  13824\n\n',
+               '   ISPIN  =      {}\n'.format(self.ispin),
+               '   IBRION =     {:2d}\n'.format(
+                   2 if self.ionic_steps > 1 else -1),
+               '   NSW    =     {:2d}\n'.format(self._nsw()),
+               '   LEPSILON=     F\n\n']
+        for step in steps:
+            out.append('  FREE ENERGIE OF THE ION-ELECTRON SYSTEM (eV)\n'
+                       '  ---------------------------------------------------\n'
+                       '  free  energy   TOTEN  = {0:18.8f} eV\n\n'
+                       '  energy  without entropy= {0:18.8f}  '
+                       'energy(sigma->0) = {0:18.8f}\n\n'.format(
+                           step['energy']))
+        out.append(' E-fermi : {:10.4f}     XC(G=0):  -8.4000     '
+                   'alpha+bet : -6.2000\n\n'.format(self.efermi))
+        magmom = [0.0] * len(self.species)
+        out.append(' number of electron {:15.7f} magnetization {:15.7f}\n\n'
+                   .format(self.nelect, sum(magmom)))
+        tables = [('total charge', [0.5, 0.8, 0.1])]
+        if self.ispin == 2:
+            tables.append(('magnetization (x)', [0.0, 0.0, 0.0]))
+        for title, row in tables:
+            out.append(' {}\n\n# of ion       s       p       d       tot\n'
+                       '------------------------------------------\n'
+                       .format(title))
+            for i in range(len(self.species)):
+                out.append('{:5d}  {}\n'.format(
+                    i + 1, _fmt(row + [sum(row)], '{:8.3f}')))
+            out.append('--------------------------------------------------\n'
+                       'tot    {}\n\n'.format(_fmt(
+                           [x * len(self.species) for x in row] +
+                           [sum(row) * len(self.species)], '{:8.3f}')))
+        out.append(' General timing and accounting informations for this '
+                   'job:\n ========================================================\n\n'
+                   '                  Total CPU time used (sec):   {0:10.3f}\n'
+                   '                            User time (sec):   {1:10.3f}\n'
+                   '                          System time (sec):   {2:10.3f}\n'
+                   '                         Elapsed time (sec):   {3:10.3f}\n\n'
+                   '                   Maximum memory used (kb):      123456.\n'
+                   '                   Average memory used (kb):           0.\n\n'
+                   '                          Minor page faults:        12345\n'
+                   '                          Major page faults:            0\n'
+                   '                 Voluntary context switches:          123\n'
+                   .format(12.0 * len(steps), 11.0 * len(steps),
+                           1.0 * len(steps), 13.0 * len(steps)))
+        return ''.join(out)
+
+    def oszicar(self, steps):
+        out = []
+        for i, step in enumerate(steps):
+            out.append('       N       E                     dE             '
+                       'd eps       ncg     rms          rms(c)\n')
+            for j in range(step['n_sc']):
+                out.append('DAV: {:3d}    {:.8E}   -0.10000E+00   '
+                           '-0.10000E+00   100   0.100E+00\n'.format(
+                               j + 1, step['energy']))
+            out.append('{:4d} F= {:.8E} E0= {:.8E}  d E =-0.100000E-01\n'
+                       .format(i + 1, step['energy'], step['energy']))
+        return ''.join(out)
+
+    def vasp_out(self, steps):
+        return (' running on   16 total cores\n'
+                ' distrk:  each k-point on   16 cores,    1 groups\n'
+                ' using from now: INCAR\n'
+                ' vasp.5.3.5 31Mar14 (build Jan 01 2014 00:00:00) complex\n'
+                ' POSCAR found :  {} types and {:7d} ions\n'.format(
+                    len(self.elements), len(self.species)) +
+                self.oszicar(steps) + ' writing wavefunctions\n')
@@ -0,0 +1,322 @@
+from argparse import ArgumentParser
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import numpy as np
+import yaml
+from bson import BSON
+from mpworks.db_utils import connections
+from mpworks.drones.launch_archive import zopen, zpath
+from mpworks.drones.timing import TimingLog
+from mpworks.drones.trajectory import TRAJECTORY_FS
+from mpworks.maintenance_scripts.benchmark_corpus import load_corpus, \
+    make_corpus, trim_launch_dir, RUNS
+from mpworks.maintenance_scripts.drone_timing_report import collect, get_report
+from mpworks.workflows.wf_utils import LAUNCH_DIR_BLOCK_KEY, find_launch, \
+    get_block_part, get_launch_dir_block
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Offline benchmark of MPVaspDrone on a fixed corpus of launch dirs (see
+benchmark_corpus.py), to tell whether a pymatgen or drone change made DB
+insertion slower before the QA_DB jobs start timing out.
+
+Every launch dir is assimilated as VaspToDBTask does it (SNL registration,
+GridFS, launch lookups and all), after a warm-up, --repeat times on a clean
+tasks db. The report gives, per launch dir, the per-phase times (as in
+drone_timing_report.py), the throughput, the peak memory of the process and
+the size of the task doc and of its GridFS blobs. Each launch dir is run in a
+forked process of its own, so that its peak memory is its own.
+
+By default all the databases (tasks, SNL, launches) live in mongomock (which
+needs GridFS support, i.e. mongomock >= 3.19), so the numbers are those of
+the drone itself. With --host/--port they go to a (local) mongod instead,
+into the databases drone_benchmark and drone_benchmark_snl, which are
+dropped first.
+
+    python drone_benchmark.py <corpus_dir> --make [--scale 4]
+    python drone_benchmark.py <corpus_dir> --trim <launch_dir> ...
+    python drone_benchmark.py <corpus_dir> [--repeat 5] [--save new.json]
+        [--baseline old.json]
+'''
+
+TASKS_DB = 'drone_benchmark'
+SNL_DB = 'drone_benchmark_snl'
+_FS_NAMES = ['dos_fs', 'band_structure_fs', TRAJECTORY_FS]
+
+
+def use_mongomock():
+    """
+    Have every connection of this process (and its children) go to one
+    in-memory mongomock server.
+    """
+    import mongomock
+    import mongomock.gridfs
+    mongomock.gridfs.enable_gridfs_integration()
+    client = mongomock.MongoClient()
+    connections.set_client_factory(lambda host, port, **kwargs: client)
+
+
+def setup_dbs(corpus, host='localhost', port=27017):
+    """
+    Empty benchmark databases, with the launches of the corpus, and a DB_LOC
+    (a temporary dir) that points the SNL db at them.
+
+    :return: the DB_LOC dir
+    """
+    client = connections.get_client(host, port)
+    client.drop_database(TASKS_DB)
+    client.drop_database(SNL_DB)
+    launches = connections.get_database(host, port, TASKS_DB).launches
+    for i, l in enumerate(corpus['launches']):
+        launches.insert_one({'launch_id': i + 1, 'fw_id': l['fw_id'],
+                             'state': 'COMPLETED',
+                             'launch_dir': l['launch_dir'],
+                             LAUNCH_DIR_BLOCK_KEY:
+                                 get_launch_dir_block(l['launch_dir']),
+                             'action': {'stored_data': l['stored_data']}})
+    db_loc = tempfile.mkdtemp(prefix='drone_benchmark_')
+    with open(os.path.join(db_loc, 'snl_db.yaml'), 'w') as f:
+        yaml.safe_dump({'host': host, 'port': port, 'db': SNL_DB,
+                        'username': None, 'password': None}, f)
+    with open(os.path.join(db_loc, 'tasks_db.json'), 'w') as f:
+        json.dump({'host': host, 'port': port, 'database': TASKS_DB,
+                   'collection': 'tasks', 'admin_user': None,
+                   'admin_password': None, 'readonly_user': None,
+                   'readonly_password': None}, f)
+    os.environ['DB_LOC'] = db_loc
+    return db_loc
+
+
+def _clear(host, port):
+    # a fresh insert each time: no task doc, blob or SNL to reuse
+    db = connections.get_database(host, port, TASKS_DB)
+    db.tasks.delete_many({})
+    for fs_name in _FS_NAMES:
+        db[fs_name + '.files'].delete_many({})
+        db[fs_name + '.chunks'].delete_many({})
+    snl_db = connections.get_database(host, port, SNL_DB)
+    for name in ['snl', 'snlgroups', 'snl_queue']:
+        snl_db[name].delete_many({})
+
+
+def _dir_size(path):
+    return sum(os.path.getsize(os.path.join(root, f))
+               for root, dirs, files in os.walk(path) for f in files)
+
+
+def benchmark_launch(launch, repeat=3, warmup=1, host='localhost',
+                     port=27017, drone_kwargs=None):
+    """
+    Assimilate one launch dir of the corpus warmup + repeat times, in this
+    process.
+
+    :param drone_kwargs: extra MPVaspDrone kwargs (e.g. {"stream_dos":
+        false}) on top of the ones of VaspToDBTask
+    :return: {'name', 'task_type', 'state', 'timings' (PhaseTimer dicts of
+        the timed runs), 'doc_size', 'blob_size', 'input_size',
+        'start_rss', 'max_rss'}, sizes in bytes
+    """
+    from mpworks.drones.mp_vaspdrone import MPVaspDrone
+    start_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    with zopen(zpath(os.path.join(launch['launch_dir'], 'FW.json'))) as f:
+        fw_spec = json.load(f)['spec']
+    fd, timing_log = tempfile.mkstemp(prefix='drone_benchmark_',
+                                      suffix='.json')
+    os.close(fd)
+    kwargs = {'host': host, 'port': port, 'database': TASKS_DB,
+              'collection': 'tasks',
+              'parse_dos': 'Uniform' in launch['task_type'],
+              'additional_fields': {'run_tags': fw_spec.get('run_tags', [])},
+              'update_duplicates': False, 'stream_dos': True,
+              'timing_log': timing_log}
+    kwargs.update(drone_kwargs or {})
+    drone = MPVaspDrone(**kwargs)
+    db = connections.get_database(host, port, TASKS_DB)
+    result = {'name': launch['name'], 'task_type': launch['task_type'],
+              'input_size': _dir_size(launch['launch_dir'])}
+    try:
+        for i in range(warmup + repeat):
+            _clear(host, port)
+            if i == warmup:
+                # only the timed runs
+                open(timing_log, 'w').close()
+            t_id, d = drone.assimilate(launch['launch_dir'],
+                                       launches_coll=db.launches)
+            drone.flush_writes()
+        doc = db.tasks.find_one({'task_id': t_id})
+        result['state'] = doc['state']
+        result['doc_size'] = len(BSON.encode(doc))
+        result['blob_size'] = sum(f['length'] for fs_name in _FS_NAMES
+                                  for f in db[fs_name + '.files'].find())
+        result['timings'] = list(TimingLog(timing_log).read())
+    finally:
+        if os.path.exists(timing_log):
+            os.remove(timing_log)
+    result['start_rss'] = start_rss
+    result['max_rss'] = resource.getrusage(
+        resource.RUSAGE_SELF).ru_maxrss * 1024
+    return result
+
+
+def _benchmark_in_child(queue, launch, args):
+    try:
+        queue.put(benchmark_launch(launch, *args))
+    except Exception as e:
+        queue.put({'name': launch['name'], 'task_type': launch['task_type'],
+                   'error': repr(e)})
+        raise
+
+
+def run_benchmark(corpus, repeat=3, warmup=1, host='localhost', port=27017,
+                  drone_kwargs=None, names=None, fork=True):
+    """
+    benchmark_launch() over the launches of a corpus, each in a forked
+    process of its own unless fork is False.
+
+    :param names: names of the launches to run (default: all)
+    :return: list of the results of benchmark_launch()
+    """
+    results = []
+    for launch in corpus['launches']:
+        if names and launch['name'] not in names:
+            continue
+        args = (repeat, warmup, host, port, drone_kwargs)
+        if not fork:
+            results.append(benchmark_launch(launch, *args))
+            continue
+        queue = multiprocessing.Queue()
+        p = multiprocessing.Process(target=_benchmark_in_child,
+                                    args=(queue, launch, args))
+        p.start()
+        results.append(queue.get())
+        p.join()
+    return results
+
+
+def summarize(results):
+    """
+    :return: {name: {...}} with the median time, throughput, sizes and
+        memory of each launch dir
+    """
+    summary = {}
+    for r in results:
+        if 'error' in r:
+            summary[r['name']] = {'task_type': r['task_type'],
+                                  'error': r['error']}
+            continue
+        total = np.median([t['total'] for t in r['timings']])
+        phases = {}
+        for t in r['timings']:
+            for phase, s in t['phases'].items():
+                phases.setdefault(phase, []).append(s)
+        summary[r['name']] = {
+            'task_type': r['task_type'], 'state': r['state'],
+            'n': len(r['timings']), 'median_s': total,
+            'dirs_per_s': 1 / total if total else None,
+            'input_mb_per_s': r['input_size'] / 1e6 / total if total
+            else None,
+            'phases_median_s': {p: np.median(s) for p, s in phases.items()},
+            'doc_kb': r['doc_size'] / 1e3, 'blob_kb': r['blob_size'] / 1e3,
+            'input_kb': r['input_size'] / 1e3,
+            'max_rss_mb': r['max_rss'] / 1e6,
+            'rss_growth_mb': (r['max_rss'] - r['start_rss']) / 1e6}
+    return summary
+
+
+def get_summary_report(summary, baseline=None):
+    lines = ['{:<14}{:>8}{:>10}{:>10}{:>10}{:>10}{:>10}{:>10}'.format(
+        'launch', 'state', 'median_s', 'dirs/s', 'MB/s', 'doc_kB',
+        'blob_kB', 'rss_MB') +
+        ('{:>12}'.format('vs_baseline') if baseline else '')]
+    for name in sorted(summary):
+        s = summary[name]
+        if 'error' in s:
+            lines.append('{:<14}  ERROR {}'.format(name, s['error']))
+            continue
+        line = '{:<14}{:>8}{:>10.3f}{:>10.2f}{:>10.2f}{:>10.1f}{:>10.1f}' \
+               '{:>10.1f}'.format(name, s['state'][:7], s['median_s'],
+                                  s['dirs_per_s'], s['input_mb_per_s'],
+                                  s['doc_kb'], s['blob_kb'], s['max_rss_mb'])
+        old = (baseline or {}).get(name)
+        if old and 'median_s' in old:
+            line += '{:>11.2f}x'.format(s['median_s'] / old['median_s'])
+        lines.append(line)
+    return '\n'.join(lines)
+
+
+def run(args):
+    corpus = load_corpus(args.corpus)
+    if args.host:
+        host = args.host
+    else:
+        use_mongomock()
+        host = 'localhost'
+    db_loc = setup_dbs(corpus, host, args.port)
+    try:
+        results = run_benchmark(corpus, args.repeat, args.warmup, host,
+                                args.port,
+                                json.loads(args.drone_kwargs) if
+                                args.drone_kwargs else None,
+                                args.names, not args.no_fork)
+    finally:
+        shutil.rmtree(db_loc, ignore_errors=True)
+    summary = summarize(results)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    if args.phases:
+        print get_report(collect(dict(t, task_type=r['name'])
+                                 for r in results if 'timings' in r
+                                 for t in r['timings']))
+        print
+    print get_summary_report(summary, baseline)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(summary, f, indent=4, sort_keys=True)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description='Benchmark MPVaspDrone on a corpus of launch dirs')
+    parser.add_argument('corpus', help='corpus dir')
+    parser.add_argument('--make', help='(re)write the synthetic launch dirs of the corpus', action='store_true')
+    parser.add_argument('--scale', help='size factor of the synthetic launch dirs', type=int, default=1)
+    parser.add_argument('--trim', help='add trimmed copies of these real launch dirs to the corpus', nargs='+', default=None)
+    parser.add_argument('--names', help='only benchmark these launches of the corpus', nargs='+', default=None)
+    parser.add_argument('--repeat', help='timed assimilations per launch dir', type=int, default=3)
+    parser.add_argument('--warmup', help='untimed assimilations per launch dir', type=int, default=1)
+    parser.add_argument('--host', help='mongod host (default: mongomock)', default=None)
+    parser.add_argument('--port', help='mongod port', type=int, default=27017)
+    parser.add_argument('--drone_kwargs', help='extra MPVaspDrone kwargs, as JSON', default=None)
+    parser.add_argument('--no_fork', help='run everything in this process', action='store_true')
+    parser.add_argument('--phases', help='also print the per-phase times', action='store_true')
+    parser.add_argument('--save', help='write the summary to this JSON file', default=None)
+    parser.add_argument('--baseline', help='compare with a summary saved earlier', default=None)
+    args = parser.parse_args()
+
+    if args.make:
+        make_corpus(args.corpus, args.scale)
+        print 'WROTE', ', '.join(RUNS)
+    for launch_dir in args.trim or []:
+        # the stored_data of static and band structure runs comes from their
+        # launch
+        with zopen(zpath(os.path.join(launch_dir, 'FW.json'))) as f:
+            fw_id = json.load(f)['fw_id']
+        l = find_launch(connections.get_launchpad().launches, fw_id,
+                        launch_dir, ['action.stored_data'])
+        print 'TRIMMED', trim_launch_dir(
+            launch_dir, args.corpus,
+            name=get_block_part(launch_dir).replace('/', '_'),
+            stored_data=l['action']['stored_data'] if l else None)
+    if not args.make and not args.trim:
+        run(args)
@@ -0,0 +1,80 @@
+from argparse import ArgumentParser
+from collections import defaultdict
+import numpy as np
+from mpworks.drones.timing import TimingLog
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Summarizes the per-phase timings of MPVaspDrone assimilations: percentiles of
+each phase, grouped by task_type. The timings are read from the JSON-lines
+files written by the drone's timing_log, or from analysis.timing of the task
+docs (--from_db, for tasks inserted with record_timing).
+'''
+
+PERCENTILES = [50, 90, 99]
+
+
+def collect(entries):
+    """
+    :param entries: iterable of dicts with 'task_type', 'total' and 'phases'
+    :return: {task_type: {phase: [seconds, ...]}}, with the total as the
+        "total" phase
+    """
+    data = defaultdict(lambda: defaultdict(list))
+    for e in entries:
+        times = data[e.get('task_type') or 'unknown']
+        times['total'].append(e['total'])
+        for phase, t in e.get('phases', {}).items():
+            times[phase].append(t)
+    return data
+
+
+def get_report(data, percentiles=PERCENTILES):
+    lines = []
+    for task_type in sorted(data):
+        phases = data[task_type]
+        lines.append('{} (n={})'.format(task_type, len(phases['total'])))
+        lines.append('    {:<20}{:>8}'.format('phase', 'n') +
+                     ''.join('{:>10}'.format('p{}'.format(p)) for p in percentiles) +
+                     '{:>10}'.format('max'))
+        # slowest phases (by median) first
+        for phase in sorted(phases, key=lambda p: -np.median(phases[p])):
+            t = np.array(phases[phase])
+            lines.append('    {:<20}{:>8}'.format(phase, len(t)) +
+                         ''.join('{:>10.2f}'.format(np.percentile(t, p)) for p in percentiles) +
+                         '{:>10.2f}'.format(t.max()))
+    return '\n'.join(lines)
+
+
+def entries_from_db(tasks, query=None):
+    q = dict(query or {})
+    q['analysis.timing'] = {'$exists': True}
+    for d in tasks.find(q, {'task_type': 1, 'analysis.timing': 1}):
+        e = dict(d['analysis']['timing'])
+        e['task_type'] = d.get('task_type')
+        yield e
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('logs', help='timing log files (JSON lines)', nargs='*')
+    parser.add_argument('--from_db', help='read analysis.timing from the tasks db instead', action='store_true')
+    parser.add_argument('--task_type', help='only this task_type', default=None)
+    parser.add_argument('--failed', help='include failed assimilations', action='store_true')
+    args = parser.parse_args()
+
+    if args.from_db:
+        from mpworks.db_utils.connections import get_db_creds, get_tasks_db
+        tasks = get_tasks_db()[get_db_creds()['collection']]
+        entries = list(entries_from_db(tasks, {'task_type': args.task_type} if args.task_type else None))
+    else:
+        entries = [e for log in args.logs for e in TimingLog(log).read()
+                   if (args.failed or not e.get('failed')) and
+                   (not args.task_type or e.get('task_type') == args.task_type)]
+    print get_report(collect(entries))
@@ -0,0 +1,137 @@
+from argparse import ArgumentParser
+import datetime
+from bson import ObjectId
+from mpworks.db_utils.connections import get_db_creds, get_tasks_db
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+Garbage-collects the GridFS blobs (DOS, band structures, trajectories) that no task refers
+to anymore, e.g. the ones orphaned when a task is reparsed and its DOS
+changed. Also removes chunks whose file document is gone (uploads that died
+halfway).
+
+Blobs younger than the grace period are always kept: a running drone puts
+its blobs before it upserts the task doc that refers to them. The same goes
+for blobs that a drone reused (see mpworks.db_utils.blobs.find_content())
+within the grace period, even if no task referred to them when the
+references were collected. The references are checked again right before
+each batch is removed.
+'''
+
+# GridFS collection -> field of the task docs that refers to it
+BLOB_REFS = {'dos_fs': 'calculations.dos_fs_id',
+             'band_structure_fs': 'calculations.band_structure_fs_id',
+             'trajectory_fs': 'calculations.output.ionic_steps_fs_id'}
+
+
+def _get_path_values(obj, keys):
+    # all values at the dotted path keys, descending into lists
+    if isinstance(obj, list):
+        for x in obj:
+            for v in _get_path_values(x, keys):
+                yield v
+    elif not keys:
+        yield obj
+    elif isinstance(obj, dict) and keys[0] in obj:
+        for v in _get_path_values(obj[keys[0]], keys[1:]):
+            yield v
+
+
+def get_referenced_ids(tasks, field):
+    ids = set()
+    for d in tasks.find({field: {'$exists': True}}, {field: 1}):
+        ids.update(v for v in _get_path_values(d, field.split('.')) if v)
+    return ids
+
+
+def _unused_since(cutoff):
+    # files put and last reused (if ever) before cutoff
+    return {'uploadDate': {'$lt': cutoff},
+            'metadata.last_used': {'$not': {'$gte': cutoff}}}
+
+
+def _delete_orphans(files, chunks, tasks, ref_field, file_ids, cutoff,
+                    batch_size=1000):
+    # returns the number of files removed
+    n = 0
+    for i in range(0, len(file_ids), batch_size):
+        batch = file_ids[i:i + batch_size]
+        # a task may have come to refer to some of them since the
+        # references were collected
+        refs = set(tasks.distinct(ref_field, {ref_field: {'$in': batch}}))
+        batch = [fid for fid in batch if fid not in refs]
+        # a drone that reuses a file stamps it before referring to it, so
+        # the file docs are only removed if still unused; the chunks go
+        # only for the file docs that are really gone
+        query = _unused_since(cutoff)
+        query['_id'] = {'$in': batch}
+        files.delete_many(query)
+        kept = set(f['_id'] for f in
+                   files.find({'_id': {'$in': batch}}, {'_id': 1}))
+        removed = [fid for fid in batch if fid not in kept]
+        chunks.delete_many({'files_id': {'$in': removed}})
+        n += len(removed)
+    return n
+
+
+def _delete_chunks(chunks, file_ids, batch_size=1000):
+    for i in range(0, len(file_ids), batch_size):
+        chunks.delete_many({'files_id': {'$in': file_ids[i:i + batch_size]}})
+
+
+def gc_blobs(db, tasks, fs_name, ref_field, grace_hours=24, dry_run=False):
+    """
+    :param db: the tasks database
+    :param tasks: the tasks collection
+    :param fs_name: the GridFS collection, e.g. "dos_fs"
+    :param ref_field: the field of the task docs that holds the blob ids
+    :param grace_hours: never remove blobs put or reused more recently
+    :param dry_run: only count what would be removed
+    :return: (number of unreferenced files (removed), number of dangling
+        chunk sets)
+    """
+    files = db['{}.files'.format(fs_name)]
+    chunks = db['{}.chunks'.format(fs_name)]
+    cutoff = datetime.datetime.utcnow() - datetime.timedelta(hours=grace_hours)
+
+    refs = get_referenced_ids(tasks, ref_field)
+    orphans = [f['_id'] for f in files.find(_unused_since(cutoff), {'_id': 1})
+               if f['_id'] not in refs]
+
+    file_ids = set(f['_id'] for f in files.find({}, {'_id': 1}))
+    dangling = []
+    for g in chunks.aggregate([{'$group': {'_id': '$files_id'}}],
+                              allowDiskUse=True):
+        fid = g['_id']
+        if fid not in file_ids and isinstance(fid, ObjectId) and \
+                fid.generation_time.replace(tzinfo=None) < cutoff:
+            dangling.append(fid)
+
+    print '{}: {} referenced, {} unreferenced files, {} dangling chunk sets'\
+        .format(fs_name, len(refs), len(orphans), len(dangling))
+    if not dry_run:
+        n = _delete_orphans(files, chunks, tasks, ref_field, orphans, cutoff)
+        if n < len(orphans):
+            print '{}: kept {} files that came back into use'.format(
+                fs_name, len(orphans) - n)
+        _delete_chunks(chunks, dangling)
+        return n, len(dangling)
+    return len(orphans), len(dangling)
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser()
+    parser.add_argument('--grace_hours', help='keep blobs younger than this', type=int, default=24)
+    parser.add_argument('--dry_run', help='only report what would be removed', action='store_true')
+    args = parser.parse_args()
+
+    tdb = get_tasks_db()
+    tasks = tdb[get_db_creds()['collection']]
+    for fs_name, ref_field in BLOB_REFS.items():
+        gc_blobs(tdb, tasks, fs_name, ref_field, args.grace_hours, args.dry_run)
@@ -1,11 +1,10 @@
 from argparse import ArgumentParser
 import json
 import logging
-import os
 import sys
-from pymongo import MongoClient
-from fireworks.core.launchpad import LaunchPad
-from mpworks.drones.mp_vaspdrone import MPVaspDrone
+from mpworks.db_utils.connections import get_db_creds, get_tasks_db, get_launchpad
+from mpworks.drones.compatibility import COMPATIBILITY_FIELDS, get_is_compatible_batch
+from mpworks.drones.mp_vaspdrone import MPVaspDrone, PARTIAL_FIELDS
 import multiprocessing
 import traceback
 
@@ -21,7 +20,10 @@ This script re-runs the MPVaspDrone over all the *new-style* tasks. It can be us
 
 A few notes:
 * The old-style tasks will be unaffected by this script
-* The dos_fs and band_structure_fs collections should be completely deleted before running this script over the database.
+* Dirs whose files (and the drone version) did not change since their task doc was made are skipped, see MPVaspDrone.is_unchanged(). Use --force to reparse them anyway.
+* DOS and band structure blobs are content-addressed, so unchanged ones are reused. Run gc_blobs.py afterwards to remove the ones that were replaced.
+* With --fields, only the named fields (e.g. run_stats, analysis.bandgap, analysis.errors_MP) are recomputed from the dirs and $set in the task docs; the rest of the docs is left alone.
+* With --compatibility_only, only the is_compatible key is recomputed from the task docs (e.g. after a change of MaterialsProjectCompatibility); no dir is reparsed. min and max are then the numbers of the live task_ids mp-<min> to mp-<max>, not task_id_deprecated.
 
 Note - AJ has not run this code since its inception in May 2013. Changes may be needed.
 '''
@@ -30,21 +32,27 @@ class TaskBuilder():
 
     @classmethod
     def setup(cls):
-        db_dir = os.environ['DB_LOC']
-        db_path = os.path.join(db_dir, 'tasks_db.json')
-        with open(db_path) as f2:
-            db_creds = json.load(f2)
-            mc2 = MongoClient(db_creds['host'], db_creds['port'])
-            db2 = mc2[db_creds['database']]
-            db2.authenticate(db_creds['admin_user'], db_creds['admin_password'])
-
-            cls.tasks = db2['tasks']
-            cls.host = db_creds['host']
-            cls.port = db_creds['port']
-            cls.database = db_creds['database']
-            cls.collection = db_creds['collection']
-            cls.admin_user = db_creds['admin_user']
-            cls.admin_password = db_creds['admin_password']
+        db_creds = get_db_creds('tasks_db.json')
+        cls.tasks = get_tasks_db()['tasks']
+        cls.host = db_creds['host']
+        cls.port = db_creds['port']
+        cls.database = db_creds['database']
+        cls.collection = db_creds['collection']
+        cls.admin_user = db_creds['admin_user']
+        cls.admin_password = db_creds['admin_password']
+
+    def get_drone(self, parse_dos, bulk_batch_size=None, fields=None):
+        return MPVaspDrone(
+            host=self.host, port=self.port,
+            database=self.database, user=self.admin_user,
+            password=self.admin_password,
+            collection=self.collection, parse_dos=parse_dos,
+            additional_fields={},
+            update_duplicates=True, bulk_batch_size=bulk_batch_size,
+            partial_fields=fields, record_fingerprint=True)
+
+    def restore_snl_info(self, t_id, prev_info):
+        self.tasks.update({"task_id": t_id}, {"$set": {"snl_final": prev_info['snl_final'], "snlgroup_id_final": prev_info['snlgroup_id_final'], "snlgroup_changed": prev_info['snlgroup_changed']}})
 
     def process_task(self, data):
 
@@ -52,17 +60,10 @@ class TaskBuilder():
             dir_name = data[0]
             parse_dos = data[1]
             prev_info = self.tasks.find_one({'dir_name_full': dir_name}, {'task_type': 1, 'snl_final': 1, 'snlgroup_id_final': 1, 'snlgroup_changed': 1})
-            drone = MPVaspDrone(
-                host=self.host, port=self.port,
-                database=self.database, user=self.admin_user,
-                password=self.admin_password,
-                collection=self.collection, parse_dos=parse_dos,
-                additional_fields={},
-                update_duplicates=True)
-            t_id, d = drone.assimilate(dir_name, launches_coll=LaunchPad.auto_load().launches)
+            drone = self.get_drone(parse_dos)
+            t_id, d = drone.assimilate(dir_name, launches_coll=get_launchpad().launches)
 
-
-            self.tasks.update({"task_id": t_id}, {"$set": {"snl_final": prev_info['snl_final'], "snlgroup_id_final": prev_info['snlgroup_id_final'], "snlgroup_changed": prev_info['snlgroup_changed']}})
+            self.restore_snl_info(t_id, prev_info)
             print 'FINISHED', t_id
         except:
             print '-----'
@@ -70,6 +71,69 @@ class TaskBuilder():
             traceback.print_exc()
             print '-----'
 
+    def process_batch(self, prev_infos, parse_dos, nproc=None, bulk_batch_size=100, force=False, fields=None):
+        """
+        Reparse many tasks over a process pool.
+
+        :param prev_infos: {dir_name_full: previous task doc (with the snl_final info and fingerprint)}
+        :param parse_dos: whether to parse the DOS (i.e., Uniform runs)
+        :param bulk_batch_size: number of task docs per bulk write (None to write one by one)
+        :param force: also reparse the dirs that did not change
+        :param fields: only recompute and $set these fields of the task docs
+            (see mp_vaspdrone.PARTIAL_FIELDS); all dirs are then reparsed
+        :return: list of {'path': ..., 'error': ...} for the dirs that failed
+        """
+        drone = self.get_drone(parse_dos, bulk_batch_size, fields)
+        dir_names = []
+        for dir_name in sorted(prev_infos):
+            if not force and not fields and drone.is_unchanged(dir_name, prev_infos[dir_name].get('fingerprint')):
+                print 'UNCHANGED', prev_infos[dir_name]['task_id']
+            else:
+                dir_names.append(dir_name)
+        failures = []
+        for dir_name, t_id, error in drone.iter_assimilate(dir_names, nproc=nproc):
+            if error:
+                print 'ENCOUNTERED AN EXCEPTION!!!', dir_name
+                print error
+                failures.append({'path': dir_name, 'error': error})
+            else:
+                if not fields:
+                    self.restore_snl_info(t_id, prev_infos[dir_name])
+                print 'FINISHED', t_id
+        return failures
+
+    def update_compatibility(self, q):
+        """
+        Recompute is_compatible for the tasks matching q, without reparsing.
+
+        :return: {True: n_tasks, False: n_tasks, None: n_tasks}
+        """
+        docs = self.tasks.find(q, dict.fromkeys(COMPATIBILITY_FIELDS, 1))
+        by_value = {True: [], False: [], None: []}
+        for t_id, value in get_is_compatible_batch(docs).items():
+            by_value[value].append(t_id)
+        for value, t_ids in by_value.items():
+            if t_ids:
+                self.tasks.update_many({'task_id': {'$in': t_ids}},
+                                       {'$set': {'is_compatible': value}})
+        return dict((value, len(t_ids)) for value, t_ids in by_value.items())
+
+    def update_compatibility_range(self, min_id, max_id, chunk_size=1000):
+        """
+        update_compatibility() over the live (not deprecated) tasks mp-min_id
+        to mp-max_id. task_ids are strings, so they are queried by value
+        (through the task_id index), chunk_size at a time.
+
+        :return: {True: n_tasks, False: n_tasks, None: n_tasks}
+        """
+        counts = {True: 0, False: 0, None: 0}
+        for start in range(min_id, max_id + 1, chunk_size):
+            t_ids = ['mp-{}'.format(i) for i in range(start, min(start + chunk_size, max_id + 1))]
+            q = {'task_id': {'$in': t_ids}, 'is_deprecated': {'$ne': True}}
+            for value, n in self.update_compatibility(q).items():
+                counts[value] += n
+        return counts
+
 
 def _analyze(data):
     b = TaskBuilder()
@@ -85,31 +149,41 @@ if __name__ == '__main__':
     sh.setLevel(getattr(logging, 'INFO'))
     logger.addHandler(sh)
 
-    finished_tasks = []
-    module_dir = os.path.dirname(os.path.abspath(__file__))
-    if os.path.exists(os.path.join(module_dir, 'finished_tasks.txt')):
-        with open(os.path.join(module_dir, 'finished_tasks.txt')) as f:
-            for line in f:
-                task = line.split()[1].strip()
-                finished_tasks.append(task)
-
     o = TaskBuilder()
     o.setup()
     tasks = TaskBuilder.tasks
-    m_data = []
     # q = {'submission_id': {'$exists': False}}  # these are all new-style tasks
     #q = {"task_type":{"$regex":"band structure"}, "state":"successful", "calculations.0.band_structure_fs_id":{"$exists":False}}
 
     parser = ArgumentParser()
     parser.add_argument('min', help='min', type=int)
     parser.add_argument('max', help='max', type=int)
+    parser.add_argument('--nproc', help='number of worker processes (default: all CPUs)', type=int, default=None)
+    parser.add_argument('--batch_size', help='number of task docs per bulk write', type=int, default=100)
+    parser.add_argument('--force', help='reparse all dirs, even those that did not change since they were parsed', action='store_true')
+    parser.add_argument('--manifest', help='write failed dirs and their tracebacks to this JSON file', default='reparse_failures.json')
+    parser.add_argument('--fields', help='only reparse these fields of the task docs, one of: {}'.format(', '.join(sorted(PARTIAL_FIELDS))), nargs='+', default=None)
+    parser.add_argument('--compatibility_only', help='only recompute is_compatible from the docs of the live tasks mp-<min> to mp-<max>', action='store_true')
     args = parser.parse_args()
+
+    if args.compatibility_only:
+        # the live tasks mp-<min> to mp-<max>
+        counts = o.update_compatibility_range(args.min, args.max)
+        print 'is_compatible: {} True, {} False, {} undetermined'.format(counts[True], counts[False], counts[None])
+        sys.exit()
+
     q = {"task_id_deprecated": {"$lte": args.max, "$gte":args.min}, "is_deprecated": True}
 
-    for d in tasks.find(q, {'dir_name_full': 1, 'task_type': 1, 'task_id': 1}, timeout=False):
-        if d['task_id'] in finished_tasks:
-            print 'DUPLICATE', d['task_id']
-        else:
-            o.process_task((d['dir_name_full'], 'Uniform' in d['task_type']))
-            # m_data.append((d['dir_name_full'], 'Uniform' in d['task_type']))
-    print 'DONE'
\ No newline at end of file
+    # Uniform runs need the DOS, so they go through a separately-configured drone
+    m_data = {True: {}, False: {}}
+    for d in tasks.find(q, {'dir_name_full': 1, 'task_type': 1, 'task_id': 1, 'snl_final': 1, 'snlgroup_id_final': 1, 'snlgroup_changed': 1, 'fingerprint': 1}, timeout=False):
+        m_data['Uniform' in d['task_type']][d['dir_name_full']] = d
+
+    failures = []
+    for parse_dos in [False, True]:
+        if m_data[parse_dos]:
+            failures.extend(o.process_batch(m_data[parse_dos], parse_dos, nproc=args.nproc, bulk_batch_size=args.batch_size, force=args.force, fields=args.fields))
+
+    with open(args.manifest, 'w') as f:
+        json.dump(failures, f, indent=4)
+    print 'DONE, {} failures written to {}'.format(len(failures), args.manifest)
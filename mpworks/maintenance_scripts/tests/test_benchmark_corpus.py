@@ -0,0 +1,40 @@
+import os
+import shutil
+import tempfile
+from unittest import TestCase
+
+from mpworks.maintenance_scripts.benchmark_corpus import load_corpus, \
+    make_corpus
+
+
+class TestBenchmarkCorpus(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_make_corpus(self):
+        make_corpus(self.tmp, runs=['static', 'relax_2x'])
+        corpus = load_corpus(self.tmp)
+        self.assertEqual([l['name'] for l in corpus['launches']],
+                         ['static', 'relax_2x'])
+        names = os.listdir(corpus['launches'][0]['launch_dir'])
+        for f in ['FW.json.gz', 'INCAR.gz', 'vasprun.xml.gz', 'OUTCAR.gz']:
+            self.assertIn(f, names)
+        names = os.listdir(corpus['launches'][1]['launch_dir'])
+        for f in ['FW.json.gz', 'vasprun.xml.relax1.gz',
+                  'vasprun.xml.relax2.gz', 'OUTCAR.relax2.gz']:
+            self.assertIn(f, names)
+
+    def test_assimilate(self):
+        # what make_corpus() writes is a launch dir the drone can parse
+        from mpworks.drones.mp_vaspdrone import MPVaspDrone
+        corpus = make_corpus(self.tmp, runs=['static'])
+        drone = MPVaspDrone(host='localhost', port=27017,
+                            database='drone_benchmark', collection='tasks',
+                            simulate_mode=True)
+        t_id, d = drone.assimilate(corpus['launches'][0]['launch_dir'])
+        self.assertEqual(d['state'], 'successful')
+        self.assertEqual(d['pretty_formula'], 'Si')
+        self.assertEqual(len(d['calculations']), 1)
@@ -0,0 +1,147 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+import traceback
+from pymongo import DESCENDING
+from fireworks.core.fworker import FWorker
+from fireworks.core.rocket import Rocket
+from fireworks.utilities.fw_utilities import create_datestamp_dir
+from mpworks.db_utils.connections import get_launchpad
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+A resident service that runs the DB insertion Fireworks (VaspToDBTask,
+task_type "VASP db insertion") as soon as they are READY, instead of each of
+them waiting in the batch queue for its own QA_DB job.
+
+The service lists a batch of READY insertion Fireworks (highest priority
+first) and hands them to a pool of long-lived worker processes. Each worker
+runs a normal FireWorks Rocket in its own launch dir under launch_root, so
+the LaunchPad applies the FWAction (update_spec, detours, defuse_children)
+exactly as for a queue launch; the workers keep their imports, db
+connections and LaunchPad (see mpworks.db_utils.connections) from one
+Firework to the next.
+
+Checkout is atomic, so the service can run next to queue launches (and
+other service instances) that pick up the same Fireworks. To take
+insertions off the queue entirely, give the queue FWorkers a query that
+excludes {"spec.task_type": "VASP db insertion"}.
+'''
+
+DB_INSERTION_QUERY = {'spec.task_type': 'VASP db insertion'}
+
+logger = logging.getLogger(__name__)
+
+# set once per worker process by the pool initializer
+_fworker = None
+_launch_root = None
+
+
+def _init_worker(fworker, launch_root):
+    global _fworker, _launch_root
+    _fworker = fworker
+    _launch_root = launch_root
+
+
+def _run_firework(fw_id):
+    # runs in a worker process; returns (fw_id, ran, error)
+    launch_dir = create_datestamp_dir(_launch_root, logger, prefix='launcher_')
+    os.chdir(launch_dir)
+    try:
+        ran = Rocket(get_launchpad(), _fworker, fw_id).run()
+        return fw_id, ran, None
+    except Exception:
+        return fw_id, False, traceback.format_exc()
+    finally:
+        os.chdir(_launch_root)
+        if not os.listdir(launch_dir):
+            # someone else checked out the Firework first
+            shutil.rmtree(launch_dir, ignore_errors=True)
+
+
+class DBInsertionService():
+
+    def __init__(self, launchpad, launch_root, nproc=None, batch_size=None,
+                 fworker_name='db_insertion_service'):
+        """
+        :param launchpad: the LaunchPad to find Fireworks in; the workers
+            use LaunchPad.auto_load(), which should be the same one
+        :param launch_root: dir under which the launch dirs are made
+        :param nproc: number of worker processes (default: all CPUs)
+        :param batch_size: number of Fireworks listed per round (default:
+            4 per worker)
+        """
+        self.launchpad = launchpad
+        self.launch_root = os.path.abspath(launch_root)
+        self.nproc = nproc if nproc else multiprocessing.cpu_count()
+        self.batch_size = batch_size if batch_size else 4 * self.nproc
+        self.fworker = FWorker(name=fworker_name, query=DB_INSERTION_QUERY)
+        self._pool = None
+
+    @classmethod
+    def auto_load(cls, launch_root, nproc=None, batch_size=None):
+        return DBInsertionService(get_launchpad(), launch_root, nproc,
+                                  batch_size)
+
+    def get_ready_fw_ids(self):
+        query = dict(DB_INSERTION_QUERY)
+        query['state'] = 'READY'
+        return self.launchpad.get_fw_ids(
+            query, sort=[('spec._priority', DESCENDING)],
+            limit=self.batch_size)
+
+    def run_batch(self):
+        """
+        Run one batch of READY insertion Fireworks over the worker pool.
+
+        :return: number of Fireworks run by this service (not counting the
+            ones that were checked out by someone else in the meantime)
+        """
+        fw_ids = self.get_ready_fw_ids()
+        if not fw_ids:
+            return 0
+        if self._pool is None:
+            self._pool = multiprocessing.Pool(
+                self.nproc, initializer=_init_worker,
+                initargs=(self.fworker, self.launch_root))
+        n = 0
+        for fw_id, ran, error in self._pool.imap_unordered(_run_firework,
+                                                           fw_ids):
+            if error:
+                print 'ERROR running fw_id', fw_id
+                print error
+            elif ran:
+                print 'RAN fw_id', fw_id
+                n += 1
+        return n
+
+    def run(self, sleep_time=None, infinite=False):
+        sleep_time = sleep_time if sleep_time else 30
+        if not os.path.exists(self.launch_root):
+            os.makedirs(self.launch_root)
+        try:
+            while True:
+                n = self.run_batch()
+                if n:
+                    # there may be more right away
+                    continue
+                if not infinite:
+                    break
+                print 'sleeping', sleep_time
+                time.sleep(sleep_time)
+        finally:
+            self.close()
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.close()
+            self._pool.join()
+            self._pool = None
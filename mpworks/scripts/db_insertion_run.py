@@ -0,0 +1,32 @@
+from mpworks.processors.db_insertion_service import DBInsertionService
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+"""
+A runnable script for the DB insertion service
+"""
+
+from argparse import ArgumentParser
+
+
+def go_db_insertion():
+    m_description = 'This program runs the DB insertion Fireworks (VaspToDBTask) as soon as they are READY, with a pool of resident worker processes, instead of one queue job per insertion'
+
+    parser = ArgumentParser(description=m_description)
+    parser.add_argument('launch_root', help='directory in which the launch dirs are created')
+    parser.add_argument('--nproc', help='number of worker processes (default: all CPUs)', default=None, type=int)
+    parser.add_argument('--batch_size', help='number of Fireworks to list at a time', default=None, type=int)
+    parser.add_argument('--sleep', help='sleep time between loops', default=None, type=int)
+    parser.add_argument('--infinite', help='loop infinite times', action='store_true')
+    args = parser.parse_args()
+
+    service = DBInsertionService.auto_load(args.launch_root, args.nproc, args.batch_size)
+    service.run(args.sleep, args.infinite)
+
+if __name__ == '__main__':
+    go_db_insertion()
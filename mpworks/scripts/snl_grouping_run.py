@@ -0,0 +1,36 @@
+from mpworks.db_utils.connections import get_db_creds, get_launchpad, \
+    get_tasks_db
+from mpworks.snl_utils.snl_mongo import SNLMongoAdapter
+from mpworks.snl_utils.snl_queue import SNLQueue, SNLGroupingWorker
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+"""
+A runnable script for the SNL grouping worker
+"""
+
+from argparse import ArgumentParser
+
+
+def go_snl_grouping():
+    m_description = 'This program adds and groups the SNLs of relaxed structures that were queued during DB insertion (defer_snl), and backfills snl_final, snlgroup_id_final and snlgroup_changed into their task docs, and the final mpsnl and snlgroup_id into the specs of the Fireworks waiting for them'
+
+    parser = ArgumentParser(description=m_description)
+    parser.add_argument('--sleep', help='sleep time between loops', default=None, type=int)
+    parser.add_argument('--infinite', help='loop infinite times', action='store_true')
+    args = parser.parse_args()
+
+    # the collection the drone inserts the task docs into
+    tasks = get_tasks_db()[get_db_creds('tasks_db.json')['collection']]
+    sma = SNLMongoAdapter.auto_load()
+    worker = SNLGroupingWorker(SNLQueue(sma.database), sma, tasks,
+                               get_launchpad().fireworks)
+    worker.run(args.sleep, args.infinite)
+
+if __name__ == '__main__':
+    go_snl_grouping()
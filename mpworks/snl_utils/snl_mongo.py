@@ -2,8 +2,10 @@ import time
 import os
 import traceback
 import datetime
-from pymongo import MongoClient, DESCENDING
+from pymongo import DESCENDING
 from fireworks.utilities.fw_serializers import FWSerializable
+from mpworks.db_utils.connections import get_database
+from mpworks.db_utils.id_allocator import get_allocator, discard_blocks
 from mpworks.snl_utils.mpsnl import MPStructureNL, SNLGroup
 from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
 
@@ -21,17 +23,21 @@ SPACEGROUP_TOLERANCE = 0.1  # as suggested by Shyue, 6/19/2012
 
 class SNLMongoAdapter(FWSerializable):
     def __init__(self, host='localhost', port=27017, db='snl', username=None,
-                 password=None):
+                 password=None, id_block_size=1):
+        """
+        :param id_block_size: number of SNL (and snlgroup) ids reserved per
+            round trip to the id_assigner; 1 keeps them strictly sequential
+        """
         self.host = host
         self.port = port
         self.db = db
         self.username = username
         self.password = password
+        self.id_block_size = id_block_size
 
-        self.connection = MongoClient(host, port, j=False)
-        self.database = self.connection[db]
-        if self.username:
-            self.database.authenticate(username, password)
+        self.database = get_database(host, port, db, username, password,
+                                     j=False)
+        self.connection = self.database.client
 
         self.snl = self.database.snl
         self.snlgroups = self.database.snlgroups
@@ -68,17 +74,15 @@ class SNLMongoAdapter(FWSerializable):
         self.snlgroups.ensure_index('canonical_snl.about._icsd.icsd_id')
 
     def _get_next_snl_id(self):
-        snl_id = self.id_assigner.find_and_modify(
-            query={}, update={'$inc': {'next_snl_id': 1}})['next_snl_id']
-        return snl_id
+        return get_allocator(self.id_assigner, 'next_snl_id',
+                             block_size=self.id_block_size).next_id()
 
     def _get_next_snlgroup_id(self):
-        snlgroup_id = self.id_assigner.find_and_modify(
-            query={},
-            update={'$inc': {'next_snlgroup_id': 1}})['next_snlgroup_id']
-        return snlgroup_id
+        return get_allocator(self.id_assigner, 'next_snlgroup_id',
+                             block_size=self.id_block_size).next_id()
 
     def restart_id_assigner_at(self, next_snl_id, next_snlgroup_id):
+        discard_blocks(self.id_assigner)
         self.id_assigner.remove()
         self.id_assigner.insert(
             {"next_snl_id": next_snl_id, "next_snlgroup_id": next_snlgroup_id})
@@ -191,12 +195,13 @@ class SNLMongoAdapter(FWSerializable):
         Note: usernames/passwords are exported as unencrypted Strings!
         """
         return {'host': self.host, 'port': self.port, 'db': self.db,
-                'username': self.username, 'password': self.password}
+                'username': self.username, 'password': self.password,
+                'id_block_size': self.id_block_size}
 
     @classmethod
     def from_dict(cls, d):
         return SNLMongoAdapter(d['host'], d['port'], d['db'], d['username'],
-                               d['password'])
+                               d['password'], d.get('id_block_size', 1))
 
     @classmethod
     def auto_load(cls):
@@ -0,0 +1,228 @@
+import datetime
+import time
+import traceback
+from pymongo import ASCENDING, ReturnDocument
+from pymatgen.matproj.snl import StructureNL
+from mpworks.firetasks.task_refs import SNL_PENDING_KEY
+from mpworks.snl_utils.snl_mongo import SNLMongoAdapter
+
+__author__ = 'Anubhav Jain'
+__copyright__ = 'Copyright 2013, The Materials Project'
+__version__ = '0.1'
+__maintainer__ = 'Anubhav Jain'
+__email__ = 'ajain@lbl.gov'
+__date__ = 'Oct 18, 2026'
+
+'''
+A durable queue (the snl_queue collection of the SNL db) of the SNLs of
+relaxed structures that still have to be added and grouped.
+
+With defer_snl, MPVaspDrone enqueues the new SNL of a relaxation instead of
+calling SNLMongoAdapter.add_snl() itself, and marks the task doc with
+"snl_final_pending". A grouping worker (go_snl_grouping) then adds the SNLs
+one at a time and backfills snl_final, snlgroup_id_final and
+snlgroup_changed into the task docs. Whatever needs the final snlgroup_id of
+a task (e.g. the children of its VaspToDBTask, see
+mpworks.firetasks.task_refs.resolve_snl) waits on its own item with wait(),
+not on the SNL db lock. Given the Fireworks collection, the worker also
+writes the final mpsnl and snlgroup_id into the specs of the Fireworks that
+were handed the SNL while it was pending (backfill_fws()), so that their
+stored snlgroup_id (the one the dupefinders match on) is the final one.
+
+An item goes QUEUED -> RUNNING -> GROUPED (the SNL is in, the result is
+stored in the item) -> DONE (the task doc is backfilled). Items are keyed by
+task_id, so enqueueing a task twice does nothing; a RUNNING item whose
+worker died is taken up again after stale_seconds.
+'''
+
+
+class SNLQueue():
+
+    def __init__(self, database, collection='snl_queue', stale_seconds=3600,
+                 max_tries=3):
+        """
+        :param database: the SNL database
+        :param stale_seconds: a RUNNING item not updated for this long is
+            considered abandoned and claimed again
+        :param max_tries: items that failed this many times are set to ERROR
+        """
+        self.items = database[collection]
+        self.stale_seconds = stale_seconds
+        self.max_tries = max_tries
+        self.items.create_index([('state', ASCENDING),
+                                 ('created_at', ASCENDING)])
+
+    @classmethod
+    def auto_load(cls):
+        return SNLQueue(SNLMongoAdapter.auto_load().database)
+
+    def enqueue(self, task_id, snl, snlgroup_guess=None):
+        """
+        :param task_id: the task whose snl_final is to be backfilled
+        :param snl: the new StructureNL
+        :param snlgroup_guess: passed on to add_snl()
+        """
+        now = datetime.datetime.utcnow()
+        self.items.update_one(
+            {'_id': task_id},
+            {'$setOnInsert': {'task_id': task_id, 'snl': snl.as_dict(),
+                              'snlgroup_guess': snlgroup_guess,
+                              'state': 'QUEUED', 'n_tries': 0,
+                              'created_at': now, 'updated_at': now}},
+            upsert=True)
+
+    def claim(self):
+        """
+        :return: the oldest QUEUED (or abandoned RUNNING) item, now RUNNING,
+            or None
+        """
+        now = datetime.datetime.utcnow()
+        stale = now - datetime.timedelta(seconds=self.stale_seconds)
+        return self.items.find_one_and_update(
+            {'$or': [{'state': 'QUEUED'},
+                     {'state': 'RUNNING', 'updated_at': {'$lt': stale}}]},
+            {'$set': {'state': 'RUNNING', 'updated_at': now},
+             '$inc': {'n_tries': 1}},
+            sort=[('created_at', ASCENDING)],
+            return_document=ReturnDocument.AFTER)
+
+    def set_result(self, item, result):
+        self._set_state(item, 'GROUPED', result=result)
+
+    def set_error(self, item, error):
+        state = 'ERROR' if item['n_tries'] >= self.max_tries else 'QUEUED'
+        self._set_state(item, state, error=error)
+
+    def _set_state(self, item, state, **fields):
+        fields.update({'state': state,
+                       'updated_at': datetime.datetime.utcnow()})
+        self.items.update_one({'_id': item['_id']}, {'$set': fields})
+
+    def backfill(self, tasks, item):
+        """
+        Write the result of a GROUPED item into its task doc.
+
+        :return: True if the task doc was found (the item is then DONE). It
+            may not be written yet (e.g. buffered in a bulk writer); the
+            item then stays GROUPED and is retried later.
+        """
+        updates = dict(item['result'])
+        updates['snl_final_pending'] = False
+        r = tasks.update_one({'task_id': item['task_id']}, {'$set': updates})
+        if r.matched_count:
+            self._set_state(item, 'DONE')
+        return bool(r.matched_count)
+
+    def get_result(self, task_id):
+        """
+        :return: the result of the SNL of a task if it is grouped, else None.
+            Never waits.
+        """
+        item = self.items.find_one(
+            {'_id': task_id, 'state': {'$in': ['GROUPED', 'DONE']}},
+            {'result': 1})
+        return item['result'] if item else None
+
+    def backfill_fws(self, fireworks, task_id, result):
+        """
+        Write the result of the SNL of a task into the specs of the
+        Fireworks that are still marked as waiting for it.
+
+        :param fireworks: the fireworks collection of the LaunchPad
+        :return: the number of Fireworks updated
+        """
+        r = fireworks.update_many(
+            {'spec.' + SNL_PENDING_KEY: task_id},
+            {'$set': {'spec.mpsnl': result['snl_final'],
+                      'spec.snlgroup_id': result['snlgroup_id_final']},
+             '$unset': {'spec.' + SNL_PENDING_KEY: ''}})
+        return r.modified_count
+
+    def wait(self, task_id, timeout=3600, poll_interval=5):
+        """
+        Wait until the SNL of a task is grouped.
+
+        :return: the result, i.e. {'snl_final': ..., 'snlgroup_id_final':
+            ..., 'snlgroup_changed': ...}
+        """
+        t0 = time.time()
+        while True:
+            item = self.items.find_one({'_id': task_id},
+                                       {'state': 1, 'result': 1, 'error': 1})
+            if item is None:
+                raise ValueError('No SNL queued for task {}'.format(task_id))
+            if item['state'] in ('GROUPED', 'DONE'):
+                return item['result']
+            if item['state'] == 'ERROR':
+                raise ValueError('Grouping the SNL of task {} failed:\n{}'
+                                 .format(task_id, item.get('error')))
+            if time.time() - t0 > timeout:
+                raise ValueError('Timed out waiting for the SNL of task {}'
+                                 .format(task_id))
+            time.sleep(poll_interval)
+
+
+class SNLGroupingWorker():
+    # adds and groups the queued SNLs, then backfills the task docs
+
+    def __init__(self, queue, sma, tasks, fireworks=None):
+        """
+        :param queue: SNLQueue
+        :param sma: SNLMongoAdapter
+        :param tasks: the tasks collection to backfill
+        :param fireworks: the fireworks collection of the LaunchPad, to
+            backfill the specs of the Fireworks waiting for an SNL
+        """
+        self.queue = queue
+        self.sma = sma
+        self.tasks = tasks
+        self.fireworks = fireworks
+        if fireworks is not None:
+            fireworks.create_index('spec.' + SNL_PENDING_KEY, sparse=True)
+
+    def process_item(self, item):
+        try:
+            snl = StructureNL.from_dict(item['snl'])
+            mpsnl, snlgroup_id, spec_group = self.sma.add_snl(
+                snl, snlgroup_guess=item['snlgroup_guess'])
+        except:
+            traceback.print_exc()
+            self.queue.set_error(item, traceback.format_exc())
+            return
+        item['result'] = {'snl_final': mpsnl.as_dict(),
+                          'snlgroup_id_final': snlgroup_id,
+                          'snlgroup_changed':
+                              item['snlgroup_guess'] != snlgroup_id}
+        self.queue.set_result(item, item['result'])
+        print 'GROUPED task {} into snlgroup {}'.format(item['task_id'], snlgroup_id)
+        self.queue.backfill(self.tasks, item)
+        if self.fireworks is not None:
+            self.queue.backfill_fws(self.fireworks, item['task_id'],
+                                    item['result'])
+
+    def backfill_grouped(self):
+        # task docs that were not there yet when their SNL was grouped
+        for item in self.queue.items.find({'state': 'GROUPED'}):
+            if self.queue.backfill(self.tasks, item):
+                print 'BACKFILLED task', item['task_id']
+        if self.fireworks is None:
+            return
+        # and Fireworks that were handed the SNL after it was grouped
+        for task_id in self.fireworks.distinct('spec.' + SNL_PENDING_KEY):
+            result = self.queue.get_result(task_id)
+            if result and self.queue.backfill_fws(self.fireworks, task_id,
+                                                  result):
+                print 'BACKFILLED Fireworks of task', task_id
+
+    def run(self, sleep_time=None, infinite=False):
+        sleep_time = sleep_time if sleep_time else 30
+        while True:
+            item = self.queue.claim()
+            if item:
+                self.process_item(item)
+                continue
+            self.backfill_grouped()
+            if not infinite:
+                break
+            print 'sleeping', sleep_time
+            time.sleep(sleep_time)
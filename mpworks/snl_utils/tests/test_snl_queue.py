@@ -0,0 +1,49 @@
+from unittest import TestCase
+
+import mongomock
+
+from mpworks.firetasks.task_refs import SNL_PENDING_KEY
+from mpworks.snl_utils.snl_queue import SNLGroupingWorker, SNLQueue
+
+
+class TestSNLQueue(TestCase):
+    def setUp(self):
+        self.db = mongomock.MongoClient().db
+        self.queue = SNLQueue(self.db)
+        self.fireworks = self.db.fireworks
+        self.result = {'snl_final': {'about': 'final'},
+                       'snlgroup_id_final': 7, 'snlgroup_changed': True}
+        self.queue.items.insert_many([
+            {'_id': 'mp-1', 'task_id': 'mp-1', 'state': 'DONE',
+             'result': self.result},
+            {'_id': 'mp-2', 'task_id': 'mp-2', 'state': 'QUEUED'}])
+        self.fireworks.insert_many([
+            {'fw_id': 1, 'spec': {'snlgroup_id': 3, 'mpsnl': {},
+                                  SNL_PENDING_KEY: 'mp-1'}},
+            {'fw_id': 2, 'spec': {'snlgroup_id': 4, SNL_PENDING_KEY: 'mp-2'}},
+            {'fw_id': 3, 'spec': {'snlgroup_id': 5}}])
+
+    def test_get_result(self):
+        self.assertEqual(self.queue.get_result('mp-1'), self.result)
+        self.assertIsNone(self.queue.get_result('mp-2'))
+        self.assertIsNone(self.queue.get_result('mp-3'))
+
+    def test_backfill_fws(self):
+        self.assertEqual(self.queue.backfill_fws(self.fireworks, 'mp-1',
+                                                 self.result), 1)
+        spec = self.fireworks.find_one({'fw_id': 1})['spec']
+        self.assertEqual(spec, {'snlgroup_id': 7,
+                                'mpsnl': {'about': 'final'}})
+
+    def test_worker_sweep(self):
+        worker = SNLGroupingWorker(self.queue, None, self.db.tasks,
+                                   self.fireworks)
+        worker.backfill_grouped()
+        specs = dict((fw['fw_id'], fw['spec'])
+                     for fw in self.fireworks.find())
+        self.assertEqual(specs[1]['snlgroup_id'], 7)
+        self.assertNotIn(SNL_PENDING_KEY, specs[1])
+        # still being grouped
+        self.assertEqual(specs[2], {'snlgroup_id': 4,
+                                    SNL_PENDING_KEY: 'mp-2'})
+        self.assertEqual(specs[3], {'snlgroup_id': 5})
@@ -2,7 +2,9 @@ import json
 import os
 import datetime
 
-from pymongo import MongoClient, DESCENDING
+from pymongo import DESCENDING
+from mpworks.db_utils.connections import get_database
+from mpworks.db_utils.id_allocator import get_allocator, discard_blocks
 from mpworks.snl_utils.mpsnl import MPStructureNL
 from mpworks.snl_utils.snl_mongo import SNLMongoAdapter
 from pymatgen import Composition
@@ -66,17 +68,21 @@ class SubmissionMongoAdapter(object):
     # This is the user interface to submissions
 
     def __init__(self, host='localhost', port=27017, db='snl', username=None,
-                 password=None):
+                 password=None, id_block_size=1):
+        """
+        :param id_block_size: number of submission ids reserved per round
+            trip to the id_assigner; 1 keeps them strictly sequential
+        """
         self.host = host
         self.port = port
         self.db = db
         self.username = username
         self.password = password
+        self.id_block_size = id_block_size
 
-        self.connection = MongoClient(host, port, j=False)
-        self.database = self.connection[db]
-        if self.username:
-            self.database.authenticate(username, password)
+        self.database = get_database(host, port, db, username, password,
+                                     j=False)
+        self.connection = self.database.client
 
         self.jobs = self.database.jobs
         self.id_assigner = self.database.id_assigner
@@ -93,11 +99,11 @@ class SubmissionMongoAdapter(object):
         self.jobs.ensure_index('submitter_email')
 
     def _get_next_submission_id(self):
-        return self.id_assigner.find_and_modify(
-            query={}, update={'$inc': {'next_submission_id': 1}})[
-                'next_submission_id']
+        return get_allocator(self.id_assigner, 'next_submission_id',
+                             block_size=self.id_block_size).next_id()
 
     def _restart_id_assigner_at(self, next_submission_id):
+        discard_blocks(self.id_assigner)
         self.id_assigner.remove()
         self.id_assigner.insert({"next_submission_id": next_submission_id})
 
@@ -161,7 +167,8 @@ class SubmissionMongoAdapter(object):
         """
         d = {'host': self.host, 'port': self.port, 'db': self.db,
              'username': self.username,
-             'password': self.password}
+             'password': self.password,
+             'id_block_size': self.id_block_size}
         return d
 
     def update_state(self, submission_id, state, state_details, task_dict):
@@ -170,7 +177,8 @@ class SubmissionMongoAdapter(object):
 
     @classmethod
     def from_dict(cls, d):
-        return cls(d['host'], d['port'], d['db'], d['username'], d['password'])
+        return cls(d['host'], d['port'], d['db'], d['username'], d['password'],
+                   d.get('id_block_size', 1))
 
     @classmethod
     def auto_load(cls):
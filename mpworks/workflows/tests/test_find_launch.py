@@ -0,0 +1,61 @@
+from unittest import TestCase
+
+import mongomock
+from pymongo import UpdateOne
+from pymongo.results import BulkWriteResult
+
+from mpworks.maintenance_scripts.backfill_launch_dir_block import \
+    backfill_launch_dir_block
+from mpworks.workflows.wf_utils import LAUNCH_DIR_BLOCK_KEY, find_launch, \
+    set_launch_dir_block
+
+SCRATCH = '/scratch/mp/block_2013-01-01-00-00-00-000000/launcher_1'
+GARDEN = '/project/garden/block_2013-01-01-00-00-00-000000/launcher_1'
+
+
+class RecordingLaunches(object):
+    # records the bulk writes instead of applying them (mongomock's
+    # bulk_write does not work with every pymongo)
+    def __init__(self, coll):
+        self.coll = coll
+        self.requests = []
+
+    def __getattr__(self, name):
+        return getattr(self.coll, name)
+
+    def bulk_write(self, requests, ordered=True):
+        self.requests.extend(requests)
+        return BulkWriteResult({'nModified': len(requests)}, True)
+
+
+class TestFindLaunch(TestCase):
+    def setUp(self):
+        self.launches = mongomock.MongoClient().db.launches
+        self.launches.insert_many([
+            {'launch_id': 1, 'fw_id': 7, 'launch_dir': SCRATCH,
+             'action': {'stored_data': {'kpath_name': 'fcc'}}},
+            {'launch_id': 2, 'fw_id': 7, 'launch_dir': SCRATCH + '0',
+             'action': {'stored_data': {'kpath_name': 'bcc'}}}])
+
+    def test_find_launch(self):
+        # not keyed yet: matched on launch_dir
+        l = find_launch(self.launches, 7, GARDEN, ['action.stored_data'])
+        self.assertEqual(l['action']['stored_data']['kpath_name'], 'fcc')
+        self.assertTrue(set_launch_dir_block(self.launches, 7, SCRATCH))
+        self.assertFalse(set_launch_dir_block(self.launches, 8, SCRATCH))
+        l = find_launch(self.launches, 7, GARDEN + '/', ['action.stored_data'])
+        self.assertEqual(l['action']['stored_data']['kpath_name'], 'fcc')
+        self.assertNotIn('launch_dir', l)
+        self.assertIsNone(find_launch(self.launches, 8, GARDEN))
+
+    def test_backfill(self):
+        set_launch_dir_block(self.launches, 7, SCRATCH)
+        launches = RecordingLaunches(self.launches)
+        self.assertEqual(backfill_launch_dir_block(launches), 1)
+        l = self.launches.find_one({'launch_id': 2})
+        self.assertEqual(launches.requests, [UpdateOne(
+            {'_id': l['_id']}, {'$set': {
+                LAUNCH_DIR_BLOCK_KEY:
+                    'block_2013-01-01-00-00-00-000000/launcher_10'}})])
+        self.assertIn('fw_id_1_{}_1'.format(LAUNCH_DIR_BLOCK_KEY),
+                      self.launches.index_information())
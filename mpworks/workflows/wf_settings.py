@@ -15,6 +15,11 @@ QA_CONTROL = {'nnodes': 1, 'nodes': 1, 'walltime': '00:30:00'}
 MOVE_TO_GARDEN_DEV = False
 MOVE_TO_GARDEN_PROD = False
 
+# VaspToDBTask hands the big parts of its results (analysis, output, vasp,
+# mpsnl) to the next Fireworks by task_id instead of copying them into their
+# specs; see mpworks.firetasks.task_refs
+COMPACT_UPDATE_SPEC = False
+
 GARDEN = '/project/projectdirs/matgen/garden'
 
 RUN_LOCS = [GARDEN, GARDEN + '/dev',
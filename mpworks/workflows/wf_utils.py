@@ -9,7 +9,8 @@ import traceback
 import subprocess
 
 import re
-from monty.os.path import zpath
+from mpworks.drones import launch_archive
+from mpworks.drones.dir_manifest import get_manifest
 from mpworks.workflows.wf_settings import RUN_LOCS, GARDEN
 
 
@@ -29,26 +30,13 @@ def j_decorate(m_dict):
     return m_dict
 
 
-def last_relax(filename):
-    # for old runs
+def last_relax(filename, manifest=None):
+    # for old runs. filename may be in an archived launch dir. Pass the
+    # DirManifest of its dir (or of the dir above relax1/relax2) when
+    # checking several files of the same dir, so it is only listed once
     m_dir = os.path.dirname(filename)
     m_file = os.path.basename(filename)
-
-    if os.path.exists(zpath(os.path.join(m_dir, 'relax2', m_file))):
-        return zpath(os.path.join(m_dir, 'relax2', m_file))
-
-    elif os.path.exists(zpath(filename)):
-        return zpath(filename)
-
-    relaxations = glob.glob('%s.relax*' % filename)
-    if relaxations:
-        return sorted(relaxations)[-1]
-
-    # backup for old runs
-    elif os.path.exists(zpath(os.path.join(m_dir, 'relax1', m_file))):
-        return zpath(os.path.join(m_dir, 'relax1', m_file))
-
-    return filename
+    return get_manifest(m_dir, manifest).last_relax(m_file)
 
 
 def orig(filename):
@@ -65,20 +53,74 @@ def get_block_part(m_dir):
     return m_dir
 
 
+# the launch field that holds the block-relative launch dir, by which
+# find_launch() looks launches up; set by the custodian task when its launch
+# finishes (and by backfill_launch_dir_block.py for older launches)
+LAUNCH_DIR_BLOCK_KEY = 'launch_dir_block'
+
+
+def get_launch_dir_block(launch_dir):
+    return get_block_part(launch_dir).rstrip('/')
+
+
+def set_launch_dir_block(launches_coll, fw_id, launch_dir):
+    """
+    Store the LAUNCH_DIR_BLOCK_KEY of the launch of fw_id that ran in
+    launch_dir (exactly as FireWorks recorded it).
+
+    :return: whether the launch was found
+    """
+    r = launches_coll.update_many(
+        {'fw_id': fw_id, 'launch_dir': launch_dir},
+        {'$set': {LAUNCH_DIR_BLOCK_KEY: get_launch_dir_block(launch_dir)}})
+    return bool(r.matched_count)
+
+
+def find_launch(launches_coll, fw_id, launch_dir, fields=None):
+    """
+    The launch of fw_id that ran in launch_dir, or None: an exact match on
+    (fw_id, LAUNCH_DIR_BLOCK_KEY), served by the index that
+    backfill_launch_dir_block.py creates. Launches without the key (not
+    backfilled yet) are matched on their launch_dir instead.
+
+    :param fields: the fields of the launch to return
+    """
+    block = get_launch_dir_block(launch_dir)
+    projection = dict.fromkeys(fields, 1) if fields else None
+    l = launches_coll.find_one({'fw_id': fw_id, LAUNCH_DIR_BLOCK_KEY: block},
+                               projection)
+    if l is not None:
+        return l
+    if projection:
+        projection['launch_dir'] = 1
+    for l in launches_coll.find({'fw_id': fw_id,
+                                 LAUNCH_DIR_BLOCK_KEY: {'$exists': False}},
+                                projection):
+        if l.get('launch_dir') and \
+                get_launch_dir_block(l['launch_dir']) == block:
+            return l
+    return None
+
+
 def get_loc(m_dir):
-    if os.path.exists(m_dir):
+    # archived launch dirs (see mpworks.drones.launch_archive) count as
+    # existing; their files are read through launch_archive
+    if launch_archive.exists(m_dir):
         return m_dir
     block_part = get_block_part(m_dir)
 
     for preamble in RUN_LOCS:
         new_loc = os.path.join(preamble, block_part)
-        if os.path.exists(new_loc):
+        if launch_archive.exists(new_loc):
             return new_loc
 
     raise ValueError('get_loc() -- dir does not exist!! Make sure your base directory is listed in RUN_LOCS of wf_settings.py')
 
 
 def move_to_garden(m_dir, prod=False):
+    if launch_archive.is_archived(m_dir):
+        # archived launch dirs stay where they were packed
+        return m_dir
     block_part = get_block_part(m_dir)
     garden_part = GARDEN if prod else GARDEN+'/dev'
     f_dir = os.path.join(garden_part, block_part)